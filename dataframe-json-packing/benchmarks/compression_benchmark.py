@@ -0,0 +1,72 @@
+"""
+Measure how much gzip and zstd shrink packed tables, and what that costs, to pick compression levels for the
+REST service and client.
+
+For each body format (packed JSON and Arrow) and encoding/level this reports the compressed size, the time to
+compress and decompress, and the total time to move the body over a link of a given bandwidth (compress +
+transfer + decompress). Run with:
+
+    python benchmarks/compression_benchmark.py [rows] [columns]
+"""
+import json
+import sys
+import time
+
+from dataframe_json_packing import pack, pack_arrow, arrow_is_available
+from dataframe_json_packing import compression
+
+from wire_format_benchmark import make_wide_table
+
+# bytes per second
+LINKS = {"100Mbit": 100e6 / 8, "1Gbit": 1e9 / 8}
+
+LEVELS = {compression.GZIP: [1, 6, 9], compression.ZSTD: [1, 3, 9]}
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def _report(name, body):
+    print(f"  {name}: {len(body) / 1e6:.2f} MB uncompressed")
+    header = "".join(f"  {link:>9}" for link in LINKS)
+    print(
+        f"    {'encoding':<10} {'MB':>7} {'ratio':>6} {'comp s':>7} {'decomp s':>8}{header}"
+    )
+    print(
+        f"    {'identity':<10} {len(body) / 1e6:7.2f} {1:6.1f} {0:7.3f} {0:8.3f}"
+        + "".join(f"  {len(body) / rate:8.3f}s" for rate in LINKS.values())
+    )
+    for encoding in compression.supported_encodings():
+        for level in LEVELS[encoding]:
+            compressed, compress_time = _timed(
+                lambda: compression.compress(body, encoding, level)
+            )
+            _, decompress_time = _timed(
+                lambda: compression.decompress(compressed, encoding)
+            )
+            totals = [
+                compress_time + len(compressed) / rate + decompress_time
+                for rate in LINKS.values()
+            ]
+            print(
+                f"    {encoding + '-' + str(level):<10} {len(compressed) / 1e6:7.2f} {len(body) / len(compressed):6.1f} "
+                f"{compress_time:7.3f} {decompress_time:8.3f}"
+                + "".join(f"  {total:8.3f}s" for total in totals)
+            )
+
+
+def run(row_count, column_count):
+    df = make_wide_table(row_count, column_count)
+    print(f"{row_count} rows x {column_count} columns")
+    _report("json", json.dumps(pack(df)).encode("utf8"))
+    if arrow_is_available():
+        _report("arrow", pack_arrow(df))
+
+
+if __name__ == "__main__":
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    column_count = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    run(row_count, column_count)
@@ -0,0 +1,134 @@
+"""
+Compare the time taken by pack() and unpack() against the original row-at-a-time implementations, and check that
+both produce the same output. Run with:
+
+    python benchmarks/pack_benchmark.py [rows] [columns]
+"""
+import datetime
+import json
+import sys
+import time
+
+import pandas as pd
+
+from dataframe_json_packing import pack, unpack
+
+from wire_format_benchmark import make_wide_table
+
+
+# the implementations of pack() and unpack() before they were vectorized, kept here as the baseline to compare
+# against
+
+
+def _legacy_all_are_dates(values):
+    for value in values:
+        if not (isinstance(value, datetime.date) or (value is None)):
+            return False
+    return True
+
+
+def _legacy_replace_na_with_none(values, coerce):
+    result = []
+    for value in values:
+        if not isinstance(value, list) and pd.isna(value):
+            result.append(None)
+        else:
+            result.append(coerce(value))
+    return result
+
+
+def legacy_pack(df):
+    df = df.convert_dtypes()
+    columns = []
+    for column_name, type in df.dtypes.items():
+        values = df[column_name]
+        if type == "Int64":
+            coerce, type_name = int, "int"
+        elif type == "Float64":
+            coerce, type_name = float, "float"
+        elif type == "string":
+            coerce, type_name = (lambda x: x), "string"
+        elif type == "boolean":
+            coerce, type_name = bool, "boolean"
+        elif str(type).startswith("datetime64"):
+            coerce, type_name = str, "datetime64"
+        elif _legacy_all_are_dates(values):
+            coerce, type_name = (lambda x: x.toordinal()), "date"
+        else:
+            coerce, type_name = json.dumps, "json"
+        values = _legacy_replace_na_with_none(values, coerce)
+        columns.append({"name": column_name, "type": type_name, "values": values})
+    return {"columns": columns}
+
+
+def _legacy_date_column_from_ordinal(values):
+    return pd.Series(
+        [
+            None if value is None else datetime.date.fromordinal(value)
+            for value in values
+        ],
+        dtype="object",
+    )
+
+
+def _legacy_datetime_column_from_string(values):
+    return pd.Series(
+        [
+            None
+            if value is None
+            else pd.to_datetime(datetime.datetime.fromisoformat(value))
+            for value in values
+        ]
+    )
+
+
+legacy_series_constructor_by_name = {
+    "string": lambda values: pd.Series(data=values, dtype="string"),
+    "int": lambda values: pd.Series(data=values, dtype="Int64"),
+    "float": lambda values: pd.Series(data=values, dtype="Float64"),
+    "date": _legacy_date_column_from_ordinal,
+    "datetime64": _legacy_datetime_column_from_string,
+    "boolean": lambda values: pd.Series(data=values, dtype="boolean"),
+}
+
+
+def legacy_unpack(d):
+    return pd.DataFrame(
+        {
+            column["name"]: legacy_series_constructor_by_name[column["type"]](
+                column["values"]
+            )
+            for column in d["columns"]
+        }
+    )
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main(row_count=1000000, column_count=6):
+    df = make_wide_table(row_count, column_count)
+    # the legacy implementation only recognized a date column when its missing values were None
+    df = df.astype({name: "object" for name in df.columns[4::6]})
+    for name in df.columns[4::6]:
+        df[name] = df[name].where(df[name].notna(), None)
+
+    print(f"{row_count} rows x {column_count} columns")
+    expected, legacy_elapsed = _timed(lambda: legacy_pack(df))
+    packed, elapsed = _timed(lambda: pack(df))
+    assert packed == expected, "pack() output differs from the legacy implementation"
+    print(f"legacy pack: {legacy_elapsed:8.2f}s")
+    print(f"pack:        {elapsed:8.2f}s  ({legacy_elapsed / elapsed:.1f}x faster)")
+
+    expected, legacy_elapsed = _timed(lambda: legacy_unpack(packed))
+    unpacked, elapsed = _timed(lambda: unpack(packed))
+    pd.testing.assert_frame_equal(unpacked, expected)
+    print(f"legacy unpack: {legacy_elapsed:6.2f}s")
+    print(f"unpack:        {elapsed:6.2f}s  ({legacy_elapsed / elapsed:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
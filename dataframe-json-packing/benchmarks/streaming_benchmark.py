@@ -0,0 +1,70 @@
+"""
+Compare how the REST service used to encode a table as JSON (json.dumps of the whole pack() dict) against the
+streaming encoders, by time and by peak memory allocated on top of the dataframe itself. The chunked encoder is
+fed slices of the table, the way the service feeds it chunks read from a cursor. Run with:
+
+    python benchmarks/streaming_benchmark.py [rows] [columns]
+"""
+import json
+import sys
+import time
+import tracemalloc
+
+from dataframe_json_packing import pack, iter_pack_json, iter_pack_chunks
+
+from wire_format_benchmark import make_wide_table
+
+CHUNK_ROWS = 10000
+
+
+def whole_dict(df):
+    # what JSONResponse(content=pack(df)) did
+    return [json.dumps(pack(df), separators=(",", ":")).encode("utf8")]
+
+
+def by_column(df):
+    return iter_pack_json(df)
+
+
+def by_chunk(df):
+    return iter_pack_chunks(
+        df.iloc[start : start + CHUNK_ROWS] for start in range(0, len(df), CHUNK_ROWS)
+    )
+
+
+def _consume(chunks):
+    # the body is consumed as it's produced, as a socket would
+    return sum(len(chunk) for chunk in chunks)
+
+
+def measure(encode, df):
+    "returns (seconds, peak bytes allocated, body size). tracemalloc slows things down, so time a separate run"
+    start = time.perf_counter()
+    size = _consume(encode(df))
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    _consume(encode(df))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    column_count = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    df = make_wide_table(row_count, column_count)
+
+    print(f"{row_count} rows x {column_count} columns")
+    print(f"{'encoder':<12} {'seconds':>8} {'peak MB':>8} {'body MB':>8}")
+    for name, encode in [
+        ("whole dict", whole_dict),
+        ("by column", by_column),
+        ("by chunk", by_chunk),
+    ]:
+        elapsed, peak, size = measure(encode, df)
+        print(f"{name:<12} {elapsed:>8.2f} {peak / 1e6:>8.1f} {size / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Compare the cost of moving a wide table over the wire as packed JSON vs as an Arrow IPC stream.
+
+For each format this measures the time to encode on the server (pack + serialize), the time to decode on the client
+(parse + unpack) and the size of the body. Run with:
+
+    python benchmarks/wire_format_benchmark.py [rows] [columns]
+"""
+import datetime
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataframe_json_packing import pack, unpack, pack_arrow, unpack_arrow
+
+
+def make_wide_table(row_count, column_count, seed=0):
+    "a table with a mix of the column types gumbo tables have, with ~10% missing values"
+    rng = np.random.default_rng(seed)
+    missing = lambda: rng.random(row_count) < 0.1
+    columns = {}
+    for i in range(column_count):
+        kind = i % 6
+        if kind == 0:
+            values = pd.Series(rng.integers(0, 1000000, row_count), dtype="Int64")
+        elif kind == 1:
+            values = pd.Series(rng.random(row_count), dtype="Float64")
+        elif kind == 2:
+            values = pd.Series(
+                [f"ACH-{x:06d}" for x in rng.integers(0, 5000, row_count)],
+                dtype="string",
+            )
+        elif kind == 3:
+            values = pd.Series(rng.random(row_count) < 0.5, dtype="boolean")
+        elif kind == 4:
+            start = datetime.date(2000, 1, 1).toordinal()
+            values = pd.Series(
+                [
+                    datetime.date.fromordinal(start + int(x))
+                    for x in rng.integers(0, 8000, row_count)
+                ],
+                dtype="object",
+            )
+        else:
+            values = pd.Series(
+                pd.to_datetime("2020-01-01")
+                + pd.to_timedelta(rng.integers(0, 10**8, row_count), unit="s")
+            )
+        values[missing()] = None
+        columns[f"col_{i}"] = values
+    return pd.DataFrame(columns)
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def run(row_count, column_count):
+    df = make_wide_table(row_count, column_count)
+    print(f"{row_count} rows x {column_count} columns")
+
+    body, encode_time = _timed(lambda: json.dumps(pack(df)).encode("utf8"))
+    _, decode_time = _timed(lambda: unpack(json.loads(body)))
+    print(
+        f"  json : {len(body) / 1e6:8.1f} MB  encode {encode_time:6.2f}s  decode {decode_time:6.2f}s"
+    )
+
+    body, encode_time = _timed(lambda: pack_arrow(df))
+    _, decode_time = _timed(lambda: unpack_arrow(body))
+    print(
+        f"  arrow: {len(body) / 1e6:8.1f} MB  encode {encode_time:6.2f}s  decode {decode_time:6.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    column_count = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    run(row_count, column_count)
@@ -1,3 +1,15 @@
-from .df_serialization import pack, unpack
+from .df_serialization import pack, unpack, cast_to_packed_types
+from .arrow_serialization import (
+    pack_arrow,
+    unpack_arrow,
+    arrow_is_available,
+    ARROW_MEDIA_TYPE,
+)
+from .streaming import (
+    iter_pack_json,
+    iter_pack_chunks,
+    unpack_chunks,
+    PACKED_CHUNKS_MEDIA_TYPE,
+)
 
 # update 2
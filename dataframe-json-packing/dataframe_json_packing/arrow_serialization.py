@@ -0,0 +1,113 @@
+import json
+
+import pandas as pd
+
+from .df_serialization import _packed_type_name
+
+# an alternative to pack/unpack which serializes a dataframe as an Arrow IPC stream. The type names used by pack
+# are recorded in each field's metadata so that unpack_arrow reconstructs the same dtypes as unpack.
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+TYPE_METADATA_KEY = b"gumbo_type"
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(
+            "pyarrow is required for Arrow serialization. Install dataframe-json-packing with the 'arrow' extra"
+        )
+    return pyarrow
+
+
+def arrow_is_available():
+    try:
+        _import_pyarrow()
+    except ImportError:
+        return False
+    return True
+
+
+def _arrow_array(pa, type_name, values, is_null):
+    if type_name == "date":
+        return pa.array(
+            [None if null else value for value, null in zip(values, is_null)],
+            type=pa.date32(),
+        )
+    if type_name == "json":
+        return pa.array(
+            [
+                None if null else json.dumps(value)
+                for value, null in zip(values, is_null)
+            ],
+            type=pa.string(),
+        )
+    return pa.Array.from_pandas(values)
+
+
+def pack_arrow(df) -> bytes:
+    "Serialize the dataframe as an Arrow IPC stream"
+    pa = _import_pyarrow()
+
+    df = df.convert_dtypes()
+    arrays = []
+    fields = []
+    for column_name, type in df.dtypes.items():
+        values = df[column_name]
+        is_null = values.isna().to_numpy(dtype="bool")
+        type_name = _packed_type_name(column_name, type, values, is_null)
+        array = _arrow_array(pa, type_name, values, is_null)
+        arrays.append(array)
+        fields.append(
+            pa.field(
+                column_name,
+                array.type,
+                metadata={TYPE_METADATA_KEY: type_name.encode("utf8")},
+            )
+        )
+    table = pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _series_from_arrow(pa, column_name, type_name, column):
+    if type_name == "int":
+        return column.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+    if type_name == "float":
+        return column.to_pandas(types_mapper={pa.float64(): pd.Float64Dtype()}.get)
+    if type_name == "string":
+        return column.to_pandas(types_mapper={pa.string(): pd.StringDtype()}.get)
+    if type_name == "boolean":
+        return column.to_pandas(types_mapper={pa.bool_(): pd.BooleanDtype()}.get)
+    if type_name == "date":
+        return column.to_pandas(date_as_object=True).astype("object")
+    if type_name == "datetime64":
+        return column.to_pandas()
+    if type_name == "json":
+        return pd.Series(
+            [None if x is None else json.loads(x) for x in column.to_pylist()],
+            dtype="object",
+        )
+    raise Exception(f"Column {column_name} was unknown type: {type_name}")
+
+
+def unpack_arrow(data) -> pd.DataFrame:
+    """
+    Reconstruct a dataframe serialized with pack_arrow. `data` is either the bytes or a pyarrow file (ie:
+    `pyarrow.memory_map(path)` to read a saved stream without copying it into memory first)
+    """
+    pa = _import_pyarrow()
+
+    source = data if isinstance(data, pa.NativeFile) else pa.py_buffer(data)
+    table = pa.ipc.open_stream(source).read_all()
+    columns_dict = {}
+    for field, column in zip(table.schema, table.columns):
+        type_name = (field.metadata or {}).get(TYPE_METADATA_KEY, b"").decode("utf8")
+        series = _series_from_arrow(pa, field.name, type_name, column)
+        columns_dict[field.name] = series.reset_index(drop=True)
+    return pd.DataFrame(columns_dict)
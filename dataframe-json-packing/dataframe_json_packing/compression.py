@@ -0,0 +1,177 @@
+import zlib
+from typing import List, Optional
+
+# content codings which can be used to compress packed tables on the wire. gzip is always available, zstd needs
+# the zstandard package (install with the 'zstd' extra)
+
+GZIP = "gzip"
+ZSTD = "zstd"
+
+# the fastest levels. On packed tables higher levels shrink the body by a few percent more but take several times as
+# long, which costs more than it saves on anything faster than a slow link (see benchmarks/compression_benchmark.py)
+DEFAULT_LEVELS = {GZIP: 1, ZSTD: 1}
+
+# decompressors produce their output in pieces of at most this many bytes, so a size limit is enforced before much
+# more than it has been allocated
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+
+
+class DecompressedSizeExceeded(ValueError):
+    "Raised when a body decompresses to more bytes than it was allowed"
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "zstandard is required for zstd compression. Install dataframe-json-packing with the 'zstd' extra"
+        )
+    return zstandard
+
+
+def supported_encodings() -> List[str]:
+    "the encodings which can be used here, most preferred first"
+    try:
+        _import_zstandard()
+    except ImportError:
+        return [GZIP]
+    return [ZSTD, GZIP]
+
+
+class _GzipCompressor:
+    def __init__(self, level):
+        # wbits=31 selects the gzip container rather than a raw zlib stream
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+def compressobj(encoding, level=None):
+    "Returns an object with compress(bytes) and flush() methods for compressing a stream incrementally"
+    if level is None:
+        level = DEFAULT_LEVELS[encoding]
+    if encoding == GZIP:
+        return _GzipCompressor(level)
+    if encoding == ZSTD:
+        return _import_zstandard().ZstdCompressor(level=level).compressobj()
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def compress(data: bytes, encoding, level=None) -> bytes:
+    compressor = compressobj(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+class _SizeLimitedBuffer:
+    "collects decompressed output, raising DecompressedSizeExceeded once more than max_size bytes have been written"
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self._chunks = []
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise DecompressedSizeExceeded(
+                f"Body decompresses to more than {self.max_size} bytes"
+            )
+        self._chunks.append(data)
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class _GzipDecompressor:
+    def __init__(self, max_size):
+        # wbits=47 accepts a gzip or zlib container
+        self._decompressor = zlib.decompressobj(47)
+        self._buffer = _SizeLimitedBuffer(max_size)
+
+    def decompress(self, data: bytes) -> bytes:
+        while not self._decompressor.eof:
+            output = self._decompressor.decompress(data, DECOMPRESS_CHUNK_SIZE)
+            self._buffer.write(output)
+            data = self._decompressor.unconsumed_tail
+            # a full chunk may have left more output pending even once all the input is consumed
+            if not data and len(output) < DECOMPRESS_CHUNK_SIZE:
+                break
+        return self._buffer.take()
+
+    def flush(self) -> bytes:
+        if not self._decompressor.eof:
+            raise zlib.error("incomplete or truncated stream")
+        return b""
+
+
+class _ZstdDecompressor:
+    def __init__(self, max_size):
+        self._buffer = _SizeLimitedBuffer(max_size)
+        # a stream_writer rather than a decompressobj because it hands over its output a chunk at a time, and
+        # streamed frames don't record their size
+        self._writer = (
+            _import_zstandard()
+            .ZstdDecompressor()
+            .stream_writer(self._buffer, write_size=DECOMPRESS_CHUNK_SIZE)
+        )
+
+    def decompress(self, data: bytes) -> bytes:
+        self._writer.write(data)
+        return self._buffer.take()
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def decompressobj(encoding, max_size: Optional[int] = None):
+    """
+    Returns an object with decompress(bytes) and flush() methods for decompressing a stream incrementally. If
+    `max_size` is given, DecompressedSizeExceeded is raised as soon as the output grows past that many bytes.
+    """
+    if encoding == GZIP:
+        return _GzipDecompressor(max_size)
+    if encoding == ZSTD:
+        return _ZstdDecompressor(max_size)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def decompress(data: bytes, encoding, max_size: Optional[int] = None) -> bytes:
+    decompressor = decompressobj(encoding, max_size)
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the encoding to use for a response given the request's Accept-Encoding header, or None if the response
+    should not be compressed.
+    """
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    best = None
+    for encoding in supported_encodings():
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        # ties go to the earlier (preferred) encoding
+        if weight > 0 and (best is None or weight > best[1]):
+            best = (encoding, weight)
+    return None if best is None else best[0]
@@ -1,6 +1,7 @@
 import datetime
 import json
 
+import numpy as np
 import pandas as pd
 
 
@@ -9,16 +10,21 @@ import pandas as pd
 # retain data types
 
 
+# the proleptic gregorian ordinal of the numpy datetime64 epoch, 1970-01-01
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
 def _date_column_from_ordinal(values):
-    date_values = []
-    for value in values:
-        if value is not None:
-            value = datetime.date.fromordinal(value)
-        date_values.append(value)
-    return pd.Series(date_values, dtype="object")
+    ordinals = np.array(values, dtype="object")
+    is_null = np.equal(ordinals, None)
+    days = np.where(is_null, _EPOCH_ORDINAL, ordinals).astype("int64")
+    # converting datetime64[D] to object yields datetime.date instances
+    dates = (days - _EPOCH_ORDINAL).astype("datetime64[D]").astype("object")
+    dates[is_null] = None
+    return pd.Series(dates, dtype="object")
 
 
-def _datetime_column_from_string(values):
+def _datetime_column_from_string_slow(values):
     datetime_values = []
     for value in values:
         if value is not None:
@@ -27,6 +33,27 @@ def _datetime_column_from_string(values):
     return pd.Series(datetime_values)
 
 
+def _datetime_column_from_string(values):
+    if all(value is None for value in values):
+        # keep the dtype the per-value conversion produces for these
+        return _datetime_column_from_string_slow(values)
+
+    column = pd.to_datetime(pd.Series(values, dtype="object"))
+    if column.dtype in ("datetime64[ns]", "datetime64[ns, UTC]"):
+        return column
+    # values with non-UTC offsets are parsed into different timezone types by
+    # pd.to_datetime, so convert those one at a time to get the same result as before
+    return _datetime_column_from_string_slow(values)
+
+
+def _json_column_from_string(values):
+    # decode the whole column with one call by joining the values into a json array
+    decoded = json.loads(
+        "[" + ",".join("null" if value is None else value for value in values) + "]"
+    )
+    return pd.Series(data=decoded, dtype="object")
+
+
 series_constructor_by_name = {
     "string": lambda values: pd.Series(data=values, dtype="string"),
     "int": lambda values: pd.Series(data=values, dtype="Int64"),
@@ -34,79 +61,103 @@ series_constructor_by_name = {
     "date": _date_column_from_ordinal,
     "datetime64": _datetime_column_from_string,
     "boolean": lambda values: pd.Series(data=values, dtype="boolean"),
-    "json": lambda values: pd.Series(data=[json.loads(x) for x in values], dtype="object"),
+    "json": _json_column_from_string,
 }
 
 
-def _all_can_be_json(values):
-    for value in values:
-        try:
-            json.dumps(value)
-        except json.decoder.JSONDecodeError:
-            return False
-
-    return True
-
-
 def _all_are_dates(values):
+    "values must not contain any missing values"
     for value in values:
-        if not (isinstance(value, datetime.date) or (value is None)):
+        if not isinstance(value, datetime.date):
             return False
     return True
 
 
-def _replace_na_with_none(values, coerce):
-    # replace NA with None. I suspect there must be
-    # a better way then making this loop, but not sure what
-    result = []
-    for value in values:
-        if not isinstance(value, list) and pd.isna(value):
-            result.append(None)
+def _packed_type_name(column_name, type, values, is_null):
+    "pick the packed type name for a column"
+    if type == "Int64":
+        return "int"
+    elif type == "Float64":
+        return "float"
+    elif type in ["string"]:
+        return "string"
+    elif type == "boolean":
+        return "boolean"
+    elif str(type).startswith("datetime64") or type == "<M8[ns]":
+        return "datetime64"
+    elif type == "object":
+        # special handling of "object" series because these
+        # could be anything, but really they should only be
+        # used for dates or json. Anything which turns out not
+        # to be serializable as json is reported by _packed_values
+        if _all_are_dates(values[~is_null]):
+            return "date"
+        return "json"
+    else:
+        raise Exception(f"Column {column_name} unknown type: {type}")
+
+
+def _datetime_strings(values, is_null):
+    "format a datetime64 column the same way str(pd.Timestamp) does. Missing values are left as 'NaT'"
+    if values.dt.tz is None:
+        nanoseconds = values.to_numpy(dtype="datetime64[ns]").view("int64")
+        if (nanoseconds[~is_null] % 1_000_000_000 == 0).all():
+            # whole seconds, which is by far the common case, can be formatted by numpy in one go
+            return np.char.replace(
+                np.datetime_as_string(values.to_numpy(), unit="s"), "T", " "
+            ).tolist()
+    return [str(value) for value in values]
+
+
+def _packed_values(column_name, type_name, values, is_null):
+    "convert a column to a list of json compatible values, with None in place of missing values"
+    if type_name == "int":
+        result = values.to_numpy(dtype="int64", na_value=0).tolist()
+    elif type_name == "float":
+        numbers = values.to_numpy(dtype="float64", na_value=0.0)
+        # a Float64 column can hold NaN as well as NA. Treat both as missing
+        is_null = is_null | np.isnan(numbers)
+        result = numbers.tolist()
+    elif type_name == "string":
+        result = values.to_numpy(dtype="object", na_value=None).tolist()
+    elif type_name == "boolean":
+        result = values.to_numpy(dtype="bool", na_value=False).tolist()
+    elif type_name == "datetime64":
+        result = _datetime_strings(values, is_null)
+    else:
+        # dates and json don't have a columnar representation, so convert
+        # the values which are present one at a time
+        if type_name == "date":
+            coerce = lambda x: x.toordinal()
         else:
-            result.append(coerce(value))
+            coerce = json.dumps
+        present = values.to_numpy(dtype="object")[~is_null]
+        try:
+            converted = iter([coerce(value) for value in present])
+        except TypeError:
+            raise Exception(
+                f"Column {column_name} was type object but elements not dates or JSON: {values}..."
+            )
+        return [None if null else next(converted) for null in is_null.tolist()]
+
+    for i in np.flatnonzero(is_null):
+        result[i] = None
     return result
 
 
-def pack(df):
-    df = df.convert_dtypes()
-    columns = []
-    for column_name, type in df.dtypes.items():
-        values = df[column_name]
-        if type == "Int64":
-            coerce = int
-            type_name = "int"
-        elif type == "Float64":
-            coerce = float
-            type_name = "float"
-        elif type in ["string"]:
-            coerce = lambda x: x
-            type_name = "string"
-        elif type == "boolean":
-            coerce = lambda x: bool(x)
-            type_name = "boolean"
-        elif str(type).startswith("datetime64") or type == "<M8[ns]":
-            coerce = str
-            type_name = "datetime64"
-        elif type == "object":
-            # special handling of "object" series because these
-            # could be anything, but really they should only be
-            # used for dates or json
-            if _all_are_dates(values):
-                type_name = "date"
-                coerce = lambda x: x.toordinal()
-            elif _all_can_be_json(values):
-                type_name = "json"
-                coerce = json.dumps
-            else:
-                raise Exception(
-                    f"Column {column_name} was type object but elements not dates or JSON: {values}..."
-                )
-        else:
-            raise Exception(f"Column {column_name} unknown type: {type}")
+def _pack_column(column_name, values):
+    values = values.convert_dtypes()
+    is_null = values.isna().to_numpy(dtype="bool")
+    type_name = _packed_type_name(column_name, values.dtype, values, is_null)
+    return {
+        "name": column_name,
+        "type": type_name,
+        "values": _packed_values(column_name, type_name, values, is_null),
+    }
 
-        values = _replace_na_with_none(values, coerce)
 
-        columns.append({"name": column_name, "type": type_name, "values": values})
+def pack(df):
+    columns = [_pack_column(column_name, values) for column_name, values in df.items()]
     result = {"columns": columns}
     return result
 
@@ -122,3 +173,28 @@ def unpack(d):
         values = column["values"]
         columns_dict[column_name] = constructor(values)
     return pd.DataFrame(columns_dict)
+
+
+def cast_to_packed_types(df, types):
+    """
+    Convert the columns named in `types` (a dict of column name to a packed type name, ie: "float") to the dtype
+    unpack gives that type. The types pack picks depend on the values, so this makes dataframes packed separately
+    (ie: pages of one table) come out the same, where a page with a column of only missing values would otherwise
+    be a date column (pack finds no values which aren't dates) and one whose floats are all whole numbers would be
+    int.
+    """
+    df = df.copy()
+    for column_name, type_name in types.items():
+        if column_name not in df.columns:
+            continue
+        if type_name not in series_constructor_by_name:
+            raise Exception(f"Column {column_name} was unknown type: {type_name}")
+        packed = _pack_column(column_name, df[column_name])
+        if packed["type"] == type_name:
+            continue
+        series = series_constructor_by_name[type_name](packed["values"])
+        if type_name == "datetime64" and series.dtype == "object":
+            # there were no values to infer the datetime dtype from
+            series = series.astype("datetime64[ns]")
+        df[column_name] = series.set_axis(df.index)
+    return df
@@ -0,0 +1,101 @@
+import json
+from typing import Iterable, Iterator, Union
+
+import pandas as pd
+
+from .df_serialization import _pack_column, pack, unpack
+
+# encode pack's format incrementally, so that the whole table never has to be held in memory as python objects
+# and as a JSON string at the same time. orjson (install with the 'orjson' extra) is used when available since it
+# is several times faster than the json module on packed columns.
+
+# a stream of packed dataframes, one per line, each holding the next chunk of rows
+PACKED_CHUNKS_MEDIA_TYPE = "application/vnd.gumbo.packed-chunks+ndjson"
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj) -> bytes:
+    "serialize obj as compact JSON"
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf8")
+
+
+def loads(data: Union[bytes, str]):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def iter_pack_json(df) -> Iterator[bytes]:
+    """
+    Yields the JSON encoding of pack(df) a column at a time, so only one column is ever converted to python
+    objects at once.
+    """
+    yield b'{"columns":['
+    for i, (column_name, values) in enumerate(df.items()):
+        if i > 0:
+            yield b","
+        yield dumps(_pack_column(column_name, values))
+    yield b"]}"
+
+
+def iter_pack_chunks(dfs: Iterable[pd.DataFrame]) -> Iterator[bytes]:
+    "Yields each dataframe packed as a line of JSON, which unpack_chunks turns back into a single dataframe"
+    for df in dfs:
+        yield dumps(pack(df)) + b"\n"
+
+
+def _merged_type(column_name, types):
+    # the type of a chunk's column is inferred from its values, so a chunk where every value is missing looks
+    # like a date (there are no values which aren't dates) and one where every float happens to be a whole number
+    # looks like an int
+    types = set(types)
+    if types == {"int", "float"}:
+        return "float"
+    if len(types) != 1:
+        raise Exception(
+            f"Column {column_name} has different types in different chunks: {types}"
+        )
+    return types.pop()
+
+
+def unpack_chunks(lines: Iterable[Union[bytes, str]]) -> pd.DataFrame:
+    "Unpack the lines produced by iter_pack_chunks into a dataframe with the same dtypes unpack would produce"
+    names = None
+    values = {}
+    types = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        columns = loads(line)["columns"]
+        if names is None:
+            names = [column["name"] for column in columns]
+            values = {name: [] for name in names}
+            types = {name: [] for name in names}
+        for column in columns:
+            name = column["name"]
+            values[name].extend(column["values"])
+            if any(value is not None for value in column["values"]):
+                types[name].append(column["type"])
+
+    if names is None:
+        raise Exception("No chunks to unpack")
+    return unpack(
+        {
+            "columns": [
+                {
+                    "name": name,
+                    # pack gives a column with no values at all the type date, which unpacks to the same column
+                    # of Nones as json
+                    "type": _merged_type(name, types[name]) if types[name] else "json",
+                    "values": values[name],
+                }
+                for name in names
+            ]
+        }
+    )
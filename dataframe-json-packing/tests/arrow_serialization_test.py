@@ -0,0 +1,70 @@
+import datetime
+import json
+
+import pandas as pd
+import pytest
+
+from dataframe_json_packing import pack, unpack, pack_arrow, unpack_arrow
+
+pytest.importorskip("pyarrow")
+
+
+def _sample_df():
+    df = pd.DataFrame(
+        {
+            "string": ["a", "b", None],
+            "int": [1, 2, None],
+            "float": [1.1, 2.2, None],
+            "bool": [True, False, None],
+            "d": [datetime.date(2000, 1, 1), datetime.date(2001, 2, 2), None],
+            "dt": [
+                pd.to_datetime(datetime.datetime(2000, 1, 1, hour=1)),
+                pd.to_datetime(datetime.datetime(2001, 2, 2, hour=2)),
+                None,
+            ],
+            "dt_tz": [
+                pd.to_datetime(datetime.datetime(2000, 1, 1, hour=1), utc=True),
+                pd.to_datetime(datetime.datetime(2001, 2, 2, hour=2), utc=True),
+                None,
+            ],
+            "json": [
+                "[1, 2, 3]",
+                '{"s": "foo", "a": [-5.5], "o": {"x": "y"}}',
+                "{}",
+            ],
+        }
+    ).convert_dtypes()
+    df["json"] = df["json"].apply(json.loads)
+    return df
+
+
+def test_arrow_round_trip():
+    df = _sample_df()
+    unpacked_df = unpack_arrow(pack_arrow(df))
+    assert df.equals(unpacked_df)
+
+
+def test_arrow_matches_json_packing():
+    df = _sample_df()
+    from_json = unpack(json.loads(json.dumps(pack(df))))
+    from_arrow = unpack_arrow(pack_arrow(df))
+    assert list(from_json.dtypes) == list(from_arrow.dtypes)
+    assert from_json.equals(from_arrow)
+
+
+def test_arrow_empty_dataframe():
+    df = pd.DataFrame({"a": pd.Series([], dtype="Int64")})
+    assert list(unpack_arrow(pack_arrow(df)).dtypes) == ["Int64"]
+
+
+def test_unpack_arrow_from_memory_map(tmpdir):
+    import pyarrow
+
+    df = _sample_df()
+    path = str(tmpdir.join("sample.arrow"))
+    with open(path, "wb") as fd:
+        fd.write(pack_arrow(df))
+
+    with pyarrow.memory_map(path) as source:
+        unpacked = unpack_arrow(source)
+    assert unpacked.equals(unpack_arrow(pack_arrow(df)))
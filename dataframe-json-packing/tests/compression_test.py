@@ -0,0 +1,57 @@
+import json
+import zlib
+
+import pytest
+
+from dataframe_json_packing import compression
+
+
+@pytest.mark.parametrize("encoding", compression.supported_encodings())
+def test_round_trip(encoding):
+    data = json.dumps({"values": ["ACH-000001"] * 1000 + [None] * 1000}).encode("utf8")
+    compressed = compression.compress(data, encoding)
+    assert len(compressed) < len(data) / 10
+    assert compression.decompress(compressed, encoding) == data
+
+    # compressing in pieces produces a stream which decompresses the same way
+    compressor = compression.compressobj(encoding, level=1)
+    streamed = b"".join(
+        [compressor.compress(data[i : i + 100]) for i in range(0, len(data), 100)]
+    )
+    streamed += compressor.flush()
+    assert compression.decompress(streamed, encoding) == data
+
+
+def test_choose_encoding(monkeypatch):
+    monkeypatch.setattr(compression, "supported_encodings", lambda: ["zstd", "gzip"])
+    assert compression.choose_encoding(None) is None
+    assert compression.choose_encoding("identity") is None
+    assert compression.choose_encoding("gzip, deflate") == "gzip"
+    assert compression.choose_encoding("gzip, zstd") == "zstd"
+    assert compression.choose_encoding("zstd;q=0.5, gzip") == "gzip"
+    assert compression.choose_encoding("*") == "zstd"
+    assert compression.choose_encoding("*, zstd;q=0") == "gzip"
+
+    monkeypatch.setattr(compression, "supported_encodings", lambda: ["gzip"])
+    assert compression.choose_encoding("zstd") is None
+
+
+@pytest.mark.parametrize("encoding", compression.supported_encodings())
+def test_decompress_max_size(encoding):
+    data = b"\0" * (3 * compression.DECOMPRESS_CHUNK_SIZE)
+    compressed = compression.compress(data, encoding)
+    assert compression.decompress(compressed, encoding, max_size=len(data)) == data
+    with pytest.raises(compression.DecompressedSizeExceeded):
+        compression.decompress(compressed, encoding, max_size=len(data) - 1)
+
+    # the limit applies to the whole stream, not each piece fed to the decompressor
+    decompressor = compression.decompressobj(encoding, max_size=len(data) - 1)
+    with pytest.raises(compression.DecompressedSizeExceeded):
+        for i in range(0, len(compressed), 100):
+            decompressor.decompress(compressed[i : i + 100])
+
+
+def test_decompress_truncated_gzip():
+    compressed = compression.compress(b"x" * 1000, compression.GZIP)
+    with pytest.raises(zlib.error):
+        compression.decompress(compressed[:-4], compression.GZIP)
@@ -4,7 +4,7 @@ import re
 
 import pandas as pd
 
-from dataframe_json_packing import pack, unpack
+from dataframe_json_packing import cast_to_packed_types, pack, unpack
 
 
 def test_df_to_dict():
@@ -74,3 +74,90 @@ def test_df_to_dict():
     unpacked_df = unpack(packed)
 
     assert df.equals(unpacked_df)
+
+
+def test_pack_missing_values():
+    df = pd.DataFrame(
+        {
+            "float_with_nan": pd.Series([1.5, None, float("nan")], dtype="object"),
+            "bool": pd.array([True, None, False], dtype="boolean"),
+            "all_missing": pd.Series([None, None, None], dtype="object"),
+            "dates_with_nan": pd.Series(
+                [datetime.date(2000, 1, 1), float("nan"), None], dtype="object"
+            ),
+            "json_lists": pd.Series([[1, 2], None, {"a": None}], dtype="object"),
+        }
+    )
+    packed = pack(df)
+    assert packed == {
+        "columns": [
+            {"name": "float_with_nan", "type": "float", "values": [1.5, None, None]},
+            {"name": "bool", "type": "boolean", "values": [True, None, False]},
+            {"name": "all_missing", "type": "date", "values": [None, None, None]},
+            {
+                "name": "dates_with_nan",
+                "type": "date",
+                "values": [730120, None, None],
+            },
+            {
+                "name": "json_lists",
+                "type": "json",
+                "values": ["[1, 2]", None, '{"a": null}'],
+            },
+        ]
+    }
+    # the values are plain python types
+    assert type(packed["columns"][0]["values"][0]) == float
+    assert json.loads(json.dumps(packed)) == packed
+
+
+def test_unpack_missing_values():
+    unpacked = unpack(
+        {
+            "columns": [
+                {"name": "d", "type": "date", "values": [730120, None]},
+                {
+                    "name": "dt",
+                    "type": "datetime64",
+                    "values": ["2000-01-01 01:00:00.500000", None],
+                },
+                {
+                    "name": "dt_offset",
+                    "type": "datetime64",
+                    "values": ["2000-01-01 01:00:00+05:30", None],
+                },
+                {"name": "json", "type": "json", "values": ['{"a": [1]}', None]},
+            ]
+        }
+    )
+    assert unpacked["d"].dtype == "object"
+    assert list(unpacked["d"]) == [datetime.date(2000, 1, 1), None]
+    assert unpacked["dt"].dtype == "datetime64[ns]"
+    assert unpacked["dt"][0] == pd.Timestamp("2000-01-01 01:00:00.5")
+    assert pd.isna(unpacked["dt"][1])
+    assert str(unpacked["dt_offset"].dtype) == "datetime64[ns, UTC+05:30]"
+    assert unpacked["json"].dtype == "object"
+    assert list(unpacked["json"]) == [{"a": [1]}, None]
+
+
+def test_cast_to_packed_types():
+    # pages of the same table, where the types pack infers from the values differ
+    pages = [
+        pd.DataFrame({"f": [1.0, 2.0], "i": [None, None], "dt": [None, None]}),
+        pd.DataFrame(
+            {
+                "f": [1.5, None],
+                "i": [1, None],
+                "dt": pd.to_datetime(["2000-01-01", None]),
+            }
+        ),
+    ]
+    types = {"f": "float", "i": "int", "dt": "datetime64", "missing": "string"}
+    first, second = [unpack(pack(page)) for page in pages]
+    assert first["f"].dtype != second["f"].dtype
+
+    first, second = [cast_to_packed_types(page, types) for page in (first, second)]
+    assert first.dtypes.equals(second.dtypes)
+    assert list(first.dtypes.astype(str)) == ["Float64", "Int64", "datetime64[ns]"]
+    assert list(first["f"]) == [1.0, 2.0]
+    assert list(second["i"].isna()) == [False, True]
@@ -0,0 +1,60 @@
+import datetime
+import json
+
+import pandas as pd
+import pytest
+
+import dataframe_json_packing.streaming
+from dataframe_json_packing import (
+    pack,
+    unpack,
+    iter_pack_json,
+    iter_pack_chunks,
+    unpack_chunks,
+)
+
+
+def _sample_df():
+    return pd.DataFrame(
+        {
+            "string": ["a", "b", None, "d"],
+            "int": [1, 2, None, 4],
+            "float": [1.0, 2.0, 3.0, 4.5],
+            "d": [None, None, datetime.date(2000, 1, 1), datetime.date(2001, 2, 2)],
+            "dt": pd.to_datetime(
+                ["2000-01-01 01:00", None, "2001-02-02 02:00", "2002-03-03"]
+            ),
+            "json": [{"a": [1]}, None, [1, 2], {}],
+        }
+    )
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_iter_pack_json_matches_pack(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(dataframe_json_packing.streaming, "orjson", None)
+    df = _sample_df()
+    encoded = b"".join(iter_pack_json(df))
+    assert json.loads(encoded) == pack(df)
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_chunks_round_trip(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(dataframe_json_packing.streaming, "orjson", None)
+    df = _sample_df()
+    # the first chunk has no dates, and only whole numbers in the float column
+    chunks = [df.iloc[0:2], df.iloc[2:3], df.iloc[3:4]]
+    lines = b"".join(iter_pack_chunks(chunks)).splitlines()
+    assert len(lines) == 3
+
+    unpacked = unpack_chunks(lines)
+    expected = unpack(pack(df))
+    pd.testing.assert_frame_equal(unpacked, expected)
+
+
+def test_unpack_empty_chunk():
+    df = pd.DataFrame({"id": pd.Series([], dtype="string")})
+    unpacked = unpack_chunks(iter_pack_chunks([df]))
+    assert list(unpacked.columns) == ["id"]
+    assert len(unpacked) == 0
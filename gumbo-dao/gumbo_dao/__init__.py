@@ -1 +1,13 @@
-from .gumbo_dao import GumboDAO
+from .gumbo_dao import (
+    GumboDAO,
+    VERIFICATION_LEVELS,
+    VERIFY_OFF,
+    VERIFY_SAMPLED,
+    VERIFY_TOUCHED,
+    VERIFY_FULL,
+)
+from .table_metadata import TableMetadata, TableMetadataCache
+from .changes import TableChanges, AUDIT_TABLE, AUDIT_TABLE_VERSION_INDEX
+from .fingerprints import TableFingerprint
+from .uploads import UploadStatus, UPLOAD_TABLES_SCHEMA
+from .connection_pool import ConnectionPool
@@ -0,0 +1,94 @@
+import hashlib
+from typing import List, NamedTuple, Tuple
+
+import pandas as pd
+
+# the table the audit trigger writes a row to for every insert, update, delete and truncate. Only the relid,
+# transaction_id, action, row_data and changed_fields columns are used (row_data and changed_fields are jsonb)
+AUDIT_TABLE = "audit.logged_actions"
+
+# every transaction with an id below this has finished, so its changes are either visible or never will be
+WATERMARK_QUERY = "SELECT txid_snapshot_xmin(txid_current_snapshot())"
+
+CHANGED_KEYS_QUERY = """SELECT action, row_data ->> %(pk_column)s, changed_fields ->> %(pk_column)s
+FROM   {audit_table}
+WHERE  relid = to_regclass(%(table_name)s)::oid
+AND    transaction_id >= %(since)s"""
+
+
+# the latest change made to the table, read from the end of an index on (relid, event_id) so it costs the same
+# however long the audit history is (see AUDIT_TABLE_VERSION_INDEX), and the transactions still in progress which
+# have written to the table (every INSERT, UPDATE and DELETE holds a RowExclusiveLock on it, and TRUNCATE an
+# AccessExclusiveLock, until the transaction ends). One of those may have taken an event_id below the latest and
+# commit after it, so while any are running the version includes them and changes again once they finish. Writes
+# to other tables don't affect it
+TABLE_VERSION_QUERY = """SELECT (SELECT max(event_id) FROM {audit_table} WHERE relid = to_regclass(%(table_name)s)::oid),
+       ARRAY(SELECT DISTINCT virtualtransaction
+             FROM   pg_locks
+             WHERE  relation = to_regclass(%(table_name)s)::oid
+             AND    mode IN ('RowExclusiveLock', 'AccessExclusiveLock')
+             ORDER  BY 1)"""
+
+# the index TABLE_VERSION_QUERY reads a table's latest event_id from. Create it once on the audit table
+AUDIT_TABLE_VERSION_INDEX = """CREATE INDEX IF NOT EXISTS logged_actions_relid_event_id_idx
+    ON {audit_table} (relid, event_id)"""
+
+
+class TableChanges(NamedTuple):
+    # pass this as `since` to get the changes made after these
+    watermark: int
+    # if True, `upserted` is the entire table and anything not in it should be dropped
+    full_refresh: bool
+    # the current version of every row inserted or updated since the previous watermark
+    upserted: pd.DataFrame
+    # a dataframe with just the primary key column, containing the keys of the rows deleted since the watermark
+    deleted: pd.DataFrame
+
+
+def _changed_keys(rows) -> Tuple[bool, List[str]]:
+    """
+    Given (action, old or new key, new key if it changed) rows from CHANGED_KEYS_QUERY, returns whether the
+    table was truncated and the distinct keys (as text) of every row which was touched.
+    """
+    keys = set()
+    for action, key, changed_key in rows:
+        if action == "T":
+            return True, []
+        # for updates row_data holds the row before the change, so a key which was itself updated appears in both
+        for value in (key, changed_key):
+            if value is not None:
+                keys.add(value)
+    return False, sorted(keys)
+
+
+def _fetch_changed_keys(
+    cursor, audit_table, table_name, pk_column, since
+) -> Tuple[bool, List[str]]:
+    cursor.execute(
+        CHANGED_KEYS_QUERY.format(audit_table=audit_table),
+        {"pk_column": pk_column, "table_name": table_name, "since": since},
+    )
+    return _changed_keys(cursor.fetchall())
+
+
+def _fetch_table_version(cursor, audit_table, table_name) -> str:
+    cursor.execute(
+        TABLE_VERSION_QUERY.format(audit_table=audit_table), {"table_name": table_name}
+    )
+    last_event_id, in_progress = cursor.fetchone()
+    if not in_progress:
+        return f"{last_event_id}"
+    in_progress_digest = hashlib.sha1(",".join(in_progress).encode("ascii")).hexdigest()
+    return f"{last_event_id}.{in_progress_digest[:12]}"
+
+
+def _fetch_watermark(cursor) -> int:
+    cursor.execute(WATERMARK_QUERY)
+    return cursor.fetchone()[0]
+
+
+def _deleted_keys_query(table_name, quoted_pk_column, pk_type) -> str:
+    "the keys (passed as a text array parameter) which no longer exist in the table, cast to the key's type"
+    return f"""SELECT CAST(k AS {pk_type}) AS {quoted_pk_column}
+FROM   unnest(CAST(%s AS text[])) AS k
+WHERE  NOT EXISTS (SELECT 1 FROM {table_name} t WHERE t.{quoted_pk_column} = CAST(k AS {pk_type}))"""
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of psycopg2 connections.
+
+    Unlike psycopg2's ThreadedConnectionPool (which this wraps) `getconn` waits up to `checkout_timeout` seconds for
+    a connection to be returned when all `maxconn` connections are in use, instead of failing immediately.
+    Connections which have been idle for more than `health_check_interval` seconds are checked with a trivial query
+    before being handed out, and replaced if they've gone bad. Connections are handed out in autocommit mode unless
+    `autocommit` is False.
+    """
+
+    def __init__(
+        self,
+        dsn,
+        *,
+        minconn=1,
+        maxconn=10,
+        checkout_timeout=30.0,
+        health_check_interval=60.0,
+        autocommit=True,
+        clock=time.monotonic,
+    ):
+        self.checkout_timeout = checkout_timeout
+        self.autocommit = autocommit
+        self.health_check_interval = health_check_interval
+        self.clock = clock
+        self._pool = ThreadedConnectionPool(minconn, maxconn, dsn)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        # id(connection) -> time the connection was last returned to the pool
+        self._returned_at = {}
+        self._counts = {
+            "checkouts": 0,
+            "returns": 0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+        }
+
+    def _increment(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            self._increment("timeouts")
+            raise PoolError(
+                f"Timed out after {self.checkout_timeout} seconds waiting for a database connection"
+            )
+        try:
+            connection = self._pool.getconn()
+            if not self._is_healthy(connection):
+                self._increment("health_check_failures")
+                self._pool.putconn(connection, close=True)
+                connection = self._pool.getconn()
+            connection.autocommit = self.autocommit
+        except:
+            self._slots.release()
+            raise
+
+        self._increment("checkouts")
+        return connection
+
+    def _is_healthy(self, connection):
+        if connection.closed:
+            return False
+
+        with self._lock:
+            returned_at = self._returned_at.get(id(connection))
+        if (
+            returned_at is None
+            or self.clock() - returned_at < self.health_check_interval
+        ):
+            # brand new or recently used, so assume it's fine rather than paying for a round trip
+            return True
+
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def putconn(self, connection):
+        try:
+            with self._lock:
+                if connection.closed:
+                    self._returned_at.pop(id(connection), None)
+                else:
+                    self._returned_at[id(connection)] = self.clock()
+            # the pool rolls back any transaction left open, and discards the connection if it's broken
+            self._pool.putconn(connection, close=bool(connection.closed))
+        finally:
+            self._slots.release()
+        self._increment("returns")
+
+    def closeall(self):
+        self._pool.closeall()
+
+    def stats(self):
+        "Returns a dict of counters and sizes describing the current state of the pool"
+        with self._lock:
+            result = dict(self._counts)
+        result.update(
+            {
+                "min_size": self._pool.minconn,
+                "max_size": self._pool.maxconn,
+                "in_use": len(self._pool._used),
+                "idle": len(self._pool._pool),
+            }
+        )
+        return result
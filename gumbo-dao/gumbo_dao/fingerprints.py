@@ -0,0 +1,41 @@
+import hashlib
+from typing import List, NamedTuple, Optional
+
+import pandas as pd
+
+# the name of the column holding each row's hash in TableFingerprint.row_hashes
+ROW_HASH_COLUMN = "row_hash"
+
+
+class TableFingerprint(NamedTuple):
+    # the md5 of the row hashes concatenated in primary key order, which changes whenever a row is inserted,
+    # updated or deleted
+    digest: str
+    row_count: int
+    # a dataframe with the primary key column and a ROW_HASH_COLUMN column, ordered by primary key, or None if
+    # the row hashes weren't asked for
+    row_hashes: Optional[pd.DataFrame]
+
+
+def _row_hash_expression(quoted_columns: List[str]) -> str:
+    # the md5 of postgres's text representation of the row (ie: "(id,1,1.5,)"), so it changes if any value does
+    values = ", ".join(f"t.{column}" for column in quoted_columns)
+    return f"md5(CAST(ROW({values}) AS text))"
+
+
+def _row_hashes_query(table_name, quoted_pk_column, quoted_columns) -> str:
+    return f"""SELECT t.{quoted_pk_column}, {_row_hash_expression(quoted_columns)} AS {ROW_HASH_COLUMN}
+FROM   {table_name} t
+ORDER  BY t.{quoted_pk_column}"""
+
+
+def _digest_query(table_name, quoted_pk_column, quoted_columns) -> str:
+    "the row count and digest, computed without sending the row hashes back"
+    return f"""SELECT count(*),
+       md5(coalesce(string_agg({_row_hash_expression(quoted_columns)}, '' ORDER BY t.{quoted_pk_column}), ''))
+FROM   {table_name} t"""
+
+
+def _digest(row_hashes) -> str:
+    "the same digest as _digest_query computes, given the row hashes in primary key order"
+    return hashlib.md5("".join(row_hashes).encode("ascii")).hexdigest()
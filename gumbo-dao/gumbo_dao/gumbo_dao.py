@@ -1,12 +1,66 @@
+import hashlib
+import json
+import random
+import uuid
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
-from psycopg2.extras import execute_batch, execute_values
-from psycopg2.errors import UndefinedTable
-from typing import Optional
+import psycopg2
+from psycopg2.extras import execute_values
+from typing import Iterator, Optional
+from .table_metadata import TableMetadata, TableMetadataCache, _fetch_table_metadata
+from .changes import (
+    AUDIT_TABLE,
+    TableChanges,
+    _deleted_keys_query,
+    _fetch_changed_keys,
+    _fetch_table_version,
+    _fetch_watermark,
+)
+from .fingerprints import (
+    ROW_HASH_COLUMN,
+    TableFingerprint,
+    _digest,
+    _digest_query,
+    _row_hashes_query,
+)
+from .uploads import (
+    COMMITTED,
+    CREATE_UPLOAD_QUERY,
+    DELETE_EXPIRED_UPLOADS_QUERY,
+    OPEN,
+    PUT_CHUNK_QUERY,
+    UPLOAD_MODES,
+    UploadStatus,
+    _fetch_chunk_data,
+    _fetch_upload,
+    _missing_chunk_ids,
+)
 
 
-def _reconcile(pk_column, existing_table, target_table):
+def _reconcile(pk_column, existing_table, target_table, *, vectorized=True):
     "matches the rows by primary key column and returns a dataframe containing new rows, a dataframe containing rows in need of updating and the list of IDs of rows which should be deleted"
 
+    if vectorized:
+        new_rows, updated_rows, to_delete, _ = _reconcile_with_changed_columns(
+            pk_column, existing_table, target_table
+        )
+        return new_rows, updated_rows, to_delete
+    else:
+        _check_target_columns(pk_column, existing_table, target_table)
+        return _reconcile_by_row(pk_column, existing_table, target_table)
+
+
+def _reconcile_with_changed_columns(pk_column, existing_table, target_table):
+    """
+    Same as _reconcile, but also returns a boolean dataframe with the same index as the updated rows and a column
+    for each non-primary key column, which is True where that value changed.
+    """
+    _check_target_columns(pk_column, existing_table, target_table)
+    return _reconcile_by_column(pk_column, existing_table, target_table)
+
+
+def _check_target_columns(pk_column, existing_table, target_table):
     # verify that there are no extra columns in target_table
     extra_columns = set(target_table.columns).difference(existing_table.columns)
     assert (
@@ -23,6 +77,10 @@ def _reconcile(pk_column, existing_table, target_table):
         ):  # if cols have non-null values
             assert target_table.dtypes[col] == existing_table.dtypes[col]
 
+
+def _reconcile_by_row(pk_column, existing_table, target_table):
+    "the original row-at-a-time implementation of _reconcile. Slow on large tables, but kept for validating _reconcile_by_column"
+
     # convert rows to dicts and index by primary key
     existing_rows = {
         row[pk_column]: _to_pythonic_hashable_types(row)
@@ -49,6 +107,89 @@ def _reconcile(pk_column, existing_table, target_table):
     return pd.DataFrame(new_rows), updated_rows, to_delete
 
 
+def _reconcile_by_column(pk_column, existing_table, target_table):
+    """
+    columnar implementation of _reconcile. Rows are aligned on the primary key via the index and
+    each column is compared as a whole. Only the rows which end up in the result are converted to
+    pythonic types.
+    """
+    target_pks = target_table[pk_column]
+    existing_pks = existing_table[pk_column]
+
+    # isin gives a nullable boolean series for nullable key types (ie: Int64), so ask for plain bools
+    is_existing = target_pks.isin(existing_pks).to_numpy(dtype=bool)
+
+    # line up the existing rows with the target rows which share a primary key. If the existing table has
+    # duplicate keys, the last one wins (the same as building a dict keyed by primary key)
+    matched_targets = target_table[is_existing]
+    existing_by_pk = existing_table.drop_duplicates(pk_column, keep="last").set_index(
+        pk_column
+    )
+    matched_existing = existing_by_pk.reindex(matched_targets[pk_column])
+
+    value_columns = [col for col in target_table.columns if col != pk_column]
+    if value_columns:
+        changed_values = pd.DataFrame(
+            {
+                col: ~_values_equal(matched_targets[col], matched_existing[col])
+                for col in value_columns
+            },
+            columns=value_columns,
+            dtype=bool,
+        )
+    else:
+        # only the primary key was given, so there's nothing which could have changed
+        changed_values = pd.DataFrame(index=range(len(matched_targets)), dtype=bool)
+    is_changed = changed_values.any(axis=1).to_numpy(dtype=bool)
+
+    new_rows = _to_pythonic_dataframe(target_table[~is_existing])
+    updated_rows = pd.DataFrame(
+        _to_pythonic_dataframe(matched_targets[is_changed]),
+        columns=target_table.columns,
+    )
+    changed_columns = changed_values[is_changed].reset_index(drop=True)
+    to_delete = set(
+        _to_pythonic_hashable_type(id)
+        for id in existing_pks[~existing_pks.isin(target_pks).to_numpy(dtype=bool)]
+    )
+    return new_rows, updated_rows, to_delete, changed_columns
+
+
+def _to_pythonic_dataframe(df):
+    "Convert all values in the dataframe to pythonic hashable types, in the same way _reconcile_by_row does"
+    return pd.DataFrame(
+        [_to_pythonic_hashable_types(row) for row in df.to_dict("records")]
+    )
+
+
+def _values_equal(a, b):
+    """
+    null-aware elementwise comparison of two series of the same length. Returns a boolean numpy array which is
+    True where the values are the same or both are null. Lists are compared by their string representation, the
+    same way _to_pythonic_hashable_type represents them.
+    """
+    a_is_null = a.isna().to_numpy()
+    b_is_null = b.isna().to_numpy()
+    result = a_is_null & b_is_null
+    both_present = ~(a_is_null | b_is_null)
+    result[both_present] = _comparable_values(a[both_present]) == _comparable_values(
+        b[both_present]
+    )
+    return result
+
+
+def _comparable_values(values):
+    "Convert a series without nulls to a numpy array which can be compared elementwise with =="
+    if values.dtype == object:
+        return values.map(_to_pythonic_hashable_type).to_numpy(dtype=object)
+    numpy_dtype = getattr(values.dtype, "numpy_dtype", None)
+    if numpy_dtype is not None:
+        # nullable extension types (ie: Int64, boolean) can be converted to their numpy equivalent now that
+        # we know there are no nulls
+        return values.to_numpy(dtype=numpy_dtype)
+    return values.to_numpy()
+
+
 def _to_pythonic_hashable_types(row: dict):
     """Convert a row of values to pythonic hashable types"""
     assert type(row) == dict
@@ -70,24 +211,135 @@ def _to_pythonic_hashable_type(x):
     return x
 
 
-def _update_table(cursor, table_name, pk_column, updated_rows):
+# updating at least this many rows goes through a temporary table loaded with COPY instead of a VALUES list
+COPY_UPDATE_THRESHOLD = 1000
+
+# the number of rows sent in each UPDATE ... FROM (VALUES ...) statement
+UPDATE_VALUES_PAGE_SIZE = 500
+
+
+def _update_table(
+    cursor,
+    table_name,
+    pk_column,
+    updated_rows,
+    changed_columns=None,
+    copy_threshold=None,
+    column_types=None,
+):
+    """
+    Update the rows in table_name which match the primary keys of updated_rows with set based UPDATE ... FROM
+    statements. If changed_columns (a boolean dataframe with the same index as updated_rows and a column per non-pk
+    column) is provided, only the values flagged as changed are written: rows are grouped by which columns changed
+    and each group only sets those columns. `column_types` maps column name to postgres type and is looked up if
+    not provided. Returns the number of rows updated.
+    """
+    if copy_threshold is None:
+        copy_threshold = COPY_UPDATE_THRESHOLD
+
     columns = sorted(set(updated_rows.columns).difference([pk_column]))
-    column_assignments = ", ".join([f"{col} = %s" for col in columns])
-    params = []
-    for row in updated_rows.to_records():
-        params.append(
-            [_to_pythonic_hashable_type(row[col]) for col in columns]
-            + [_to_pythonic_hashable_type(row[pk_column])]
+    if len(updated_rows) == 0 or len(columns) == 0:
+        return 0
+
+    if changed_columns is None:
+        groups = [(columns, updated_rows)]
+    else:
+        patterns, group_ids = np.unique(
+            changed_columns[columns].to_numpy(dtype=bool),
+            axis=0,
+            return_inverse=True,
         )
+        groups = [
+            (
+                [col for col, changed in zip(columns, pattern) if changed],
+                updated_rows[group_ids.reshape(-1) == i],
+            )
+            for i, pattern in enumerate(patterns)
+        ]
+
+    updated_row_count = 0
+    for group_columns, rows in groups:
+        if len(group_columns) == 0:
+            continue
+        if len(rows) >= copy_threshold:
+            updated_row_count += _update_via_temporary_table(
+                cursor, table_name, pk_column, rows[[pk_column] + group_columns]
+            )
+        else:
+            if column_types is None:
+                column_types = _get_table_metadata(cursor, table_name).column_types
+            updated_row_count += _update_via_values(
+                cursor,
+                table_name,
+                pk_column,
+                rows[[pk_column] + group_columns],
+                column_types,
+            )
+    return updated_row_count
 
-    execute_batch(
-        cursor,
-        f"UPDATE {table_name} SET {column_assignments} WHERE {pk_column} = %s",
-        params,
+
+def _update_via_values(cursor, table_name, pk_column, rows, column_types):
+    "update the rows with UPDATE ... FROM (VALUES ...) statements. The first column of rows must be the primary key"
+    # the columns of a VALUES list are named column1, column2, etc and their types are inferred from the values, so
+    # cast each one to the type of the column it's being written to
+    column_assignments = ", ".join(
+        [
+            f"{col} = CAST(v.column{i + 1} AS {_column_type(column_types, table_name, col)})"
+            for i, col in enumerate(rows.columns)
+            if col != pk_column
+        ]
+    )
+    pk_type = _column_type(column_types, table_name, pk_column)
+    sql = f"UPDATE {table_name} AS t SET {column_assignments} FROM (VALUES %s) AS v WHERE t.{pk_column} = CAST(v.column1 AS {pk_type})"
+
+    params = [
+        [_to_pythonic_hashable_type(x) for x in row]
+        for row in rows.itertuples(index=False)
+    ]
+    updated_row_count = 0
+    for start in range(0, len(params), UPDATE_VALUES_PAGE_SIZE):
+        page = params[start : start + UPDATE_VALUES_PAGE_SIZE]
+        execute_values(cursor, sql, page, page_size=len(page))
+        updated_row_count += cursor.rowcount
+    return updated_row_count
+
+
+UPDATE_TABLE_NAME = "gumbo_update_rows"
+
+
+def _update_via_temporary_table(cursor, table_name, pk_column, rows):
+    "update the rows by loading them into a temporary table with COPY and running a single UPDATE ... FROM"
+    column_names = ", ".join(rows.columns)
+    column_assignments = ", ".join(
+        [f"{col} = u.{col}" for col in rows.columns if col != pk_column]
     )
 
+    cursor.execute(f"DROP TABLE IF EXISTS {UPDATE_TABLE_NAME}")
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {UPDATE_TABLE_NAME} AS SELECT {column_names} FROM {table_name} WITH NO DATA"
+    )
+    try:
+        _copy_rows(cursor, UPDATE_TABLE_NAME, rows)
+        cursor.execute(
+            f"UPDATE {table_name} AS t SET {column_assignments} FROM {UPDATE_TABLE_NAME} AS u WHERE t.{pk_column} = u.{pk_column}"
+        )
+        updated_row_count = cursor.rowcount
+    finally:
+        cursor.execute(f"DROP TABLE IF EXISTS {UPDATE_TABLE_NAME}")
+    return updated_row_count
+
+
+# inserting at least this many rows goes through COPY instead of a multi-row INSERT statement
+COPY_INSERT_THRESHOLD = 1000
+
+
+def _insert_table(cursor, table_name, new_rows, copy_threshold=None):
+    if copy_threshold is None:
+        copy_threshold = COPY_INSERT_THRESHOLD
+    if len(new_rows) >= copy_threshold:
+        _copy_rows(cursor, table_name, new_rows)
+        return
 
-def _insert_table(cursor, table_name, new_rows):
     values = []
     for row in new_rows.to_records():
         values.append(
@@ -100,55 +352,390 @@ def _insert_table(cursor, table_name, new_rows):
     )
 
 
-def _delete_rows(cursor, table_name, pk_column, ids):
-    params = [[id] for id in ids]
-    execute_batch(cursor, f"DELETE FROM {table_name} WHERE {pk_column} = %s", params)
+# the number of primary keys sent in each DELETE statement
+DELETE_CHUNK_SIZE = 10000
+
+
+def _delete_rows(cursor, table_name, pk_column, pk_type, ids, chunk_size=None):
+    """
+    Delete the rows with the given primary keys. Returns the number of rows which were actually deleted.
+
+    The keys are sent as an array cast to the key's type, as otherwise a list of strings is a text[] which can't be
+    compared with (for example) a uuid or date key.
+    """
+    if chunk_size is None:
+        chunk_size = DELETE_CHUNK_SIZE
+
+    ids = [_to_pythonic_hashable_type(id) for id in ids]
+    deleted_row_count = 0
+    for start in range(0, len(ids), chunk_size):
+        cursor.execute(
+            f"DELETE FROM {table_name} WHERE {pk_column} = ANY(CAST(%s AS {pk_type}[]))",
+            [ids[start : start + chunk_size]],
+        )
+        deleted_row_count += cursor.rowcount
+    return deleted_row_count
+
+
+def _copy_text_value(x):
+    "Encode a single value as a field in postgres's COPY text format"
+    x = _to_pythonic_hashable_type(x)
+    if x is None:
+        return "\\N"
+    if isinstance(x, bool):
+        return "t" if x else "f"
+    if isinstance(x, float) and x.is_integer():
+        # integer columns with missing values come back from pandas as floats, and postgres won't accept "1.0"
+        # as an integer in COPY (unlike in an INSERT statement)
+        x = int(x)
+    if isinstance(x, dict):
+        x = json.dumps(x)
+    return (
+        str(x)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_text_column(values):
+    "Encode a series as a list of fields in postgres's COPY text format"
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(
+        values.dtype
+    ):
+        # numbers never need escaping, so convert the whole column at once
+        is_null = values.isna().to_numpy()
+        fields = values.astype(str).to_numpy(dtype=object)
+        if pd.api.types.is_float_dtype(values.dtype):
+            # write integral floats without the decimal point, for the same reason as in _copy_text_value
+            numbers = values.to_numpy(dtype="float64", na_value=np.nan)
+            with np.errstate(invalid="ignore"):
+                is_integral = (np.mod(numbers, 1) == 0) & (np.abs(numbers) < 2**53)
+            fields[is_integral] = numbers[is_integral].astype("int64").astype(str)
+        fields[is_null] = "\\N"
+        return fields.tolist()
+    return [_copy_text_value(x) for x in values]
+
+
+def _iter_copy_text(df, rows_per_chunk=10000):
+    "Generate the rows of df in postgres's COPY text format, a chunk of rows at a time"
+    for start in range(0, len(df), rows_per_chunk):
+        chunk = df.iloc[start : start + rows_per_chunk]
+        columns = [_copy_text_column(chunk[col]) for col in chunk.columns]
+        yield "".join("\t".join(fields) + "\n" for fields in zip(*columns))
+
+
+class _CopyTextStream:
+    "A read-only file-like object which encodes a dataframe for COPY FROM STDIN as it is consumed"
+
+    def __init__(self, df):
+        self._chunks = _iter_copy_text(df)
+        # the chunk being read and how much of it has been read. Keeping an offset rather than slicing off what
+        # was read means each read only copies what it returns, instead of the rest of the chunk
+        self._chunk = ""
+        self._offset = 0
+
+    def read(self, size=-1):
+        parts = []
+        remaining = size
+        while size < 0 or remaining > 0:
+            if self._offset >= len(self._chunk):
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._chunk, self._offset = chunk, 0
+            if size < 0:
+                part = self._chunk[self._offset :]
+            else:
+                part = self._chunk[self._offset : self._offset + remaining]
+                remaining -= len(part)
+            self._offset += len(part)
+            parts.append(part)
+        return "".join(parts)
+
+
+# how much copy_expert reads from the stream at a time (its default is 8KB)
+COPY_READ_SIZE = 1024 * 1024
+
+
+def _copy_rows(cursor, table_name, df):
+    "Bulk load the rows of df into table_name with COPY FROM STDIN"
+    column_names = ", ".join(df.columns)
+    cursor.copy_expert(
+        f"COPY {table_name} ({column_names}) FROM STDIN",
+        _CopyTextStream(df),
+        size=COPY_READ_SIZE,
+    )
+
+
+STAGING_TABLE_NAME = "gumbo_update_staging"
+
+
+def _update_via_staging_table(
+    cursor, table_name, pk_column, new_df, delete_missing_rows=False
+):
+    """
+    Bulk load new_df into a temporary staging table and then apply the (optional) deletes and a single
+    INSERT ... ON CONFLICT DO UPDATE, so that the diff is computed by postgres. Returns a tuple of the keys of the
+    rows inserted, updated and deleted. Must be run in a transaction (see _update_server_side).
+    """
+    assert pk_column in set(
+        new_df.columns
+    ), f"Missing primary key column in data frame: {pk_column}"
+
+    columns = list(new_df.columns)
+    other_columns = [col for col in columns if col != pk_column]
+    column_names = ", ".join(columns)
+
+    cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE_NAME}")
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {STAGING_TABLE_NAME} AS SELECT {column_names} FROM {table_name} WITH NO DATA"
+    )
+    _copy_rows(cursor, STAGING_TABLE_NAME, new_df)
+    cursor.execute(f"ANALYZE {STAGING_TABLE_NAME}")
+
+    deleted_keys = []
+    if delete_missing_rows:
+        cursor.execute(
+            f"DELETE FROM {table_name} t WHERE NOT EXISTS (SELECT 1 FROM {STAGING_TABLE_NAME} s WHERE s.{pk_column} = t.{pk_column}) RETURNING t.{pk_column}"
+        )
+        deleted_keys = [key for (key,) in cursor.fetchall()]
+
+    if len(other_columns) > 0:
+        column_assignments = ", ".join(
+            [f"{col} = EXCLUDED.{col}" for col in other_columns]
+        )
+        # compare the text representation of the rows because not every type (ie: json) has an equality operator
+        existing_values = ", ".join([f"t.{col}" for col in other_columns])
+        staged_values = ", ".join([f"EXCLUDED.{col}" for col in other_columns])
+        on_conflict = f"DO UPDATE SET {column_assignments} WHERE ROW({existing_values})::text IS DISTINCT FROM ROW({staged_values})::text"
+    else:
+        on_conflict = "DO NOTHING"
+    # insert the new rows and update the changed ones in one statement. Rows which are unchanged aren't
+    # returned, and xmax is only 0 for a row which was just inserted
+    cursor.execute(
+        f"INSERT INTO {table_name} AS t ({column_names}) SELECT {column_names} FROM {STAGING_TABLE_NAME} ON CONFLICT ({pk_column}) {on_conflict} RETURNING t.{pk_column}, t.xmax = 0"
+    )
+    inserted_keys = []
+    updated_keys = []
+    for key, inserted in cursor.fetchall():
+        (inserted_keys if inserted else updated_keys).append(key)
+    # only dropped on success: after a failure the transaction can only be rolled back, which drops it anyway
+    cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE_NAME}")
+
+    return inserted_keys, updated_keys, deleted_keys
+
+
+# how much of the table GumboDAO.update reads back afterwards to check that the table ended up as intended
+VERIFY_OFF = "off"
+# a random sample of the rows which were written or deleted
+VERIFY_SAMPLED = "sampled"
+# every row which was written or deleted
+VERIFY_TOUCHED = "touched"
+# the whole table
+VERIFY_FULL = "full"
+VERIFICATION_LEVELS = (VERIFY_OFF, VERIFY_SAMPLED, VERIFY_TOUCHED, VERIFY_FULL)
+
+# the number of written (and of deleted) rows checked by "sampled" verification
+VERIFY_SAMPLE_SIZE = 1000
+
+# the number of primary keys looked up by each SELECT when reading rows back to verify them
+READ_BY_KEY_CHUNK_SIZE = 10000
+
+
+def _read_rows_by_key(connection, table_name, pk_column, pk_type, column_names, keys):
+    "Read the given columns of the rows with the given primary keys (cast to pk_type, as in _delete_rows)"
+    keys = [_to_pythonic_hashable_type(key) for key in keys]
+    query = f"SELECT {', '.join(column_names)} FROM {table_name} WHERE {pk_column} = ANY(CAST(%s AS {pk_type}[]))"
+    chunks = [
+        _read_sql(connection, query, [keys[start : start + READ_BY_KEY_CHUNK_SIZE]])
+        for start in range(0, len(keys), READ_BY_KEY_CHUNK_SIZE)
+    ]
+    if not chunks:
+        return pd.DataFrame(columns=column_names)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _assert_rows_match(pk_column, expected_df, actual_df):
+    "Check that every row of expected_df is in actual_df with the same values, matching rows up by primary key"
+    expected = expected_df.drop_duplicates(pk_column, keep="last").set_index(pk_column)
+    actual = actual_df.drop_duplicates(pk_column, keep="last").set_index(pk_column)
+
+    missing_keys = expected.index.difference(actual.index)
+    assert (
+        len(missing_keys) == 0
+    ), f"Sanity check failed: after update these rows were missing: {list(missing_keys[:10])}"
+
+    actual = actual.reindex(expected.index)
+    for col in expected.columns:
+        matches = _values_equal(expected[col], actual[col])
+        assert (
+            matches.all()
+        ), f'Sanity check failed: after update column "{col}" was different than expected for the rows {list(expected.index[~matches][:10])}'
+
+
+def _assert_rows_absent(pk_column, deleted_keys, actual_df):
+    remaining = set(actual_df[pk_column]).intersection(deleted_keys)
+    assert (
+        len(remaining) == 0
+    ), f"Sanity check failed: after update these rows were not deleted: {sorted(remaining)[:10]}"
+
+
+def _count_rows(connection, table_name):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT count(*) FROM {table_name}")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def _get_table_metadata(cursor, table_name) -> TableMetadata:
+    metadata = _fetch_table_metadata(cursor, table_name)
+    assert metadata is not None, f"Unknown table: {table_name}"
+    return metadata
+
+
+@contextmanager
+def _transaction(connection):
+    "Run the block in a single transaction, even if the connection is in autocommit mode"
+    if not getattr(connection, "autocommit", False):
+        # the caller is already managing the transaction
+        yield
+        return
+
+    connection.autocommit = False
+    try:
+        yield
+        connection.commit()
+    except:
+        connection.rollback()
+        raise
+    finally:
+        connection.autocommit = True
+
+
+def _iter_sql_chunks(connection, query, params, chunk_rows) -> Iterator[pd.DataFrame]:
+    """
+    Run a select with a server side cursor and yield the result as dataframes of up to chunk_rows rows, so only
+    one chunk is held in memory at a time. At least one (possibly empty) dataframe is always yielded.
+    """
+    with _transaction(connection):
+        # a server side cursor only lives as long as its transaction
+        cursor = connection.cursor(name=f"gumbo_chunks_{uuid.uuid4().hex}")
+        try:
+            cursor.execute(query, params)
+            first = True
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows and not first:
+                    break
+                # the same conversion pd.read_sql makes
+                yield pd.DataFrame.from_records(
+                    rows,
+                    columns=[column[0] for column in cursor.description],
+                    coerce_float=True,
+                )
+                first = False
+                if len(rows) < chunk_rows:
+                    break
+        finally:
+            cursor.close()
 
 
-def _both_empty(a, b):
-    return pd.isna(a) and pd.isna(b)
+def _invalid_filter_values_as_value_errors(chunks):
+    # a data error while reading means a filter value couldn't be cast to its column's type, which is the
+    # caller's mistake (the same as in GumboDAO.get)
+    try:
+        yield from chunks
+    except psycopg2.DataError as e:
+        raise ValueError(f"Invalid filter value: {e}") from e
+
+
+def _read_sql(connection, query, params=None) -> pd.DataFrame:
+    "run a select with psycopg2 style (%s) parameters and return the result as a dataframe"
+    return pd.read_sql(query, connection, params=params)
 
 
-def _assert_dataframes_match(a, b):
-    assert (a.columns == b.columns).all()
-    mismatches = 0
-    for col in a.columns:
-        assert len(a) == len(b)
-        for ia, ib in zip(a[col], b[col]):
-            if ia != ib and not _both_empty(ia, ib):
-                print(f"mismatch in {col}: {ia} != {ib}")
-                mismatches += 1
-    assert mismatches == 0
-    #     matches = new_df[col] == final_df[col]
+# the comparisons which can be used in the filters passed to GumboDAO.get. "in" takes a list of values
+FILTER_OPERATORS = ("=", "<", "<=", ">", ">=", "in")
 
-    #     assert (
-    #         matches
-    #     ).all(), f'Sanity check failed: After update column "{col}" was different then expected: {new_df[col][~matches]} != {final_df[col][~matches]}'
 
+def _catalog_column_name(column_types, table_name, column_name):
+    "returns the name the column has in column_types (which is keyed by the names in the catalog)"
+    if column_name in column_types:
+        return column_name
+    # unquoted identifiers are case insensitive
+    names_by_lower = {name.lower(): name for name in column_types}
+    name = names_by_lower.get(str(column_name).lower())
+    if name is None:
+        raise ValueError(f"{table_name} has no column {column_name!r}")
+    return name
 
-def _assert_has_subset_of_rows(subset_df, full_df):
-    # Convert dataframe values to hashable types
-    full_pythonic_df = full_df.applymap(_to_pythonic_hashable_type)
-    subset_pythonic_df = subset_df.applymap(_to_pythonic_hashable_type)
 
-    assert (subset_pythonic_df.columns == full_pythonic_df.columns).all()
-    assert len(subset_pythonic_df.merge(full_pythonic_df)) == len(subset_pythonic_df)
+def _column_type(column_types, table_name, column_name):
+    return column_types[_catalog_column_name(column_types, table_name, column_name)]
 
 
-# taken from https://wiki.postgresql.org/wiki/Retrieve_primary_key_columns
-PRIMARY_KEY_QUERY = """SELECT a.attname, format_type(a.atttypid, a.atttypmod) AS data_type
-FROM   pg_index i
-JOIN   pg_attribute a ON a.attrelid = i.indrelid
-                     AND a.attnum = ANY(i.indkey)
-WHERE  i.indrelid = %s::regclass
-AND    i.indisprimary;"""
+def _resolve_column(metadata: TableMetadata, column_name):
+    "returns the column's name as it appears in the catalog, quoted for use in a query"
+    name = _catalog_column_name(metadata.column_types, metadata.table_name, column_name)
+    return '"' + name.replace('"', '""') + '"', metadata.column_types[name]
 
 
-def _get_pk_column(cursor, table_name):
-    cursor.execute(PRIMARY_KEY_QUERY, [table_name])
-    rows = cursor.fetchall()
-    assert len(rows) == 1, f"expected 1 row, but got {rows}"
-    return rows[0][0]
+def _select_query(table_name, metadata: TableMetadata, columns=None, filters=None):
+    """
+    Build a select of the given columns (or all columns if None) from the table, keeping the rows which satisfy
+    every filter. Each filter is a (column, operator, value) tuple, where operator is one of FILTER_OPERATORS.
+
+    Column names are checked against the table's metadata and values are passed as parameters, so neither can
+    be used to inject SQL. Returns the query and its parameters.
+    """
+    if columns is None:
+        select_list = "*"
+    else:
+        if len(columns) == 0:
+            raise ValueError("At least one column must be selected")
+        select_list = ", ".join(
+            _resolve_column(metadata, column)[0] for column in columns
+        )
+
+    conditions = []
+    params = []
+    for column_filter in filters or []:
+        if len(column_filter) != 3:
+            raise ValueError(
+                f"Expected filter to be (column, operator, value) but got {column_filter!r}"
+            )
+        column, operator, value = column_filter
+        quoted_column, column_type = _resolve_column(metadata, column)
+        # cast the parameters so that values given as strings (ie: from a url) are compared as the column's type
+        placeholder = f"CAST(%s AS {column_type})"
+        if operator == "in":
+            if isinstance(value, (str, bytes)) or not hasattr(value, "__iter__"):
+                raise ValueError(
+                    f"Expected a list of values for 'in' but got {value!r}"
+                )
+            value = list(value)
+            if len(value) == 0:
+                conditions.append("1 = 0")
+            else:
+                placeholders = ", ".join([placeholder] * len(value))
+                conditions.append(f"{quoted_column} IN ({placeholders})")
+                params.extend(value)
+        elif operator in FILTER_OPERATORS:
+            conditions.append(f"{quoted_column} {operator} {placeholder}")
+            params.append(value)
+        else:
+            raise ValueError(
+                f"Unknown filter operator {operator!r}. Expected one of {FILTER_OPERATORS}"
+            )
+
+    query = f"select {select_list} from {table_name}"
+    if len(conditions) > 0:
+        query += " where " + " and ".join(conditions)
+    return query, params
 
 
 def _update(
@@ -159,27 +746,55 @@ def _update(
     username,
     delete_missing_rows=False,
     reason=None,
+    vectorized_reconcile=True,
+    metadata: Optional[TableMetadata] = None,
 ):
     cursor = connection.cursor()
 
     try:
-        pk_column = _get_pk_column(cursor, table_name)
+        if metadata is None:
+            metadata = _get_table_metadata(cursor, table_name)
+        pk_column = metadata.pk_column
 
-        new_rows, updated_rows, removed_rows = _reconcile(pk_column, cur_df, new_df)
+        if vectorized_reconcile:
+            (
+                new_rows,
+                updated_rows,
+                removed_rows,
+                changed_columns,
+            ) = _reconcile_with_changed_columns(pk_column, cur_df, new_df)
+        else:
+            new_rows, updated_rows, removed_rows = _reconcile(
+                pk_column, cur_df, new_df, vectorized=False
+            )
+            changed_columns = None
 
         _insert_table(cursor, table_name, new_rows)
-        _update_table(cursor, table_name, pk_column, updated_rows)
+        _update_table(
+            cursor,
+            table_name,
+            pk_column,
+            updated_rows,
+            changed_columns=changed_columns,
+            column_types=metadata.column_types,
+        )
+        deleted_row_count = 0
         if delete_missing_rows:
-            _delete_rows(cursor, table_name, pk_column, removed_rows)
+            deleted_row_count = _delete_rows(
+                cursor,
+                table_name,
+                pk_column,
+                metadata.column_types[pk_column],
+                removed_rows,
+            )
 
-        deleted_row_count = len(removed_rows) if delete_missing_rows else 0
         _log_bulk_update(
             connection,
             username,
             table_name,
-            updated_rows.shape[0],
-            new_rows.shape[0],
-            deleted_row_count,
+            rows_updated=updated_rows.shape[0],
+            rows_deleted=deleted_row_count,
+            rows_inserted=new_rows.shape[0],
             reason=reason,
         )
     except:
@@ -190,6 +805,50 @@ def _update(
         f"Inserted {len(new_rows)} rows, updated {len(updated_rows)} rows, and deleted {deleted_row_count} rows"
     )
 
+    # the keys of the rows written and of those deleted, for verifying the update
+    written_keys = list(new_rows.get(pk_column, [])) + list(updated_rows[pk_column])
+    deleted_keys = list(removed_rows) if delete_missing_rows else []
+    return written_keys, deleted_keys
+
+
+def _update_server_side(
+    connection,
+    table_name,
+    new_df,
+    username,
+    delete_missing_rows=False,
+    reason=None,
+    metadata: Optional[TableMetadata] = None,
+):
+    "Returns the keys of the rows written and of those deleted, like _update"
+    # apply the whole change (and log it) in one transaction, so a failure part way through leaves no trace
+    with _transaction(connection):
+        cursor = connection.cursor()
+        try:
+            if metadata is None:
+                metadata = _get_table_metadata(cursor, table_name)
+            pk_column = metadata.pk_column
+
+            inserted_keys, updated_keys, deleted_keys = _update_via_staging_table(
+                cursor, table_name, pk_column, new_df, delete_missing_rows
+            )
+
+            _log_bulk_update(
+                connection,
+                username,
+                table_name,
+                rows_updated=len(updated_keys),
+                rows_deleted=len(deleted_keys),
+                rows_inserted=len(inserted_keys),
+                reason=reason,
+            )
+        finally:
+            cursor.close()
+    print(
+        f"Inserted {len(inserted_keys)} rows, updated {len(updated_keys)} rows, and deleted {len(deleted_keys)} rows"
+    )
+    return inserted_keys + updated_keys, deleted_keys
+
 
 def _log_bulk_update(
     connection,
@@ -210,59 +869,360 @@ def _log_bulk_update(
 
 
 class GumboDAO:
-    def __init__(self, connection, *, sanity_check=False):
+    def __init__(
+        self,
+        connection,
+        *,
+        sanity_check=False,
+        vectorized_reconcile=True,
+        metadata_cache: Optional[TableMetadataCache] = None,
+        audit_table=AUDIT_TABLE,
+        verification=None,
+    ):
+        """
+        `verification` is how much of the table `update` reads back afterwards to check that the table ended up
+        as intended: "off", "sampled" (a sample of the rows written or deleted), "touched" (every row written or
+        deleted) or "full" (the whole table). If None, `sanity_check` picks "touched" (if True) or "off".
+
+        `vectorized_reconcile` controls how `update` works out which rows changed. Set it to False to fall back to
+        the original row-by-row comparison (useful for validating the columnar one).
+
+        `metadata_cache` holds the primary keys and column types of the tables. If not provided, this DAO gets its
+        own cache. Pass in the same cache to share it between DAOs for different connections to the same database.
+
+        `audit_table` is the table the audit triggers record changes in, which `get_changes` reads.
+        """
         self.sanity_check = sanity_check
+        if verification is None:
+            verification = VERIFY_TOUCHED if sanity_check else VERIFY_OFF
+        if verification not in VERIFICATION_LEVELS:
+            raise ValueError(f"Invalid verification level {verification}")
+        self.verification = verification
+        self.vectorized_reconcile = vectorized_reconcile
         self.connection = connection
+        if metadata_cache is None:
+            metadata_cache = TableMetadataCache()
+        self.metadata_cache = metadata_cache
+        self.audit_table = audit_table
 
     def _set_username(self, username):
         with self.connection.cursor() as cursor:
             print("setting username to", username)
             cursor.execute("SET my.username=%s", [username])
 
-    def get(self, table_name) -> Optional[pd.DataFrame]:
+    def warm_metadata_cache(self):
+        "Load the metadata of every table into the metadata cache with a single query"
         cursor = self.connection.cursor()
+        try:
+            self.metadata_cache.warm(cursor)
+        finally:
+            cursor.close()
+
+    def get_table_metadata(self, table_name) -> Optional[TableMetadata]:
+        "Returns the (cached) metadata of the given table or view, or None if it doesn't exist"
+        cursor = self.connection.cursor()
+        try:
+            return self.metadata_cache.get(cursor, table_name)
+        finally:
+            cursor.close()
+
+    def _get_existing_table_metadata(self, table_name) -> TableMetadata:
+        metadata = self.get_table_metadata(table_name)
+        assert metadata is not None, f"Unknown table: {table_name}"
+        return metadata
+
+    def get(self, table_name, *, columns=None, filters=None) -> Optional[pd.DataFrame]:
+        """
+        Returns the table (or None if it doesn't exist) ordered by its primary key.
+
+        `columns` limits the result to the named columns, and `filters` to the rows matching every one of a list
+        of (column, operator, value) tuples. The operator is one of "=", "<", "<=", ">", ">=" or "in" (which takes
+        a list of values). For example: `filters=[("intcol", ">=", 5), ("id", "in", ["a", "b"])]`. A ValueError
+        is raised for unknown columns or operators.
+        """
+        metadata = self.get_table_metadata(table_name)
+        if metadata is None:
+            return None
+
+        select_query, params = _select_query(table_name, metadata, columns, filters)
+        # If a primary key exists, use it to sort the table
+        # Views don't have primary keys to use here, and that's fine.
+        if len(metadata.pk_columns) == 1:
+            select_query += f" order by {metadata.pk_column}"
+        try:
+            return _read_sql(self.connection, select_query, params or None)
+        except Exception as e:
+            # pandas wraps the database's error. A data error here means a filter value couldn't be cast to its
+            # column's type, which is the caller's mistake
+            if isinstance(e.__cause__, psycopg2.DataError):
+                raise ValueError(f"Invalid filter value: {e.__cause__}") from e
+            raise
+
+    def iter_chunks(
+        self, table_name, *, columns=None, filters=None, chunk_rows=10000
+    ) -> Optional[Iterator[pd.DataFrame]]:
+        """
+        Like `get`, but returns an iterator over the rows of the table as dataframes of up to `chunk_rows` rows,
+        which are read from a server side cursor as the iterator is consumed. Returns None if the table doesn't
+        exist, and raises a ValueError for invalid columns or filters before anything is read. The query only runs
+        once the first chunk is asked for, so a filter value which can't be cast to its column's type raises a
+        ValueError then.
+
+        The rows are read in a single transaction, so the connection can't be used for anything else until the
+        iterator is exhausted or closed.
+        """
+        metadata = self.get_table_metadata(table_name)
+        if metadata is None:
+            return None
+
+        select_query, params = _select_query(table_name, metadata, columns, filters)
+        if len(metadata.pk_columns) == 1:
+            select_query += f" order by {metadata.pk_column}"
+        return _invalid_filter_values_as_value_errors(
+            _iter_sql_chunks(self.connection, select_query, params or None, chunk_rows)
+        )
+
+    def get_page(
+        self, table_name, *, after=None, limit=10000
+    ) -> Optional[pd.DataFrame]:
+        """
+        Returns up to `limit` rows of the table ordered by its primary key, starting with the first row whose key is
+        greater than `after` (or from the beginning if `after` is None). Pass the key of the last row returned as
+        `after` to get the next page. Returns None if the table doesn't exist.
+
+        Each page is found with a range scan of the primary key index, so fetching a page costs the same no matter
+        how far into the table it is. The table must have a single primary key column.
+        """
+        metadata = self.get_table_metadata(table_name)
+        if metadata is None:
+            return None
+
+        pk_column = metadata.pk_column
         select_query = f"select * from {table_name}"
+        params = []
+        if after is not None:
+            select_query += (
+                f" where {pk_column} > CAST(%s AS {metadata.column_types[pk_column]})"
+            )
+            params.append(after)
+        select_query += f" order by {pk_column} limit %s"
+        params.append(int(limit))
+        return _read_sql(self.connection, select_query, params)
+
+    def get_table_version(self, table_name) -> Optional[str]:
+        """
+        Returns a token which changes whenever the table's contents or columns change, or None if the table
+        doesn't exist or isn't audited. This is cheap compared to reading the table, so it can be used to check
+        whether a cached copy is still current.
+        """
+        metadata = self.get_table_metadata(table_name)
+        if metadata is None:
+            return None
 
+        cursor = self.connection.cursor()
         try:
-            pk_column = _get_pk_column(cursor, table_name)
-            select_query += f" order by {pk_column}"
-        except UndefinedTable:
+            version = _fetch_table_version(cursor, self.audit_table, table_name)
+        except psycopg2.errors.UndefinedTable:
+            # no audit log to tell when the table changed
             return None
-        except AssertionError:
-            # If a primary key exists, use it to sort the table
-            # Views don't have primary keys to use here, and that's fine.
-            pass
         finally:
             cursor.close()
-        return pd.read_sql(select_query, self.connection)
+
+        columns = ",".join(
+            f"{name}:{type}" for name, type in metadata.column_types.items()
+        )
+        return f"{version}/{hashlib.sha1(columns.encode('utf8')).hexdigest()}"
+
+    def get_changes(self, table_name, since=None) -> Optional[TableChanges]:
+        """
+        Returns the rows inserted, updated or deleted since the watermark `since` (as returned in a previous
+        TableChanges), along with a new watermark. If `since` is None, or the table has been truncated since, the
+        whole table is returned with `full_refresh` set. Returns None if the table doesn't exist.
+
+        The changed keys are found in the audit log, so only the changed rows are read from the table. The
+        watermark is the oldest transaction which was still running, so a change can be reported twice but is
+        never missed. The table must have a single primary key column and an audit trigger.
+        """
+        metadata = self.get_table_metadata(table_name)
+        if metadata is None:
+            return None
+
+        quoted_pk_column, pk_type = _resolve_column(metadata, metadata.pk_column)
+        cursor = self.connection.cursor()
+        try:
+            # read the watermark first, so anything which changes while the rows are read is picked up next time
+            watermark = _fetch_watermark(cursor)
+            if since is None:
+                full_refresh = True
+            else:
+                full_refresh, keys = _fetch_changed_keys(
+                    cursor, self.audit_table, table_name, metadata.pk_column, since
+                )
+        finally:
+            cursor.close()
+
+        if full_refresh:
+            keys = []
+            upserted = self.get(table_name)
+        else:
+            upserted = self.get(table_name, filters=[(metadata.pk_column, "in", keys)])
+        deleted = _read_sql(
+            self.connection,
+            _deleted_keys_query(table_name, quoted_pk_column, pk_type),
+            [keys],
+        )
+        return TableChanges(
+            watermark=watermark,
+            full_refresh=full_refresh,
+            upserted=upserted,
+            deleted=deleted,
+        )
+
+    def get_fingerprint(
+        self, table_name, *, columns=None, row_hashes=False
+    ) -> Optional[TableFingerprint]:
+        """
+        Returns a digest of the table's contents, computed by the database so no rows are read, or None if the
+        table doesn't exist. With `row_hashes=True` the hash of every row is returned as well, keyed by primary key,
+        so that two fingerprints of the table can be compared to find exactly which rows changed. `columns` limits
+        the hashes to the named columns. The table must have a single primary key column.
+        """
+        metadata = self.get_table_metadata(table_name)
+        if metadata is None:
+            return None
+
+        quoted_pk_column, _ = _resolve_column(metadata, metadata.pk_column)
+        if columns is None:
+            columns = list(metadata.column_types)
+        quoted_columns = [_resolve_column(metadata, column)[0] for column in columns]
+
+        if row_hashes:
+            hashes = _read_sql(
+                self.connection,
+                _row_hashes_query(table_name, quoted_pk_column, quoted_columns),
+            )
+            return TableFingerprint(
+                digest=_digest(hashes[ROW_HASH_COLUMN]),
+                row_count=len(hashes),
+                row_hashes=hashes,
+            )
+
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(_digest_query(table_name, quoted_pk_column, quoted_columns))
+            row_count, digest = cursor.fetchone()
+        finally:
+            cursor.close()
+        return TableFingerprint(digest=digest, row_count=row_count, row_hashes=None)
 
     def update(
-        self, username, table_name, new_df, *, delete_missing_rows=False, reason=None
+        self,
+        username,
+        table_name,
+        new_df,
+        *,
+        delete_missing_rows=False,
+        reason=None,
+        server_side=False,
     ):
+        """
+        Make the table match new_df: insert new rows, update changed rows and, if delete_missing_rows is set,
+        delete rows which are not in new_df.
+
+        By default the current table is downloaded and diffed against new_df in python. With server_side=True,
+        new_df is instead bulk loaded into a temporary staging table and the diff is computed and applied by
+        postgres (with a single INSERT ... ON CONFLICT DO UPDATE, in one transaction), so only the changes are ever
+        materialized.
+        """
         self._set_username(username)
+        metadata = self._get_existing_table_metadata(table_name)
 
-        cur_df = self.get(table_name)
+        if server_side:
+            written_keys, deleted_keys = _update_server_side(
+                self.connection,
+                table_name,
+                new_df,
+                username,
+                delete_missing_rows,
+                reason=reason,
+                metadata=metadata,
+            )
+        else:
+            cur_df = self.get(table_name)
 
-        result = _update(
-            self.connection,
+            written_keys, deleted_keys = _update(
+                self.connection,
+                table_name,
+                cur_df,
+                new_df,
+                username,
+                delete_missing_rows,
+                reason=reason,
+                vectorized_reconcile=self.vectorized_reconcile,
+                metadata=metadata,
+            )
+
+        self._verify_update(
             table_name,
-            cur_df,
+            metadata.pk_column,
+            metadata.column_types[metadata.pk_column],
             new_df,
-            username,
+            written_keys,
+            deleted_keys,
             delete_missing_rows,
-            reason=reason,
         )
-        if self.sanity_check:
-            # if we want to be paranoid, fetch the dataframe back and verify that it's the same as what we said we
-            # wanted to target.
+
+    def _verify_update(
+        self,
+        table_name,
+        pk_column,
+        pk_type,
+        new_df,
+        written_keys,
+        deleted_keys,
+        delete_missing_rows,
+    ):
+        "read rows back from the table (how many depends on self.verification) and check they're what new_df says"
+        if self.verification == VERIFY_OFF:
+            return
+
+        if self.verification == VERIFY_FULL:
             table_df = self.get(table_name)
             assert table_df is not None
-            # only check the columns that were provided in the target table
             if delete_missing_rows:
-                _assert_dataframes_match(new_df, table_df[new_df.columns])
-            else:
-                _assert_has_subset_of_rows(new_df, table_df[new_df.columns])
-        return result
+                assert len(table_df) == len(
+                    new_df
+                ), f"Sanity check failed: after update the table has {len(table_df)} rows, not {len(new_df)}"
+            # only check the columns that were provided in the target table
+            _assert_rows_match(pk_column, new_df, table_df[new_df.columns])
+            return
+
+        if self.verification == VERIFY_SAMPLED:
+            written_keys = random.sample(
+                written_keys, min(len(written_keys), VERIFY_SAMPLE_SIZE)
+            )
+            deleted_keys = random.sample(
+                deleted_keys, min(len(deleted_keys), VERIFY_SAMPLE_SIZE)
+            )
+
+        # only read back the rows which should have changed
+        table_df = _read_rows_by_key(
+            self.connection,
+            table_name,
+            pk_column,
+            pk_type,
+            list(new_df.columns),
+            written_keys + deleted_keys,
+        )
+        _assert_rows_absent(pk_column, deleted_keys, table_df)
+        expected_df = new_df[new_df[pk_column].isin(written_keys)]
+        _assert_rows_match(pk_column, expected_df, table_df)
+        if delete_missing_rows:
+            # every row of new_df is in the table, so if the counts match nothing else is
+            row_count = _count_rows(self.connection, table_name)
+            assert row_count == len(
+                new_df
+            ), f"Sanity check failed: after update the table has {row_count} rows, not {len(new_df)}"
 
     def insert_only(self, username, table_name, new_rows_df, *, reason=None):
         """
@@ -292,11 +1252,17 @@ class GumboDAO:
         Throw an exception if a given row does not already exist in the table.
         """
         self._set_username(username)
+        metadata = self._get_existing_table_metadata(table_name)
 
         cursor = self.connection.cursor()
         try:
-            pk_column = _get_pk_column(cursor, table_name)
-            _update_table(cursor, table_name, pk_column, updated_rows_df)
+            _update_table(
+                cursor,
+                table_name,
+                metadata.pk_column,
+                updated_rows_df,
+                column_types=metadata.column_types,
+            )
             _log_bulk_update(
                 self.connection,
                 username,
@@ -313,16 +1279,155 @@ class GumboDAO:
         Delete the rows with the given primary keys.
         """
         self._set_username(username)
+        metadata = self._get_existing_table_metadata(table_name)
+        pk_type = _column_type(metadata.column_types, table_name, pk_name)
 
         cursor = self.connection.cursor()
         try:
-            _delete_rows(cursor, table_name, pk_name, ids)
+            deleted_row_count = _delete_rows(cursor, table_name, pk_name, pk_type, ids)
             _log_bulk_update(
                 self.connection,
                 username,
                 table_name,
-                rows_deleted=len(ids),
+                rows_deleted=deleted_row_count,
                 reason=reason,
             )
         finally:
             cursor.close()
+
+    def create_upload(self, username, table_name, mode, *, reason=None) -> str:
+        """
+        Start staging a large write to table_name, which is sent in chunks with `put_upload_chunk` and then applied
+        all at once by `commit_upload`. `mode` is "insert_only" or "update_only". Returns the id of the upload.
+
+        Uploads are kept in the gumbo_upload and gumbo_upload_chunk tables (see uploads.UPLOAD_TABLES_SCHEMA).
+        Uploads which were never committed are deleted after a day.
+        """
+        if mode not in UPLOAD_MODES:
+            raise ValueError(f"Invalid mode {mode}")
+        self._get_existing_table_metadata(table_name)
+
+        upload_id = uuid.uuid4().hex
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(DELETE_EXPIRED_UPLOADS_QUERY)
+            cursor.execute(
+                CREATE_UPLOAD_QUERY, [upload_id, table_name, mode, username, reason]
+            )
+        finally:
+            cursor.close()
+        return upload_id
+
+    def put_upload_chunk(self, upload_id, chunk_id: int, data: str):
+        """
+        Stage a chunk of an upload. `data` is the serialized rows, which are only decoded on commit. Sending a
+        chunk id again replaces the chunk, so it's safe to retry. Raises a ValueError if the upload doesn't exist
+        or has already been committed.
+        """
+        if chunk_id < 0:
+            raise ValueError(f"Invalid chunk id {chunk_id}")
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(PUT_CHUNK_QUERY, [chunk_id, data, upload_id])
+            if cursor.rowcount == 0:
+                raise ValueError(
+                    f"Upload {upload_id} does not exist or is no longer open"
+                )
+        finally:
+            cursor.close()
+
+    def get_upload(self, upload_id) -> Optional[UploadStatus]:
+        "Returns the state of the upload and the chunks received so far, or None if it doesn't exist"
+        cursor = self.connection.cursor()
+        try:
+            return _fetch_upload(cursor, upload_id)
+        finally:
+            cursor.close()
+
+    def commit_upload(self, upload_id, chunk_count, decode_chunk) -> UploadStatus:
+        """
+        Apply chunks 0 to chunk_count - 1 of the upload to its table in a single transaction, so either every
+        row is written or none are. `decode_chunk` turns the data of a chunk back into a dataframe. Chunks are
+        read and applied one at a time, so only one is ever held in memory.
+
+        Committing an upload which has already been committed does nothing, so it's safe to retry. Raises a
+        ValueError if the upload doesn't exist or any chunk is missing.
+        """
+        with _transaction(self.connection):
+            cursor = self.connection.cursor()
+            try:
+                # lock the upload so it's only committed once and no chunks arrive part way through
+                upload = _fetch_upload(cursor, upload_id, lock=True)
+                if upload is None:
+                    raise ValueError(f"Upload {upload_id} does not exist")
+                if upload.status == COMMITTED:
+                    return upload
+
+                missing_chunk_ids = _missing_chunk_ids(upload.chunk_ids, chunk_count)
+                if missing_chunk_ids:
+                    raise ValueError(
+                        f"Upload {upload_id} is missing chunks {missing_chunk_ids}"
+                    )
+                if len(upload.chunk_ids) != chunk_count:
+                    raise ValueError(
+                        f"Upload {upload_id} has {len(upload.chunk_ids)} chunks, not {chunk_count}"
+                    )
+
+                self._set_username(upload.username)
+                metadata = self._get_existing_table_metadata(upload.table_name)
+                rows_inserted = 0
+                rows_updated = 0
+                for chunk_id in range(chunk_count):
+                    rows_df = decode_chunk(
+                        _fetch_chunk_data(cursor, upload_id, chunk_id)
+                    )
+                    if upload.mode == "insert_only":
+                        _insert_table(cursor, upload.table_name, rows_df)
+                        rows_inserted += rows_df.shape[0]
+                    else:
+                        _update_table(
+                            cursor,
+                            upload.table_name,
+                            metadata.pk_column,
+                            rows_df,
+                            column_types=metadata.column_types,
+                        )
+                        rows_updated += rows_df.shape[0]
+
+                _log_bulk_update(
+                    self.connection,
+                    upload.username,
+                    upload.table_name,
+                    rows_updated=rows_updated,
+                    rows_inserted=rows_inserted,
+                    reason=upload.reason,
+                )
+                cursor.execute(
+                    "UPDATE gumbo_upload SET status = %s, rows_inserted = %s, rows_updated = %s WHERE upload_id = %s",
+                    [COMMITTED, rows_inserted, rows_updated, upload_id],
+                )
+                # the rows are in the table now, so the staged copy isn't needed
+                cursor.execute(
+                    "DELETE FROM gumbo_upload_chunk WHERE upload_id = %s", [upload_id]
+                )
+            finally:
+                cursor.close()
+
+        return upload._replace(
+            status=COMMITTED,
+            chunk_ids=[],
+            rows_inserted=rows_inserted,
+            rows_updated=rows_updated,
+        )
+
+    def abort_upload(self, upload_id) -> bool:
+        "Discard an upload which hasn't been committed. Returns False if there was no such open upload"
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(
+                "DELETE FROM gumbo_upload WHERE upload_id = %s AND status = %s",
+                [upload_id, OPEN],
+            )
+            return cursor.rowcount > 0
+        finally:
+            cursor.close()
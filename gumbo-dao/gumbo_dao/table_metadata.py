@@ -0,0 +1,135 @@
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+class TableMetadata(NamedTuple):
+    table_name: str
+    is_view: bool
+    # column name -> postgres type, in the order the columns are defined in the table
+    column_types: Dict[str, str]
+    pk_columns: Tuple[str, ...]
+
+    @property
+    def pk_column(self):
+        assert (
+            len(self.pk_columns) == 1
+        ), f"expected 1 primary key column, but got {self.pk_columns}"
+        return self.pk_columns[0]
+
+
+# all columns of every table and view visible on the search path, along with whether each column is part of the
+# primary key
+TABLE_METADATA_QUERY = """SELECT c.relname, c.relkind IN ('v', 'm') AS is_view, a.attname,
+       format_type(a.atttypid, a.atttypmod) AS data_type, i.indrelid IS NOT NULL AS is_pk
+FROM   pg_class c
+JOIN   pg_attribute a ON a.attrelid = c.oid
+                     AND a.attnum > 0
+                     AND NOT a.attisdropped
+LEFT JOIN pg_index i ON i.indrelid = c.oid
+                    AND i.indisprimary
+                    AND a.attnum = ANY(i.indkey)
+WHERE  {condition}
+ORDER BY c.relname, a.attnum;"""
+
+ALL_TABLES_CONDITION = "c.relkind IN ('r', 'p', 'v', 'm', 'f') AND c.relnamespace = ANY(SELECT oid FROM pg_namespace WHERE nspname = ANY(current_schemas(false)))"
+
+SINGLE_TABLE_CONDITION = "c.oid = to_regclass(%s)"
+
+
+def _metadata_from_rows(rows):
+    "group the rows returned by TABLE_METADATA_QUERY into a dict of table name -> TableMetadata"
+    columns_by_table = {}
+    for table_name, is_view, column_name, data_type, is_pk in rows:
+        columns_by_table.setdefault(table_name, (is_view, []))[1].append(
+            (column_name, data_type, is_pk)
+        )
+
+    return {
+        table_name: TableMetadata(
+            table_name=table_name,
+            is_view=is_view,
+            column_types={name: data_type for name, data_type, _ in columns},
+            pk_columns=tuple(name for name, _, is_pk in columns if is_pk),
+        )
+        for table_name, (is_view, columns) in columns_by_table.items()
+    }
+
+
+def _fetch_table_metadata(cursor, table_name) -> Optional[TableMetadata]:
+    cursor.execute(
+        TABLE_METADATA_QUERY.format(condition=SINGLE_TABLE_CONDITION), [table_name]
+    )
+    metadata_by_table = _metadata_from_rows(cursor.fetchall())
+    if len(metadata_by_table) == 0:
+        return None
+    assert len(metadata_by_table) == 1
+    return list(metadata_by_table.values())[0]
+
+
+def _fetch_all_table_metadata(cursor) -> Dict[str, TableMetadata]:
+    cursor.execute(TABLE_METADATA_QUERY.format(condition=ALL_TABLES_CONDITION))
+    return _metadata_from_rows(cursor.fetchall())
+
+
+class TableMetadataCache:
+    """
+    Caches the primary key, column types and whether the relation is a view for each table, so that reading and
+    writing a table doesn't need a round trip to the catalog every time.
+
+    The first lookup (or the first lookup after `ttl` seconds have passed since) refreshes every table at once with
+    a single catalog query. Tables which are not found by that query (ie: created since) are looked up
+    individually. Use `invalidate` after changing a table's schema.
+    """
+
+    def __init__(self, ttl=300, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._warmed_at = None
+        # table name -> (time fetched, metadata or None if there is no such table)
+        self._entries = {}
+
+    def warm(self, cursor):
+        "Replace the contents of the cache with the metadata of every table, fetched with a single query"
+        metadata_by_table = _fetch_all_table_metadata(cursor)
+        now = self.clock()
+        with self._lock:
+            self._entries = {
+                table_name: (now, metadata)
+                for table_name, metadata in metadata_by_table.items()
+            }
+            self._warmed_at = now
+
+    def invalidate(self, table_name=None):
+        "Forget the metadata for the given table, or everything if table_name is None"
+        with self._lock:
+            if table_name is None:
+                self._entries = {}
+                self._warmed_at = None
+            else:
+                self._entries.pop(_cache_key(table_name), None)
+
+    def _is_fresh(self, fetched_at):
+        return fetched_at is not None and self.clock() - fetched_at < self.ttl
+
+    def get(self, cursor, table_name) -> Optional[TableMetadata]:
+        "Returns the metadata for the given table, or None if there is no such table or view"
+        if not self._is_fresh(self._warmed_at):
+            self.warm(cursor)
+
+        key = _cache_key(table_name)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and self._is_fresh(entry[0]):
+            return entry[1]
+
+        metadata = _fetch_table_metadata(cursor, table_name)
+        with self._lock:
+            self._entries[key] = (self.clock(), metadata)
+        return metadata
+
+
+def _cache_key(table_name):
+    # unquoted identifiers are case insensitive in postgres and the catalog stores them in lower case
+    return table_name.lower()
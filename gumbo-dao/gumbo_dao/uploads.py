@@ -0,0 +1,105 @@
+from typing import List, NamedTuple, Optional
+
+# the tables large writes are staged in, one chunk at a time, before being applied in a single transaction. They
+# must exist in the database before uploads can be used
+UPLOAD_TABLES_SCHEMA = """CREATE TABLE IF NOT EXISTS gumbo_upload (
+    upload_id varchar(100) PRIMARY KEY,
+    table_name varchar(100) NOT NULL,
+    mode varchar(20) NOT NULL,
+    username varchar(100) NOT NULL,
+    reason varchar(1000),
+    status varchar(20) NOT NULL DEFAULT 'open',
+    created_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    rows_inserted integer,
+    rows_updated integer
+);
+CREATE TABLE IF NOT EXISTS gumbo_upload_chunk (
+    upload_id varchar(100) NOT NULL REFERENCES gumbo_upload (upload_id) ON DELETE CASCADE,
+    chunk_id integer NOT NULL,
+    data text NOT NULL,
+    PRIMARY KEY (upload_id, chunk_id)
+);"""
+
+UPLOAD_MODES = ("insert_only", "update_only")
+
+OPEN = "open"
+COMMITTED = "committed"
+
+# uploads which are still open after this long are assumed to be abandoned and are deleted
+UPLOAD_EXPIRY = "1 day"
+
+CREATE_UPLOAD_QUERY = """INSERT INTO gumbo_upload (upload_id, table_name, mode, username, reason)
+VALUES (%s, %s, %s, %s, %s)"""
+
+DELETE_EXPIRED_UPLOADS_QUERY = f"""DELETE FROM gumbo_upload
+WHERE  status = '{OPEN}' AND created_at < CURRENT_TIMESTAMP - INTERVAL '{UPLOAD_EXPIRY}'"""
+
+# storing a chunk takes a share lock on its upload, so it either lands before the upload is committed (and is
+# applied) or after (and is rejected), never in the middle. Storing the same chunk again replaces it, so a chunk
+# can safely be resent if the response to it was lost
+PUT_CHUNK_QUERY = f"""INSERT INTO gumbo_upload_chunk (upload_id, chunk_id, data)
+SELECT upload_id, %s, %s FROM gumbo_upload WHERE upload_id = %s AND status = '{OPEN}' FOR SHARE
+ON CONFLICT (upload_id, chunk_id) DO UPDATE SET data = EXCLUDED.data"""
+
+UPLOAD_QUERY = """SELECT table_name, mode, username, reason, status, rows_inserted, rows_updated
+FROM   gumbo_upload
+WHERE  upload_id = %s"""
+
+CHUNK_IDS_QUERY = (
+    "SELECT chunk_id FROM gumbo_upload_chunk WHERE upload_id = %s ORDER BY chunk_id"
+)
+
+CHUNK_DATA_QUERY = (
+    "SELECT data FROM gumbo_upload_chunk WHERE upload_id = %s AND chunk_id = %s"
+)
+
+
+class UploadStatus(NamedTuple):
+    upload_id: str
+    table_name: str
+    mode: str
+    username: str
+    reason: Optional[str]
+    # "open" while chunks are being received, "committed" once they've been applied
+    status: str
+    # the ids of the chunks received so far (the chunks are deleted once the upload is committed)
+    chunk_ids: List[int]
+    # the number of rows written by the commit
+    rows_inserted: Optional[int]
+    rows_updated: Optional[int]
+
+
+def _missing_chunk_ids(chunk_ids, chunk_count) -> List[int]:
+    "the ids from 0 to chunk_count - 1 which haven't been received"
+    received = set(chunk_ids)
+    return [chunk_id for chunk_id in range(chunk_count) if chunk_id not in received]
+
+
+def _fetch_upload(cursor, upload_id, *, lock=False) -> Optional[UploadStatus]:
+    query = UPLOAD_QUERY
+    if lock:
+        query += " FOR UPDATE"
+    cursor.execute(query, [upload_id])
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    table_name, mode, username, reason, status, rows_inserted, rows_updated = row
+
+    cursor.execute(CHUNK_IDS_QUERY, [upload_id])
+    chunk_ids = [chunk_id for (chunk_id,) in cursor.fetchall()]
+    return UploadStatus(
+        upload_id=upload_id,
+        table_name=table_name,
+        mode=mode,
+        username=username,
+        reason=reason,
+        status=status,
+        chunk_ids=chunk_ids,
+        rows_inserted=rows_inserted,
+        rows_updated=rows_updated,
+    )
+
+
+def _fetch_chunk_data(cursor, upload_id, chunk_id) -> str:
+    cursor.execute(CHUNK_DATA_QUERY, [upload_id, chunk_id])
+    return cursor.fetchone()[0]
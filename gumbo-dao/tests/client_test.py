@@ -1,6 +1,14 @@
 import numpy as np
 import pandas as pd
-from gumbo_dao.gumbo_dao import _reconcile, _update_table
+from gumbo_dao.gumbo_dao import (
+    _reconcile,
+    _reconcile_with_changed_columns,
+    _update_table,
+    _insert_table,
+    _delete_rows,
+    _update_via_staging_table,
+    _CopyTextStream,
+)
 import gumbo_dao.gumbo_dao
 from unittest.mock import MagicMock
 import json
@@ -93,6 +101,58 @@ def test_reconcile_deletes_only():
     assert list(to_delete) == [2]
 
 
+def test_reconcile_matches_row_by_row_implementation():
+    existing = pd.DataFrame(
+        [
+            {"a": 1, "b": "x", "c": 1.5, "d": [1, 2]},
+            {"a": 2, "b": None, "c": np.nan, "d": [3]},
+            {"a": 3, "b": "z", "c": 2.5, "d": None},
+            {"a": 5, "b": "w", "c": 0.5, "d": [4]},
+        ]
+    )
+    target = pd.DataFrame(
+        [
+            {"a": 1, "b": "x", "c": 1.5, "d": [1, 2]},  # unchanged
+            {"a": 2, "b": None, "c": np.nan, "d": [3, 4]},  # list changed
+            {"a": 3, "b": "z", "c": np.nan, "d": None},  # value changed to null
+            {"a": 4, "b": "new", "c": 1.0, "d": [5]},  # new row
+            # delete row where a==5
+        ]
+    )
+    by_row = _reconcile("a", existing, target, vectorized=False)
+    by_column = _reconcile("a", existing, target, vectorized=True)
+
+    pd.testing.assert_frame_equal(by_column[0], by_row[0])
+    pd.testing.assert_frame_equal(by_column[1], by_row[1])
+    assert list(by_column[1]["a"]) == [2, 3]
+    assert by_column[2] == by_row[2] == {5}
+
+
+def test_reconcile_nullable_int_primary_key():
+    existing = pd.DataFrame({"a": pd.array([1, 2], dtype="Int64"), "b": ["x", "y"]})
+    target = pd.DataFrame({"a": pd.array([2, 3], dtype="Int64"), "b": ["z", "w"]})
+    new_rows, updated_rows, to_delete = _reconcile("a", existing, target)
+    assert list(new_rows["a"]) == [3]
+    assert list(updated_rows["b"]) == ["z"]
+    assert to_delete == {1}
+
+
+def test_reconcile_only_primary_key():
+    existing = pd.DataFrame({"a": [1, 2], "b": ["x", "y"]})
+    target = pd.DataFrame({"a": [2, 3]})
+    (
+        new_rows,
+        updated_rows,
+        to_delete,
+        changed_columns,
+    ) = _reconcile_with_changed_columns("a", existing, target)
+    assert list(new_rows["a"]) == [3]
+    assert len(updated_rows) == 0
+    assert list(updated_rows.columns) == ["a"]
+    assert to_delete == {1}
+    assert changed_columns.shape == (0, 0)
+
+
 def test_update_too_many_columns():
     existing = pd.DataFrame(
         [
@@ -125,40 +185,211 @@ def test_missing_pk():
         _reconcile("a", existing, target)
 
 
+column_types = {"pk": "integer", "a": "text", "b": "bigint"}
+
+
 def test_update_table(monkeypatch):
-    execute_batch = MagicMock()
+    execute_values = MagicMock()
     cursor = MagicMock()
+    cursor.rowcount = 1
     import gumbo_dao.gumbo_dao
 
-    monkeypatch.setattr(gumbo_dao.gumbo_dao, "execute_batch", execute_batch)
+    monkeypatch.setattr(gumbo_dao.gumbo_dao, "execute_values", execute_values)
 
-    def _execute_batch(cur, sql, params):
+    def _execute_values(cur, sql, params, page_size):
         assert cur == cursor
-        assert sql == "UPDATE tab SET a = %s, b = %s WHERE pk = %s"
-        assert params == [[4, 5, 1]]
+        assert (
+            sql
+            == "UPDATE tab AS t SET a = CAST(v.column2 AS text), b = CAST(v.column3 AS bigint) FROM (VALUES %s) AS v WHERE t.pk = CAST(v.column1 AS integer)"
+        )
+        assert params == [[1, 4, 5]]
+
+    execute_values.side_effect = _execute_values
+    assert (
+        _update_table(
+            cursor,
+            "tab",
+            "pk",
+            pd.DataFrame([{"a": 4, "b": 5, "pk": 1}]),
+            column_types=column_types,
+        )
+        == 1
+    )
+    assert execute_values.call_count == 1
+
+
+def test_update_table_matches_column_types_case_insensitively(monkeypatch):
+    execute_values = MagicMock()
+    monkeypatch.setattr(gumbo_dao.gumbo_dao, "execute_values", execute_values)
+
+    _update_table(
+        MagicMock(),
+        "tab",
+        "model_id",
+        pd.DataFrame({"model_id": ["m1"], "CellLineName": ["x"]}),
+        column_types={"model_id": "text", "celllinename": "varchar(100)"},
+    )
+
+    assert (
+        execute_values.call_args[0][1]
+        == "UPDATE tab AS t SET CellLineName = CAST(v.column2 AS varchar(100)) FROM (VALUES %s) AS v WHERE t.model_id = CAST(v.column1 AS text)"
+    )
+
+
+def test_update_table_only_writes_changed_columns(monkeypatch):
+    execute_values = MagicMock()
+    cursor = MagicMock()
+    monkeypatch.setattr(gumbo_dao.gumbo_dao, "execute_values", execute_values)
+
+    updated_rows = pd.DataFrame(
+        [
+            {"pk": 1, "a": "x", "b": 5},
+            {"pk": 2, "a": "y", "b": 6},
+            {"pk": 3, "a": "z", "b": 7},
+        ]
+    )
+    changed_columns = pd.DataFrame(
+        [{"a": True, "b": False}, {"a": False, "b": True}, {"a": True, "b": False}]
+    )
+    _update_table(
+        cursor,
+        "tab",
+        "pk",
+        updated_rows,
+        changed_columns=changed_columns,
+        column_types=column_types,
+    )
+
+    statements = {
+        call[0][1].split(" FROM ")[0]: call[0][2]
+        for call in execute_values.call_args_list
+    }
+    assert statements == {
+        "UPDATE tab AS t SET a = CAST(v.column2 AS text)": [[1, "x"], [3, "z"]],
+        "UPDATE tab AS t SET b = CAST(v.column2 AS bigint)": [[2, 6]],
+    }
 
-    execute_batch.side_effect = _execute_batch
-    _update_table(cursor, "tab", "pk", pd.DataFrame([{"a": 4, "b": 5, "pk": 1}]))
-    assert execute_batch.call_count == 1
+
+def test_update_table_uses_temporary_table_for_large_updates():
+    cursor = MagicMock()
+    cursor.rowcount = 3
+
+    updated_rows = pd.DataFrame({"pk": [1, 2, 3], "a": ["x", "y", "z"]})
+    assert _update_table(cursor, "tab", "pk", updated_rows, copy_threshold=3) == 3
+
+    assert (
+        cursor.copy_expert.call_args[0][0]
+        == "COPY gumbo_update_rows (pk, a) FROM STDIN"
+    )
+    statements = [call[0][0] for call in cursor.execute.call_args_list]
+    assert (
+        "UPDATE tab AS t SET a = u.a FROM gumbo_update_rows AS u WHERE t.pk = u.pk"
+        in statements
+    )
+
+
+def test_delete_rows_in_chunks():
+    cursor = MagicMock()
+    cursor.rowcount = 2
+
+    assert (
+        _delete_rows(cursor, "tab", "pk", "integer", [1, 2, np.int64(3)], chunk_size=2)
+        == 4
+    )
+    assert [call[0] for call in cursor.execute.call_args_list] == [
+        ("DELETE FROM tab WHERE pk = ANY(CAST(%s AS integer[]))", [[1, 2]]),
+        ("DELETE FROM tab WHERE pk = ANY(CAST(%s AS integer[]))", [[3]]),
+    ]
+    assert type(cursor.execute.call_args_list[1][0][1][0][0]) == int
+
+
+def test_reconcile_changed_columns():
+    existing = pd.DataFrame([{"a": 1, "b": 2, "c": "x"}, {"a": 2, "b": 3, "c": "y"}])
+    target = pd.DataFrame([{"a": 1, "b": 2, "c": "z"}, {"a": 2, "b": 4, "c": "y"}])
+    _, updated_rows, _, changed_columns = _reconcile_with_changed_columns(
+        "a", existing, target
+    )
+    assert list(updated_rows["a"]) == [1, 2]
+    assert changed_columns.to_dict("records") == [
+        {"b": False, "c": True},
+        {"b": True, "c": False},
+    ]
 
 
-def test_assert_has_subset_of_rows():
-    full_df = pd.DataFrame(
-        [{"a": 1, "b": 2}, {"a": 3, "b": 4}, {"a": 1, "b": 12}, {"a": 3, "b": 14}]
+def test_copy_text_stream():
+    df = pd.DataFrame(
+        [
+            {"a": 1, "b": "tab\there", "c": True, "d": None},
+            {"a": 2, "b": "back\\slash", "c": False, "d": [1, 2]},
+        ]
     )
-    subset_df = pd.DataFrame([{"a": 1, "b": 2}, {"a": 3, "b": 4}])
-    superset_df = pd.DataFrame([{"a": 1, "b": 2}, {"a": 13, "b": 14}])
+    stream = _CopyTextStream(df)
+    text = stream.read(5) + stream.read()
+    assert text == "1\ttab\\there\tt\t\\N\n2\tback\\\\slash\tf\t[1, 2]\n"
+    assert stream.read() == ""
+
+
+def test_copy_text_stream_reads_across_chunks():
+    # more rows than fit in one chunk of _iter_copy_text
+    df = pd.DataFrame({"a": range(25000), "b": ["x" * (i % 7) for i in range(25000)]})
+    expected = "".join(f"{a}\t{b}\n" for a, b in zip(df["a"], df["b"]))
+
+    stream = _CopyTextStream(df)
+    parts = []
+    while True:
+        part = stream.read(4099)
+        if part == "":
+            break
+        assert len(part) <= 4099
+        parts.append(part)
+    assert "".join(parts) == expected
+
+
+def test_insert_table_uses_copy_for_large_inserts(monkeypatch):
+    execute_values = MagicMock()
+    monkeypatch.setattr(gumbo_dao.gumbo_dao, "execute_values", execute_values)
+    cursor = MagicMock()
+    df = pd.DataFrame({"pk": [1, 2, 3], "a": [1.0, np.nan, 2.5]})
+
+    _insert_table(cursor, "tab", df, copy_threshold=10)
+    assert execute_values.call_count == 1
+    assert cursor.copy_expert.call_count == 0
 
-    gumbo_dao.gumbo_dao._assert_has_subset_of_rows(
-        subset_df=subset_df, full_df=full_df
-    )  # no exception thrown
+    _insert_table(cursor, "tab", df, copy_threshold=3)
+    assert execute_values.call_count == 1
+    assert cursor.copy_expert.call_count == 1
+    sql, stream = cursor.copy_expert.call_args[0]
+    assert sql == "COPY tab (pk, a) FROM STDIN"
+    assert stream.read() == "1\t1\n2\t\\N\n3\t2.5\n"
 
-    with pytest.raises(Exception) as e_info:
-        gumbo_dao.gumbo_dao._assert_has_subset_of_rows(
-            subset_df=superset_df, full_df=full_df
-        )  # throws exception
 
-    with pytest.raises(Exception) as e_info:
-        gumbo_dao.gumbo_dao._assert_has_subset_of_rows(
-            subset_df=full_df, full_df=subset_df
-        )  # throws exception
+def test_update_via_staging_table():
+    cursor = MagicMock()
+    # the keys returned by the DELETE, then the keys returned by the upsert (with whether each was inserted)
+    cursor.fetchall.side_effect = [[(3,)], [(1, True), (2, False)]]
+
+    result = _update_via_staging_table(
+        cursor,
+        "tab",
+        "pk",
+        pd.DataFrame([{"pk": 1, "a": 4}, {"pk": 2, "a": 5}]),
+        delete_missing_rows=True,
+    )
+    assert result == ([1], [2], [3])
+
+    assert cursor.copy_expert.call_count == 1
+    assert (
+        cursor.copy_expert.call_args[0][0]
+        == "COPY gumbo_update_staging (pk, a) FROM STDIN"
+    )
+
+    statements = [call[0][0] for call in cursor.execute.call_args_list]
+    assert statements[1].startswith(
+        "CREATE TEMPORARY TABLE gumbo_update_staging AS SELECT pk, a FROM tab"
+    )
+    assert statements[3].startswith("DELETE FROM tab t WHERE NOT EXISTS")
+    assert statements[4].startswith(
+        "INSERT INTO tab AS t (pk, a) SELECT pk, a FROM gumbo_update_staging ON CONFLICT (pk) DO UPDATE SET a = EXCLUDED.a WHERE"
+    )
+    assert statements[-1] == "DROP TABLE IF EXISTS gumbo_update_staging"
+    assert len(statements) == 6
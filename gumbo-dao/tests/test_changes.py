@@ -0,0 +1,18 @@
+from gumbo_dao.changes import _changed_keys
+
+
+def test_changed_keys():
+    rows = [
+        ("I", "a", None),
+        ("U", "b", None),
+        # the key of this row was changed from "c" to "d"
+        ("U", "c", "d"),
+        ("D", "a", None),
+        # statement level entries have no row data
+        ("U", None, None),
+    ]
+    assert _changed_keys(rows) == (False, ["a", "b", "c", "d"])
+
+
+def test_changed_keys_after_truncate():
+    assert _changed_keys([("I", "a", None), ("T", None, None)]) == (True, [])
@@ -0,0 +1,94 @@
+from unittest.mock import MagicMock
+
+import pytest
+from psycopg2.pool import PoolError
+
+import gumbo_dao.connection_pool
+from gumbo_dao.connection_pool import ConnectionPool
+
+
+class FakeThreadedConnectionPool:
+    def __init__(self, minconn, maxconn, dsn):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self._pool = []
+        self._used = {}
+        self.created = 0
+
+    def getconn(self):
+        if self._pool:
+            connection = self._pool.pop()
+        else:
+            self.created += 1
+            connection = MagicMock(closed=0)
+        self._used[id(connection)] = connection
+        return connection
+
+    def putconn(self, connection, close=False):
+        del self._used[id(connection)]
+        if not close:
+            self._pool.append(connection)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(
+        gumbo_dao.connection_pool,
+        "ThreadedConnectionPool",
+        FakeThreadedConnectionPool,
+    )
+    return ConnectionPool(
+        "dsn",
+        maxconn=2,
+        checkout_timeout=0.01,
+        health_check_interval=10,
+        clock=FakeClock(),
+    )
+
+
+def test_checkout_and_return(pool):
+    a = pool.getconn()
+    b = pool.getconn()
+    assert a.autocommit
+    assert pool.stats()["in_use"] == 2
+
+    with pytest.raises(PoolError):
+        pool.getconn()
+
+    pool.putconn(a)
+    assert pool.getconn() is a
+    assert pool.stats() == {
+        "checkouts": 3,
+        "returns": 1,
+        "timeouts": 1,
+        "health_check_failures": 0,
+        "min_size": 1,
+        "max_size": 2,
+        "in_use": 2,
+        "idle": 0,
+    }
+
+
+def test_idle_connections_are_health_checked(pool):
+    connection = pool.getconn()
+    pool.putconn(connection)
+
+    # recently returned connections are used without a check
+    assert pool.getconn() is connection
+    assert connection.cursor.call_count == 0
+    pool.putconn(connection)
+
+    # connections idle for longer than health_check_interval are checked and replaced if broken
+    pool.clock.now = 100
+    connection.cursor.return_value.execute.side_effect = Exception("server closed")
+    replacement = pool.getconn()
+    assert replacement is not connection
+    assert pool.stats()["health_check_failures"] == 1
@@ -0,0 +1,16 @@
+import hashlib
+
+from gumbo_dao.fingerprints import _digest, _digest_query, _row_hashes_query
+
+
+def test_digest():
+    # the same as md5(string_agg(row_hash, '')) in postgres, which is md5('') for an empty table
+    assert _digest([]) == hashlib.md5(b"").hexdigest()
+    assert _digest(["ab", "cd"]) == hashlib.md5(b"abcd").hexdigest()
+
+
+def test_queries_hash_the_given_columns():
+    assert 'ROW(t."id", t."intcol")' in _row_hashes_query(
+        "sample", '"id"', ['"id"', '"intcol"']
+    )
+    assert 'ROW(t."strcol")' in _digest_query("sample", '"id"', ['"strcol"'])
@@ -1,5 +1,6 @@
 import gumbo_dao
 import gumbo_dao.gumbo_dao
+import gumbo_dao.table_metadata
 import sqlite3
 import pytest
 import pandas as pd
@@ -24,30 +25,68 @@ def connection(monkeypatch):
 def dao(monkeypatch, connection):
     # a fixture which mocks out methods which cannot execute with sqlite
     # _set_username (because no sqlite equivlient)
-    # and replaces execute_batch and execute_values with a sqlite equivilent
+    # and replaces execute_values, _delete_rows and _read_sql with a sqlite equivilent
 
     dao = gumbo_dao.GumboDAO(connection=connection, sanity_check=True)
     monkeypatch.setattr(dao, "_set_username", lambda name: None)
 
-    # simulate execute_batch and execute_values since these are postgresql specific
-    def execute_batch(cursor, sql, params):
-        for param in params:
-            cursor.execute(sql.replace("%s", "?"), param)
-
-    def execute_values(cursor, sql, values):
+    # simulate execute_values and "= ANY(array)" since these are postgresql specific
+    def execute_values(cursor, sql, values, page_size=100):
         for param in values:
             cursor.execute(
                 sql.replace("%s", "(" + (",".join(["?"] * len(param))) + ")"), param
             )
 
-    monkeypatch.setattr(gumbo_dao.gumbo_dao, "execute_batch", execute_batch)
+    def delete_rows(cursor, table_name, pk_column, pk_type, ids):
+        ids = list(ids)
+        placeholders = ",".join(["?"] * len(ids))
+        cursor.execute(
+            f"DELETE FROM {table_name} WHERE {pk_column} IN ({placeholders})", ids
+        )
+        return cursor.rowcount
+
+    def read_sql(connection, query, params=None):
+        return pd.read_sql(query.replace("%s", "?"), connection, params=params)
+
     monkeypatch.setattr(gumbo_dao.gumbo_dao, "execute_values", execute_values)
+    monkeypatch.setattr(gumbo_dao.gumbo_dao, "_read_sql", read_sql)
+    monkeypatch.setattr(gumbo_dao.gumbo_dao, "_delete_rows", delete_rows)
+
+    def read_rows_by_key(
+        connection, table_name, pk_column, pk_type, column_names, keys
+    ):
+        keys = list(keys)
+        placeholders = ",".join(["?"] * len(keys))
+        return pd.read_sql(
+            f"SELECT {', '.join(column_names)} FROM {table_name} WHERE {pk_column} IN ({placeholders})",
+            connection,
+            params=keys,
+        )
+
+    monkeypatch.setattr(gumbo_dao.gumbo_dao, "_read_rows_by_key", read_rows_by_key)
+
+    # simulate the catalog queries used to look up the table metadata
+    sample_metadata = gumbo_dao.TableMetadata(
+        table_name="sample",
+        is_view=False,
+        column_types={"PK": "VARCHAR(100)", "COLUMN2": "INTEGER"},
+        pk_columns=("PK",),
+    )
+
+    def mock_fetch_all_table_metadata(cursor):
+        return {"sample": sample_metadata}
 
-    def mock_get_pk_column(cursor, table_name):
-        assert table_name == "sample"
-        return "PK"
+    def mock_fetch_table_metadata(cursor, table_name):
+        return sample_metadata if table_name == "sample" else None
 
-    monkeypatch.setattr(gumbo_dao.gumbo_dao, "_get_pk_column", mock_get_pk_column)
+    monkeypatch.setattr(
+        gumbo_dao.table_metadata,
+        "_fetch_all_table_metadata",
+        mock_fetch_all_table_metadata,
+    )
+    monkeypatch.setattr(
+        gumbo_dao.table_metadata, "_fetch_table_metadata", mock_fetch_table_metadata
+    )
 
     return dao
 
@@ -61,6 +100,57 @@ def test_get(connection, dao):
     assert df.shape[1] == 2
 
 
+def test_get_missing_table(dao):
+    assert dao.get("missing") is None
+
+
+def test_get_columns_and_filters(connection, dao):
+    for pk, value in [("A", 1), ("B", 2), ("C", 3), ("D", 4)]:
+        connection.execute(
+            "INSERT INTO SAMPLE (PK, COLUMN2) VALUES (?, ?)", [pk, value]
+        )
+    connection.commit()
+
+    df = dao.get("sample", columns=["column2"])
+    assert list(df.columns) == ["COLUMN2"]
+    assert list(df["COLUMN2"]) == [1, 2, 3, 4]
+
+    df = dao.get("sample", filters=[("COLUMN2", ">=", "2"), ("PK", "in", ["A", "C"])])
+    assert list(df["PK"]) == ["C"]
+
+    df = dao.get("sample", filters=[("PK", "=", "B")])
+    assert list(df["COLUMN2"]) == [2]
+
+    assert len(dao.get("sample", filters=[("PK", "in", [])])) == 0
+
+    with pytest.raises(ValueError):
+        dao.get("sample", columns=["missing"])
+    with pytest.raises(ValueError):
+        dao.get("sample", filters=[("PK; drop table sample", "=", "A")])
+    with pytest.raises(ValueError):
+        dao.get("sample", filters=[("PK", "like", "A")])
+
+
+def test_get_page(connection, dao):
+    for pk, value in [("C", 3), ("A", 1), ("D", 4), ("B", 2), ("E", 5)]:
+        connection.execute(
+            "INSERT INTO SAMPLE (PK, COLUMN2) VALUES (?, ?)", [pk, value]
+        )
+    connection.commit()
+
+    pages = []
+    after = None
+    while True:
+        page = dao.get_page("sample", after=after, limit=2)
+        pages.append(list(page["PK"]))
+        if len(page) < 2:
+            break
+        after = page["PK"].iloc[-1]
+
+    assert pages == [["A", "B"], ["C", "D"], ["E"]]
+    assert dao.get_page("missing") is None
+
+
 def test_update_no_delete(connection, dao):
     connection.execute("INSERT INTO SAMPLE (PK, COLUMN2) VALUES ('X', 1)")
     connection.execute("INSERT INTO SAMPLE (PK, COLUMN2) VALUES ('Y', 2)")
@@ -96,6 +186,63 @@ def test_update_with_delete(connection, dao):
     assert new_df.equals(df)
 
 
+@pytest.mark.parametrize("verification", gumbo_dao.VERIFICATION_LEVELS)
+def test_update_verification_levels(connection, dao, verification):
+    dao.verification = verification
+    connection.execute("INSERT INTO SAMPLE (PK, COLUMN2) VALUES ('X', 1)")
+    connection.execute("INSERT INTO SAMPLE (PK, COLUMN2) VALUES ('Y', 2)")
+    connection.commit()
+
+    new_df = pd.DataFrame({"PK": ["X", "Z"], "COLUMN2": [3, 4]})
+    dao.update("username", "sample", new_df, delete_missing_rows=True)
+    df = dao.get("sample")
+    assert list(df["PK"]) == ["X", "Z"]
+
+
+@pytest.mark.parametrize(
+    "verification",
+    [gumbo_dao.VERIFY_SAMPLED, gumbo_dao.VERIFY_TOUCHED, gumbo_dao.VERIFY_FULL],
+)
+def test_update_verification_detects_lost_writes(
+    monkeypatch, connection, dao, verification
+):
+    dao.verification = verification
+    connection.execute("INSERT INTO SAMPLE (PK, COLUMN2) VALUES ('X', 1)")
+    connection.commit()
+    # simulate an update which silently doesn't happen
+    monkeypatch.setattr(
+        gumbo_dao.gumbo_dao, "_update_table", lambda *args, **kwargs: None
+    )
+
+    new_df = pd.DataFrame({"PK": ["X"], "COLUMN2": [3]})
+    with pytest.raises(AssertionError, match='column "COLUMN2" was different'):
+        dao.update("username", "sample", new_df)
+
+
+def test_update_verification_detects_rows_not_deleted(monkeypatch, connection, dao):
+    connection.execute("INSERT INTO SAMPLE (PK, COLUMN2) VALUES ('X', 1)")
+    connection.execute("INSERT INTO SAMPLE (PK, COLUMN2) VALUES ('Y', 2)")
+    connection.commit()
+    monkeypatch.setattr(gumbo_dao.gumbo_dao, "_delete_rows", lambda *args: 0)
+
+    new_df = pd.DataFrame({"PK": ["X"], "COLUMN2": [1]})
+    with pytest.raises(AssertionError, match="were not deleted"):
+        dao.update("username", "sample", new_df, delete_missing_rows=True)
+
+
+def test_verification_defaults(connection):
+    assert gumbo_dao.GumboDAO(connection).verification == "off"
+    assert gumbo_dao.GumboDAO(connection, sanity_check=True).verification == "touched"
+    assert (
+        gumbo_dao.GumboDAO(
+            connection, sanity_check=True, verification="full"
+        ).verification
+        == "full"
+    )
+    with pytest.raises(ValueError):
+        gumbo_dao.GumboDAO(connection, verification="sometimes")
+
+
 def test_insert_only(connection, dao):
     connection.execute("INSERT INTO SAMPLE (PK, COLUMN2) VALUES ('X', 1)")
     connection.commit()
@@ -118,3 +265,29 @@ def test_update_only(connection, dao):
     df = dao.get("sample")
     expected_df = pd.DataFrame({"PK": ["X", "Y"], "COLUMN2": [3, 2]})
     assert expected_df.equals(df)
+
+
+def test_update_only_subset_of_rows(connection, dao):
+    connection.execute("INSERT INTO SAMPLE (PK, COLUMN2) VALUES ('X', 1)")
+    connection.execute("INSERT INTO SAMPLE (PK, COLUMN2) VALUES ('Y', 2)")
+    connection.execute("INSERT INTO SAMPLE (PK, COLUMN2) VALUES ('Z', 3)")
+    connection.commit()
+
+    new_df = pd.DataFrame({"PK": ["Z", "X"], "COLUMN2": [None, 4]})
+    dao.update_only("username", "sample", new_df, reason="test_update_only")
+    df = dao.get("sample")
+    assert list(df["PK"]) == ["X", "Y", "Z"]
+    assert list(df["COLUMN2"].fillna(-1)) == [4, 2, -1]
+
+
+def test_delete(connection, dao):
+    connection.execute("INSERT INTO SAMPLE (PK, COLUMN2) VALUES ('X', 1)")
+    connection.execute("INSERT INTO SAMPLE (PK, COLUMN2) VALUES ('Y', 2)")
+    connection.commit()
+
+    dao.delete("username", "sample", "PK", ["X", "missing"], reason="test_delete")
+    df = dao.get("sample")
+    assert list(df["PK"]) == ["Y"]
+
+    rows = connection.execute("SELECT rows_deleted FROM bulk_update_log").fetchall()
+    assert rows == [(1,)]
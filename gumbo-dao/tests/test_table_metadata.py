@@ -0,0 +1,81 @@
+from unittest.mock import MagicMock
+
+import gumbo_dao.table_metadata
+from gumbo_dao.table_metadata import (
+    TableMetadata,
+    TableMetadataCache,
+    _metadata_from_rows,
+)
+
+SAMPLE = TableMetadata(
+    table_name="sample",
+    is_view=False,
+    column_types={"id": "integer", "name": "text"},
+    pk_columns=("id",),
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_metadata_from_rows():
+    rows = [
+        ("sample", False, "id", "integer", True),
+        ("sample", False, "name", "text", False),
+        ("sample_view", True, "name", "text", False),
+    ]
+    metadata = _metadata_from_rows(rows)
+    assert metadata["sample"] == SAMPLE
+    assert metadata["sample"].pk_column == "id"
+    assert metadata["sample_view"].is_view
+    assert metadata["sample_view"].pk_columns == ()
+
+
+def test_cache_is_warmed_with_a_single_query(monkeypatch):
+    fetch_all = MagicMock(return_value={"sample": SAMPLE})
+    fetch_one = MagicMock(return_value=None)
+    monkeypatch.setattr(
+        gumbo_dao.table_metadata, "_fetch_all_table_metadata", fetch_all
+    )
+    monkeypatch.setattr(gumbo_dao.table_metadata, "_fetch_table_metadata", fetch_one)
+
+    cache = TableMetadataCache()
+    cursor = MagicMock()
+    assert cache.get(cursor, "sample") == SAMPLE
+    assert cache.get(cursor, "SAMPLE") == SAMPLE
+    assert fetch_all.call_count == 1
+    assert fetch_one.call_count == 0
+
+    # tables missing from the bulk query are looked up individually, and remembered
+    assert cache.get(cursor, "missing") is None
+    assert cache.get(cursor, "missing") is None
+    assert fetch_one.call_count == 1
+
+
+def test_cache_ttl_and_invalidation(monkeypatch):
+    fetch_all = MagicMock(return_value={"sample": SAMPLE})
+    monkeypatch.setattr(
+        gumbo_dao.table_metadata, "_fetch_all_table_metadata", fetch_all
+    )
+
+    clock = FakeClock()
+    cache = TableMetadataCache(ttl=10, clock=clock)
+    cursor = MagicMock()
+
+    cache.get(cursor, "sample")
+    clock.now = 5
+    cache.get(cursor, "sample")
+    assert fetch_all.call_count == 1
+
+    clock.now = 11
+    cache.get(cursor, "sample")
+    assert fetch_all.call_count == 2
+
+    cache.invalidate()
+    cache.get(cursor, "sample")
+    assert fetch_all.call_count == 3
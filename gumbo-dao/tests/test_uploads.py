@@ -0,0 +1,43 @@
+import pytest
+
+from gumbo_dao.gumbo_dao import _transaction
+from gumbo_dao.uploads import _missing_chunk_ids
+
+
+def test_missing_chunk_ids():
+    assert _missing_chunk_ids([0, 2, 3], 5) == [1, 4]
+    assert _missing_chunk_ids([0, 1, 2], 3) == []
+    assert _missing_chunk_ids([], 2) == [0, 1]
+
+
+class FakeConnection:
+    def __init__(self, autocommit):
+        self.autocommit = autocommit
+        self.events = []
+
+    def commit(self):
+        self.events.append(("commit", self.autocommit))
+
+    def rollback(self):
+        self.events.append(("rollback", self.autocommit))
+
+
+def test_transaction_commits_or_rolls_back():
+    connection = FakeConnection(autocommit=True)
+    with _transaction(connection):
+        assert connection.autocommit is False
+    assert connection.events == [("commit", False)]
+    assert connection.autocommit is True
+
+    with pytest.raises(RuntimeError):
+        with _transaction(connection):
+            raise RuntimeError()
+    assert connection.events[-1] == ("rollback", False)
+    assert connection.autocommit is True
+
+
+def test_transaction_leaves_callers_transaction_alone():
+    connection = FakeConnection(autocommit=False)
+    with _transaction(connection):
+        pass
+    assert connection.events == []
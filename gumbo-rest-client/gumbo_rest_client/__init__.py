@@ -1,3 +1,4 @@
-from .rest_client import Client
+from .rest_client import Client, TableChanges, TableFingerprint, changed_keys
+from .mirror import TableMirror
 from .const import staging_url, client_id, prod_url
 from .auth import create_authorized_session
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import NamedTuple, Optional
+
+
+class CachedResponse(NamedTuple):
+    etag: str
+    content_type: str
+    # the file holding the body of the response
+    path: str
+
+
+class TableCache:
+    """
+    Keeps the bodies of table downloads on disk along with their ETags, so that a table which hasn't changed
+    since it was last downloaded can be revalidated with the service (which replies "304 Not Modified") and
+    loaded from disk instead of being downloaded again.
+
+    Entries are keyed by the url and parameters of the request. When the files in `directory` take up more than
+    `max_bytes`, the least recently used entries are deleted.
+    """
+
+    def __init__(self, directory, max_bytes=2 * 1024**3):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(url, params, accept) -> str:
+        request = json.dumps([url, params, accept], sort_keys=True)
+        return hashlib.sha256(request.encode("utf8")).hexdigest()
+
+    def _body_path(self, key):
+        return os.path.join(self.directory, f"{key}.body")
+
+    def _meta_path(self, key):
+        return os.path.join(self.directory, f"{key}.meta.json")
+
+    def lookup(self, key) -> Optional[CachedResponse]:
+        try:
+            with open(self._meta_path(key), "rt") as fd:
+                meta = json.load(fd)
+        except (OSError, ValueError):
+            return None
+
+        path = self._body_path(key)
+        if not os.path.exists(path):
+            return None
+        return CachedResponse(
+            etag=meta["etag"], content_type=meta["content_type"], path=path
+        )
+
+    def touch(self, key):
+        "mark the entry as recently used"
+        try:
+            os.utime(self._body_path(key))
+        except OSError:
+            pass
+
+    def store(self, key, etag, content_type, body: bytes) -> Optional[CachedResponse]:
+        if len(body) > self.max_bytes:
+            # too big to ever fit, so don't evict everything else trying to make room
+            self.remove(key)
+            return None
+
+        path = self._body_path(key)
+        # write to temporary files first so a reader never sees a partially written entry
+        self._write_atomically(path, body)
+        self._write_atomically(
+            self._meta_path(key),
+            json.dumps({"etag": etag, "content_type": content_type}).encode("utf8"),
+        )
+        self._evict(keep=key)
+        return CachedResponse(etag=etag, content_type=content_type, path=path)
+
+    def remove(self, key):
+        for path in [self._meta_path(key), self._body_path(key)]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _write_atomically(self, path, content: bytes):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        except:
+            os.unlink(temp_path)
+            raise
+
+    def _evict(self, keep):
+        with self._lock:
+            entries = []
+            total_bytes = 0
+            for name in os.listdir(self.directory):
+                if not name.endswith(".body"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name[: -len(".body")]))
+                total_bytes += stat.st_size
+
+            # least recently used first
+            for _, size, key in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                self.remove(key)
+                total_bytes -= size
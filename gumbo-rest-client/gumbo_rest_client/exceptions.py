@@ -1,2 +1,26 @@
 class UnknownTable(Exception):
     pass
+
+
+class UploadFailed(Exception):
+    "A chunked upload didn't complete. Pass `upload_id` to Client.resume_upload to send the remaining chunks"
+
+    def __init__(self, upload_id):
+        super().__init__(f"Upload {upload_id} failed")
+        self.upload_id = upload_id
+
+
+class GetManyFailed(Exception):
+    """
+    Some of the tables passed to Client.get_many couldn't be fetched. `errors` maps each of those tables to the
+    exception raised for it, and `tables` holds the ones which were fetched.
+    """
+
+    def __init__(self, errors, tables):
+        summary = ", ".join(
+            f"{table_name} ({type(error).__name__}: {error})"
+            for table_name, error in errors.items()
+        )
+        super().__init__(f"Failed to fetch {summary}")
+        self.errors = errors
+        self.tables = tables
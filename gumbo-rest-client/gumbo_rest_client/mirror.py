@@ -0,0 +1,88 @@
+import os
+from typing import Optional
+
+import pandas as pd
+
+from .rest_client import Client
+
+
+class TableMirror:
+    """
+    A local copy of a table which is brought up to date by fetching only the rows which changed since the last
+    refresh.
+
+    If `path` is given, the copy (and the watermark of the last refresh) is saved there after each refresh and
+    loaded from there when the mirror is created, so that repeated runs of a job only download what changed in
+    between. For example:
+
+        mirror = TableMirror(client, "model", path="model.mirror.pkl")
+        df = mirror.refresh()
+    """
+
+    def __init__(self, client: Client, table_name: str, *, path: Optional[str] = None):
+        self.client = client
+        self.table_name = table_name
+        self.path = path
+        self.df: Optional[pd.DataFrame] = None
+        self.watermark: Optional[int] = None
+        if path is not None and os.path.exists(path):
+            saved = pd.read_pickle(path)
+            if saved["table_name"] == table_name:
+                self.df = saved["df"]
+                self.watermark = saved["watermark"]
+
+    def refresh(self) -> pd.DataFrame:
+        "Apply the changes made since the last refresh and return the up to date table"
+        changes = self.client.get_changes(self.table_name, since=self.watermark)
+        if not changes.full_refresh and set(changes.upserted.columns) != set(
+            self.df.columns
+        ):
+            # the table's columns have changed, so the local copy can't be patched
+            changes = self.client.get_changes(self.table_name)
+
+        if changes.full_refresh:
+            df = changes.upserted
+        else:
+            df = _apply_changes(
+                self.df, changes.primary_key, changes.upserted, changes.deleted
+            )
+
+        self.df = df
+        self.watermark = changes.watermark
+        if self.path is not None:
+            self._save()
+        return df
+
+    def _save(self):
+        # write to a temporary file first so an interrupted save doesn't leave a corrupt mirror behind
+        temp_path = f"{self.path}.tmp"
+        pd.to_pickle(
+            {
+                "table_name": self.table_name,
+                "watermark": self.watermark,
+                "df": self.df,
+            },
+            temp_path,
+        )
+        os.replace(temp_path, self.path)
+
+
+def _apply_changes(df, primary_key, upserted, deleted):
+    "returns df with the deleted rows removed, and the upserted rows replacing any existing rows with the same key"
+    if len(upserted) == 0 and len(deleted) == 0:
+        return df
+
+    changed_keys = pd.concat(
+        [upserted[primary_key], deleted[primary_key]], ignore_index=True
+    )
+    df = df[~df[primary_key].isin(changed_keys)]
+    if len(upserted) > 0:
+        upserted = upserted[df.columns]
+        # get_changes gives the rows the types of the table's columns, but a service which doesn't send them leaves
+        # a column which is entirely null in the changed rows without its proper type. Only those columns are cast
+        # to the existing types: casting the others could truncate values (ie: a new 2.5 in a float column whose
+        # values were all whole numbers, and so unpacked as ints), so concat picks a type which holds both
+        all_null = [column for column in df.columns if upserted[column].isna().all()]
+        upserted = upserted.astype(df[all_null].dtypes.to_dict())
+        df = pd.concat([df, upserted], ignore_index=True)
+    return df.sort_values(primary_key, ignore_index=True)
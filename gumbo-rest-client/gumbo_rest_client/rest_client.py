@@ -1,20 +1,126 @@
 import pandas as pd
 import os.path
-from .exceptions import UnknownTable
-from dataframe_json_packing import unpack, pack
+from .exceptions import GetManyFailed, UnknownTable, UploadFailed
+from dataframe_json_packing import compression as codecs
+from dataframe_json_packing import (
+    unpack,
+    pack,
+    cast_to_packed_types,
+    unpack_arrow,
+    arrow_is_available,
+    ARROW_MEDIA_TYPE,
+    unpack_chunks,
+    PACKED_CHUNKS_MEDIA_TYPE,
+)
 import json
 from .auth import create_authorized_session
+from .cache import CachedResponse, TableCache
 import getpass
+import time
 from .const import prod_url
 import requests
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+# response header carrying the key to continue paging from. Absent on the last page
+NEXT_AFTER_HEADER = "X-Gumbo-Next-After"
+
+# response header giving the packed type of each column of a page, so that every page can be given the same dtypes
+COLUMN_TYPES_HEADER = "X-Gumbo-Column-Types"
+
+# the number of tables get_many fetches at once by default. requests keeps up to 10 connections to a host open, so
+# going beyond that would mean opening new connections for some tables
+GET_MANY_MAX_WORKERS = 8
+
+# request bodies smaller than this are sent uncompressed
+MIN_COMPRESSED_BODY_SIZE = 1024
+
+# each request of a chunked upload is tried this many times, waiting UPLOAD_RETRY_DELAY seconds (doubling each
+# time) between attempts
+UPLOAD_ATTEMPTS = 4
+UPLOAD_RETRY_DELAY = 1.0
+
+# the responses to starting an upload which mean the service can't take uploads (an older service without the
+# endpoint, or a database without the upload tables), so the write is sent in one request instead
+UPLOADS_UNAVAILABLE_STATUS_CODES = (404, 405, 501)
+
+
+class TableChanges(NamedTuple):
+    # pass this as `since` to get the changes made after these
+    watermark: int
+    primary_key: str
+    # if True, `upserted` is the entire table and any rows not in it should be dropped
+    full_refresh: bool
+    # the current version of each row inserted or updated since the last watermark
+    upserted: pd.DataFrame
+    # the primary keys of the rows deleted since the last watermark (a dataframe with the one column)
+    deleted: pd.DataFrame
+
+
+class TableFingerprint(NamedTuple):
+    primary_key: str
+    # a digest of the whole table, which changes whenever any row is inserted, updated or deleted
+    digest: str
+    row_count: int
+    # a dataframe of the primary key and a "row_hash" column, or None if the row hashes weren't asked for
+    row_hashes: Optional[pd.DataFrame]
+
+
+def changed_keys(
+    previous: TableFingerprint, current: TableFingerprint
+) -> Tuple[List, List]:
+    """
+    Compare two fingerprints of a table (both fetched with row_hashes=True) and return the keys of the rows which
+    were inserted or updated in between, and the keys of the rows which were deleted.
+    """
+    primary_key = current.primary_key
+    previous_hashes = previous.row_hashes.set_index(primary_key)["row_hash"]
+    current_hashes = current.row_hashes.set_index(primary_key)["row_hash"]
+    changed = current_hashes.ne(previous_hashes.reindex(current_hashes.index))
+    # a key which is new lines up with a missing previous hash, which counts as changed
+    changed = changed.to_numpy(dtype=bool, na_value=True)
+    deleted = previous_hashes.index.difference(current_hashes.index)
+    return list(current_hashes.index[changed]), list(deleted)
 
 
 class Client:
-    def __init__(self, *, authed_session=None, username=None, base_url=prod_url):
+    def __init__(
+        self,
+        *,
+        authed_session=None,
+        username=None,
+        base_url=prod_url,
+        use_arrow=None,
+        cache_dir=None,
+        cache_max_bytes=2 * 1024**3,
+        compression="gzip",
+        compression_level=None,
+        upload_chunk_rows=20000,
+    ):
         """
         `username` is purely for informational purposes in the audit log, so provide the name of the program
         if this is being run non-interactively.
+
+        `use_arrow` controls whether tables are requested in Arrow IPC format (which is faster to decode than
+        JSON). By default Arrow is used if pyarrow is installed. The service falls back to JSON if it can't
+        produce Arrow.
+
+        If `cache_dir` is given, tables fetched with `get` are saved there (up to `cache_max_bytes` in total, after
+        which the least recently used are deleted). The next `get` of the same table only downloads it again if
+        the service reports that it has changed.
+
+        `compression` is the encoding ("gzip", "zstd" or None for no compression) used for the bodies of writes.
+        zstd needs the zstandard package. If the service doesn't accept the encoding, the write is retried
+        uncompressed and later writes are not compressed. Responses are compressed with whatever the HTTP library
+        accepts, which is gzip for requests.
+
+        Writes of more than `upload_chunk_rows` rows are sent as a chunked upload: the rows are sent
+        `upload_chunk_rows` at a time, each request being retried if it fails, and then applied by the service in a
+        single transaction. If the service can't take uploads, they're sent in a single request instead.
         """
+        if use_arrow is None:
+            use_arrow = arrow_is_available()
         if not authed_session:
             authed_session = create_authorized_session()
 
@@ -29,6 +135,16 @@ class Client:
         self.username = username
         self.authed_session = authed_session
         self.base_url = base_url
+        self.use_arrow = use_arrow
+        self.cache = None
+        if cache_dir is not None:
+            self.cache = TableCache(cache_dir, max_bytes=cache_max_bytes)
+        if compression is not None:
+            # fail now rather than on the first write
+            codecs.compressobj(compression, compression_level)
+        self.compression = compression
+        self.compression_level = compression_level
+        self.upload_chunk_rows = upload_chunk_rows
 
     def _check_response_code(self, response):
         if response.status_code == 404:
@@ -38,43 +154,329 @@ class Client:
                 f"{response.status_code} Error from Gumbo REST Service: {response.text}"
             )
 
-    def get(self, table_name: str) -> pd.DataFrame:
+    def _accept_header(self):
+        if self.use_arrow:
+            return {"Accept": f"{ARROW_MEDIA_TYPE}, application/json;q=0.9"}
+        # the chunked format is streamed by the service straight from the database. Older services only have JSON
+        return {"Accept": f"{PACKED_CHUNKS_MEDIA_TYPE}, application/json;q=0.9"}
+
+    def _unpack_response(self, response):
+        content_type = response.headers.get("content-type", "")
+        if content_type.startswith(ARROW_MEDIA_TYPE):
+            return unpack_arrow(response.content)
+        if content_type.startswith(PACKED_CHUNKS_MEDIA_TYPE):
+            return unpack_chunks(response.content.splitlines())
+        return unpack(response.json())
+
+    def _load_cached_response(self, cached: CachedResponse):
+        if cached.content_type.startswith(ARROW_MEDIA_TYPE):
+            import pyarrow
+
+            # map the file rather than reading it, so the table is only copied once (into the dataframe)
+            with pyarrow.memory_map(cached.path) as source:
+                return unpack_arrow(source)
+        with open(cached.path, "rb") as fd:
+            if cached.content_type.startswith(PACKED_CHUNKS_MEDIA_TYPE):
+                return unpack_chunks(fd)
+            return unpack(json.load(fd))
+
+    def get(self, table_name: str, *, columns=None, filters=None) -> pd.DataFrame:
+        """
+        Download the table, ordered by its primary key.
+
+        `columns` is a list of the names of the columns to fetch (all columns if None). `filters` is a list of
+        (column, operator, value) tuples, and only rows matching all of them are fetched. The operator is one of
+        "=", "<", "<=", ">", ">=" or "in" (with a list of values). For example:
+
+            client.get("model", columns=["model_id", "stripped_cell_line_name"],
+                       filters=[("date_created", ">=", "2023-01-01")])
+        """
         url = f"{self.base_url}/table/{table_name}"
-        response = self.authed_session.request("GET", url)
+        params = {}
+        if columns is not None:
+            params["columns"] = list(columns)
+        if filters is not None:
+            # values such as dates which json can't represent are sent as strings and cast by the service
+            params["filters"] = json.dumps([list(f) for f in filters], default=str)
+        headers = self._accept_header()
+
+        cached = None
+        if self.cache is not None:
+            cache_key = TableCache.key(url, params, headers["Accept"])
+            cached = self.cache.lookup(cache_key)
+            if cached is not None:
+                headers["If-None-Match"] = cached.etag
+
+        response = self.authed_session.request(
+            "GET", url, params=params, headers=headers
+        )
+        if cached is not None and response.status_code == 304:
+            self.cache.touch(cache_key)
+            return self._load_cached_response(cached)
         self._check_response_code(response)
-        return unpack(response.json())
 
-    def insert_only(self, table_name, new_rows_df, *, reason=None):
+        etag = response.headers.get("etag")
+        if self.cache is not None and etag is not None:
+            self.cache.store(
+                cache_key,
+                etag,
+                response.headers.get("content-type", ""),
+                response.content,
+            )
+        return self._unpack_response(response)
+
+    def get_many(
+        self, table_names: List[str], *, max_workers=GET_MANY_MAX_WORKERS
+    ) -> Dict[str, pd.DataFrame]:
         """
-        Insert the given rows. Do not update or delete any existing rows.
+        Download several tables at once, returning a dict of table name to dataframe. Up to `max_workers` tables
+        are fetched (and decoded) concurrently, so this takes about as long as the slowest table rather than the
+        sum of them all.
 
-        If a column is in the table but missing from the dataframe, it is populated with a default value (typically null)
-        For tables which have auto-generated ID columns, the dataframe does not need to contain ID values.
+        Every table is attempted even if some fail. If any do, GetManyFailed is raised with the error for each
+        failed table and the dataframes of those which succeeded.
+        """
+        table_names = list(dict.fromkeys(table_names))
+        tables = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                table_name: executor.submit(self.get, table_name)
+                for table_name in table_names
+            }
+            for table_name, future in futures.items():
+                try:
+                    tables[table_name] = future.result()
+                except Exception as e:
+                    errors[table_name] = e
+        if errors:
+            raise GetManyFailed(errors, tables)
+        return tables
+
+    def iter_table(
+        self, table_name: str, *, chunk_rows: int = 10000
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Download the table in chunks of up to `chunk_rows` rows, yielding each as a dataframe in primary key order.
+        Every chunk has the same dtypes, which are those of the table's column types.
+
+        Only one chunk is held in memory at a time, so this can be used to process tables which are too large to
+        `get` in one go. The table must have a single primary key column. Rows changed while iterating may or may
+        not be seen, depending on whether their key is before or after the current chunk.
+        """
+        url = f"{self.base_url}/table/{table_name}/page"
+        after = None
+        while True:
+            params = {"limit": chunk_rows}
+            if after is not None:
+                params["after"] = after
+            response = self.authed_session.request(
+                "GET", url, params=params, headers=self._accept_header()
+            )
+            self._check_response_code(response)
+            # the types a page unpacks to depend on its values (ie: a column with no values on this page), so
+            # cast them to the types of the table's columns
+            df = cast_to_packed_types(
+                self._unpack_response(response),
+                json.loads(response.headers.get(COLUMN_TYPES_HEADER, "{}")),
+            )
+            if len(df) > 0:
+                yield df
 
-        Throw an exception if a given row already exists in the table.
+            next_after = response.headers.get(NEXT_AFTER_HEADER)
+            if next_after is None:
+                return
+            after = unquote(next_after)
+
+    def get_changes(self, table_name: str, since: Optional[int] = None) -> TableChanges:
+        """
+        Fetch the rows which changed since the watermark `since` from a previous call (or the whole table if
+        `since` is None). See `TableMirror` for a local copy of a table which is kept up to date with this.
+        """
+        url = f"{self.base_url}/table/{table_name}/changes"
+        params = {}
+        if since is not None:
+            params["since"] = since
+        response = self.authed_session.request("GET", url, params=params)
+        self._check_response_code(response)
+        result = response.json()
+        # give the rows the types of the table's columns rather than the types their values happen to look like
+        column_types = result.get("column_types", {})
+        return TableChanges(
+            watermark=result["watermark"],
+            primary_key=result["primary_key"],
+            full_refresh=result["full_refresh"],
+            upserted=cast_to_packed_types(unpack(result["upserted"]), column_types),
+            deleted=cast_to_packed_types(unpack(result["deleted"]), column_types),
+        )
+
+    def get_fingerprint(
+        self, table_name: str, *, columns=None, row_hashes=False
+    ) -> TableFingerprint:
+        """
+        Fetch a digest of the table's contents, which is computed by the database so the table isn't downloaded.
+        With `row_hashes=True` the hash of every row is fetched as well. Pass two such fingerprints to
+        `changed_keys` to find the rows which changed in between, and then fetch only those with
+        `get(table_name, filters=[(primary_key, "in", keys)])`.
         """
+        url = f"{self.base_url}/table/{table_name}/fingerprint"
+        params = {"row_hashes": "true" if row_hashes else "false"}
+        if columns is not None:
+            params["columns"] = list(columns)
+        response = self.authed_session.request("GET", url, params=params)
+        self._check_response_code(response)
+        result = response.json()
+        return TableFingerprint(
+            primary_key=result["primary_key"],
+            digest=result["digest"],
+            row_count=result["row_count"],
+            row_hashes=None
+            if result["row_hashes"] is None
+            else unpack(result["row_hashes"]),
+        )
+
+    def _send_json(self, method, url, payload):
+        body = json.dumps(payload).encode("utf8")
+        if self.compression is None or len(body) < MIN_COMPRESSED_BODY_SIZE:
+            return self.authed_session.request(method, url, data=body)
+
+        response = self.authed_session.request(
+            method,
+            url,
+            data=codecs.compress(body, self.compression, self.compression_level),
+            headers={"Content-Encoding": self.compression},
+        )
+        if response.status_code in (415, 422):
+            # an older service (or a proxy) which doesn't understand the encoding either says so or fails to
+            # parse the body. Neither applied the write, so resend it uncompressed
+            retry = self.authed_session.request(method, url, data=body)
+            if response.status_code == 415 or retry.status_code != 422:
+                self.compression = None
+            response = retry
+        return response
+
+    def _with_retries(self, send):
+        "call send() until it returns a response which isn't a server error, up to UPLOAD_ATTEMPTS times"
+        for attempt in range(UPLOAD_ATTEMPTS):
+            last_attempt = attempt == UPLOAD_ATTEMPTS - 1
+            try:
+                response = send()
+            except requests.RequestException:
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code < 500 or last_attempt:
+                    return response
+            time.sleep(UPLOAD_RETRY_DELAY * 2**attempt)
+
+    def _upload(self, upload_id, rows_df, received_chunk_ids, chunk_rows):
+        chunk_count = (len(rows_df) + chunk_rows - 1) // chunk_rows
+        try:
+            for chunk_id in range(chunk_count):
+                if chunk_id in received_chunk_ids:
+                    continue
+                chunk = pack(
+                    rows_df.iloc[chunk_id * chunk_rows : (chunk_id + 1) * chunk_rows]
+                )
+                url = f"{self.base_url}/upload/{upload_id}/chunk/{chunk_id}"
+                response = self._with_retries(
+                    lambda: self._send_json("PUT", url, chunk)
+                )
+                self._check_response_code(response)
+
+            # committing twice does nothing, so this is safe to retry too
+            url = f"{self.base_url}/upload/{upload_id}/commit"
+            response = self._with_retries(
+                lambda: self._send_json("POST", url, {"chunk_count": chunk_count})
+            )
+            self._check_response_code(response)
+        except Exception as e:
+            # the chunks which did arrive are kept, so the upload can be resumed from here
+            raise UploadFailed(upload_id) from e
+
+    def _patch(self, mode, table_name, rows_df, reason, **options):
         url = f"{self.base_url}/table/{table_name}"
         payload = {
-            "mode": "insert_only",
+            "mode": mode,
             "username": self.username,
-            "data": pack(new_rows_df),
+            "data": pack(rows_df),
             "reason": reason,
+            **options,
         }
-        response = self.authed_session.request("PATCH", url, data=json.dumps(payload))
+        response = self._send_json("PATCH", url, payload)
+        self._check_response_code(response)
+
+    def _write(self, mode, table_name, rows_df, reason):
+        if len(rows_df) <= self.upload_chunk_rows:
+            self._patch(mode, table_name, rows_df, reason)
+            return
+
+        url = f"{self.base_url}/table/{table_name}/upload"
+        payload = {"mode": mode, "username": self.username, "reason": reason}
+        # not retried, since a request which failed after creating the upload would leave it behind
+        response = self._send_json("POST", url, payload)
+        if response.status_code in UPLOADS_UNAVAILABLE_STATUS_CODES:
+            # an unknown table gets a 404 from PATCH too, which reports it properly
+            self._patch(mode, table_name, rows_df, reason)
+            return
         self._check_response_code(response)
+        self._upload(
+            response.json()["upload_id"], rows_df, set(), self.upload_chunk_rows
+        )
+
+    def resume_upload(self, upload_id, rows_df, *, chunk_rows=None):
+        """
+        Finish an upload which raised UploadFailed. Pass the same dataframe (and `upload_chunk_rows`) as the
+        original write: only the chunks the service didn't receive are sent before the upload is committed.
+        """
+        if chunk_rows is None:
+            chunk_rows = self.upload_chunk_rows
+        response = self._with_retries(
+            lambda: self.authed_session.request(
+                "GET", f"{self.base_url}/upload/{upload_id}"
+            )
+        )
+        self._check_response_code(response)
+        upload = response.json()
+        if upload["status"] == "committed":
+            return
+        self._upload(upload_id, rows_df, set(upload["chunk_ids"]), chunk_rows)
+
+    def insert_only(self, table_name, new_rows_df, *, reason=None):
+        """
+        Insert the given rows. Do not update or delete any existing rows.
+
+        If a column is in the table but missing from the dataframe, it is populated with a default value (typically null)
+        For tables which have auto-generated ID columns, the dataframe does not need to contain ID values.
+
+        Throw an exception if a given row already exists in the table. Large dataframes are sent as a chunked
+        upload, which raises UploadFailed if it can't be completed (see `resume_upload`).
+        """
+        self._write("insert_only", table_name, new_rows_df, reason)
 
     def update_only(self, table_name, updated_rows_df, *, reason=None):
         """
         Update the given rows. Do not delete any existing rows or insert any new rows.
 
-        Throw an exception if a given row does not already exist in the table.
+        Throw an exception if a given row does not already exist in the table. Large dataframes are sent as a
+        chunked upload, like with `insert_only`.
         """
-        url = f"{self.base_url}/table/{table_name}"
-        payload = {
-            "mode": "update_only",
-            "username": self.username,
-            "data": pack(updated_rows_df),
-            "reason": reason,
-        }
-        response = self.authed_session.request("PATCH", url, data=json.dumps(payload))
-        self._check_response_code(response)
+        self._write("update_only", table_name, updated_rows_df, reason)
+
+    def sync(self, table_name, df, *, delete_missing_rows=False, reason=None):
+        """
+        Make the table match df in a single request: insert the rows which are new, update the rows which changed
+        and, if delete_missing_rows is set, delete the rows which aren't in df. Columns missing from df are left
+        as they are.
+
+        The service works out what changed in the database and applies it in one transaction, so there's no need
+        to `get` the table first. Unlike `insert_only` and `update_only`, the dataframe is always sent in one
+        (compressed) request, since the change can only be worked out once all of the rows have arrived.
+        """
+        self._patch(
+            "sync",
+            table_name,
+            df,
+            reason,
+            delete_missing_rows=delete_missing_rows,
+        )
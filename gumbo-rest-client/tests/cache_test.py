@@ -0,0 +1,43 @@
+import os
+
+from gumbo_rest_client.cache import TableCache
+
+
+def test_store_and_lookup(tmpdir):
+    cache = TableCache(str(tmpdir))
+    key = TableCache.key("http://host/table/sample", {}, "application/json")
+    assert cache.lookup(key) is None
+
+    cache.store(key, '"etag1"', "application/json", b"body")
+    cached = cache.lookup(key)
+    assert cached.etag == '"etag1"'
+    assert cached.content_type == "application/json"
+    with open(cached.path, "rb") as fd:
+        assert fd.read() == b"body"
+
+    assert key != TableCache.key(
+        "http://host/table/sample", {"columns": ["id"]}, "application/json"
+    )
+
+
+def test_least_recently_used_are_evicted(tmpdir):
+    cache = TableCache(str(tmpdir), max_bytes=25)
+    keys = [TableCache.key(f"http://host/table/t{i}", {}, "") for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        cache.store(key, f'"{i}"', "application/json", b"x" * 10)
+        os.utime(cache.lookup(key).path, (i, i))
+
+    # using the older entry makes the other one the least recently used
+    cache.touch(keys[0])
+    cache.store(keys[2], '"2"', "application/json", b"x" * 10)
+
+    assert cache.lookup(keys[0]) is not None
+    assert cache.lookup(keys[1]) is None
+    assert cache.lookup(keys[2]) is not None
+
+
+def test_entries_larger_than_the_cache_are_not_stored(tmpdir):
+    cache = TableCache(str(tmpdir), max_bytes=5)
+    key = TableCache.key("http://host/table/sample", {}, "")
+    assert cache.store(key, '"1"', "application/json", b"x" * 10) is None
+    assert cache.lookup(key) is None
@@ -1,10 +1,14 @@
 from pytest import fixture
-from gumbo_rest_client import Client
-from gumbo_rest_client.exceptions import UnknownTable
+from gumbo_rest_client import Client, TableMirror
+from gumbo_rest_client.exceptions import UnknownTable, UploadFailed
+import gumbo_rest_client.rest_client
+from gumbo_dao import GumboDAO, UPLOAD_TABLES_SCHEMA, AUDIT_TABLE_VERSION_INDEX
+import requests
 import gumbo_rest_service.main
 import pandas as pd
 from fastapi.testclient import TestClient
 import psycopg2
+import httpx
 import os
 import pytest
 
@@ -41,6 +45,12 @@ pytestmark = pytest.mark.skipif(
 @fixture
 def http_client(monkeypatch):
     monkeypatch.setenv("GUMBO_CONNECTION_STRING", os.environ["POSTGRES_TEST_DB"])
+    # the tables are recreated for each test without the service knowing, so don't let it serve cached responses
+    monkeypatch.setattr(
+        gumbo_rest_service.main,
+        "response_cache",
+        gumbo_rest_service.main.ResponseCache(),
+    )
     return TestClient(gumbo_rest_service.main.app)
 
 
@@ -91,6 +101,360 @@ def test_get_table(gumbo_client, sample_tables):
     ]
 
 
+def test_get_table_as_arrow_matches_json(http_client, sample_tables):
+    pytest.importorskip("pyarrow")
+    arrow_client = Client(
+        username="testuser", authed_session=http_client, use_arrow=True
+    )
+    json_client = Client(
+        username="testuser", authed_session=http_client, use_arrow=False
+    )
+    arrow_df = arrow_client.get("sample")
+    json_df = json_client.get("sample")
+    assert list(arrow_df.dtypes) == list(json_df.dtypes)
+    assert arrow_df.equals(json_df)
+
+
+def test_get_table_as_chunks_matches_json(http_client, sample_tables):
+    from dataframe_json_packing import unpack, unpack_chunks, PACKED_CHUNKS_MEDIA_TYPE
+
+    connection = psycopg2.connect(os.environ["POSTGRES_TEST_DB"])
+    connection.autocommit = True
+    cursor = connection.cursor()
+    # enough rows for several chunks, with a chunk where the date column is all null
+    cursor.execute(
+        """INSERT INTO sample (ID, INTCOL, STRCOL, FLOATCOL, DATECOL, BOOLCOL)
+        SELECT 'id' || lpad(i::text, 6, '0'), i, md5(i::text), i / 2.0,
+               CASE WHEN i > 15000 THEN DATE '2000-01-01' + i END, i % 2 = 0
+        FROM generate_series(1, 25000) AS i"""
+    )
+    connection.close()
+
+    response = http_client.get(
+        "/table/sample", headers={"Accept": PACKED_CHUNKS_MEDIA_TYPE}
+    )
+    assert response.headers["content-type"] == PACKED_CHUNKS_MEDIA_TYPE
+    lines = response.content.splitlines()
+    assert len(lines) == 3
+    chunks_df = unpack_chunks(lines)
+
+    json_df = unpack(
+        http_client.get("/table/sample", headers={"Accept": "application/json"}).json()
+    )
+    assert list(chunks_df.dtypes) == list(json_df.dtypes)
+    assert chunks_df.equals(json_df)
+
+    client = Client(username="testuser", authed_session=http_client, use_arrow=False)
+    assert client.get("sample").equals(json_df)
+
+
+def test_get_columns_and_filters(gumbo_client, sample_tables):
+    df = pd.DataFrame({"id": [f"id{i}" for i in range(5)], "intcol": list(range(5))})
+    gumbo_client.insert_only("sample", df)
+
+    fetched_df = gumbo_client.get(
+        "sample",
+        columns=["id", "intcol"],
+        filters=[("intcol", ">=", 1), ("id", "in", ["id0", "id1", "id3"])],
+    )
+    assert list(fetched_df.columns) == ["id", "intcol"]
+    assert list(fetched_df["id"]) == ["id1", "id3"]
+
+    fetched_df = gumbo_client.get(
+        "sample", filters=[("datecol", "=", datetime.date(2000, 1, 1))]
+    )
+    assert list(fetched_df["id"]) == ["id"]
+
+    with pytest.raises(Exception, match="400"):
+        gumbo_client.get("sample", columns=["missing"])
+    with pytest.raises(Exception, match="400"):
+        gumbo_client.get("sample", filters=[("intcol", "=", "not a number")])
+
+
+def test_invalid_filter_value_when_streaming_chunks(http_client, sample_tables):
+    # without Arrow the table is streamed in chunks, and the query still has to fail before the response starts
+    client = Client(username="testuser", authed_session=http_client, use_arrow=False)
+    with pytest.raises(Exception, match="400"):
+        client.get("sample", filters=[("intcol", "=", "not a number")])
+    # the failed query didn't leave its transaction open
+    assert list(client.get("sample", filters=[("intcol", "=", 1)])["id"]) == ["id"]
+
+
+def test_iter_table(gumbo_client, sample_tables):
+    df = pd.DataFrame({"id": [f"id{i}" for i in range(5)], "intcol": list(range(5))})
+    gumbo_client.insert_only("sample", df)
+
+    chunks = list(gumbo_client.iter_table("sample", chunk_rows=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 2]
+    combined = pd.concat(chunks, ignore_index=True)
+    assert list(combined["id"]) == ["id", "id0", "id1", "id2", "id3", "id4"]
+    assert combined.equals(gumbo_client.get("sample"))
+
+
+def test_iter_table_pages_have_the_same_dtypes(gumbo_client, sample_tables):
+    # unlike the first page, the second's float is a whole number and it has no ints or booleans
+    df = pd.DataFrame({"id": ["id0", "id1"], "floatcol": [2.0, 2.5]})
+    gumbo_client.insert_only("sample", df)
+
+    chunks = list(gumbo_client.iter_table("sample", chunk_rows=1))
+    assert [str(chunk["floatcol"].dtype) for chunk in chunks] == ["Float64"] * 3
+    assert [str(chunk["intcol"].dtype) for chunk in chunks] == ["Int64"] * 3
+    assert [str(chunk["boolcol"].dtype) for chunk in chunks] == ["boolean"] * 3
+    assert list(pd.concat(chunks, ignore_index=True)["floatcol"]) == [1.1, 2.0, 2.5]
+
+
+def test_iter_table_with_array_columns(gumbo_client, sample_tables):
+    connection = psycopg2.connect(os.environ["POSTGRES_TEST_DB"])
+    connection.autocommit = True
+    cursor = connection.cursor()
+    cursor.execute("DROP TABLE IF EXISTS array_sample")
+    cursor.execute(
+        "CREATE TABLE array_sample (ID TEXT PRIMARY KEY, TAGS TEXT[], COUNTS INTEGER[])"
+    )
+    cursor.execute(
+        "INSERT INTO array_sample VALUES ('a', ARRAY['x', 'y'], ARRAY[1, 2]), ('b', NULL, NULL)"
+    )
+
+    chunks = list(gumbo_client.iter_table("array_sample", chunk_rows=1))
+    combined = pd.concat(chunks, ignore_index=True)
+    assert list(combined["tags"]) == [["x", "y"], None]
+    assert list(combined["counts"]) == [[1, 2], None]
+
+    cursor.execute("DROP TABLE array_sample")
+    cursor.close()
+    connection.close()
+
+
+# a cut down version of the audit trigger installed on the gumbo tables, recording the columns get_changes uses
+AUDIT_SCHEMA = """
+DROP SCHEMA IF EXISTS audit CASCADE;
+CREATE SCHEMA audit;
+CREATE TABLE audit.logged_actions (
+    event_id bigserial PRIMARY KEY,
+    relid oid NOT NULL,
+    transaction_id bigint,
+    action TEXT NOT NULL,
+    row_data jsonb,
+    changed_fields jsonb
+);
+CREATE FUNCTION audit.if_modified_func() RETURNS TRIGGER AS $body$
+BEGIN
+    IF TG_LEVEL = 'STATEMENT' THEN
+        INSERT INTO audit.logged_actions (relid, transaction_id, action)
+        VALUES (TG_RELID, txid_current(), 'T');
+    ELSIF TG_OP = 'INSERT' THEN
+        INSERT INTO audit.logged_actions (relid, transaction_id, action, row_data)
+        VALUES (TG_RELID, txid_current(), 'I', to_jsonb(NEW));
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO audit.logged_actions (relid, transaction_id, action, row_data, changed_fields)
+        VALUES (TG_RELID, txid_current(), 'U', to_jsonb(OLD), to_jsonb(NEW));
+    ELSE
+        INSERT INTO audit.logged_actions (relid, transaction_id, action, row_data)
+        VALUES (TG_RELID, txid_current(), 'D', to_jsonb(OLD));
+    END IF;
+    RETURN NULL;
+END;
+$body$ LANGUAGE plpgsql;
+CREATE TRIGGER audit_trigger_row AFTER INSERT OR UPDATE OR DELETE ON sample
+    FOR EACH ROW EXECUTE PROCEDURE audit.if_modified_func();
+CREATE TRIGGER audit_trigger_stm AFTER TRUNCATE ON sample
+    FOR EACH STATEMENT EXECUTE PROCEDURE audit.if_modified_func();
+"""
+
+
+@fixture
+def audited_sample_tables(sample_tables):
+    connection = psycopg2.connect(os.environ["POSTGRES_TEST_DB"])
+    connection.autocommit = True
+    cursor = connection.cursor()
+    cursor.execute(AUDIT_SCHEMA)
+    cursor.execute(AUDIT_TABLE_VERSION_INDEX.format(audit_table="audit.logged_actions"))
+    cursor.close()
+
+    yield connection
+
+    cursor = connection.cursor()
+    cursor.execute("DROP SCHEMA audit CASCADE")
+    cursor.close()
+    connection.close()
+
+
+def test_get_changes(gumbo_client, audited_sample_tables):
+    changes = gumbo_client.get_changes("sample")
+    assert changes.full_refresh
+    assert changes.primary_key == "id"
+    assert list(changes.upserted["id"]) == ["id"]
+
+    gumbo_client.insert_only("sample", pd.DataFrame({"id": ["id2"], "intcol": [2]}))
+    gumbo_client.update_only("sample", pd.DataFrame({"id": ["id"], "intcol": [5]}))
+
+    changes = gumbo_client.get_changes("sample", since=changes.watermark)
+    assert not changes.full_refresh
+    assert list(changes.upserted["id"]) == ["id", "id2"]
+    assert list(changes.upserted["intcol"]) == [5, 2]
+    assert len(changes.deleted) == 0
+
+    cursor = audited_sample_tables.cursor()
+    cursor.execute("DELETE FROM sample WHERE id = 'id'")
+    cursor.close()
+
+    changes = gumbo_client.get_changes("sample", since=changes.watermark)
+    assert list(changes.upserted["id"]) == []
+    assert list(changes.deleted["id"]) == ["id"]
+
+
+def test_fingerprint(gumbo_client, sample_tables):
+    from gumbo_rest_client import changed_keys
+
+    gumbo_client.insert_only(
+        "sample", pd.DataFrame({"id": ["id2", "id3"], "intcol": [2, 3]})
+    )
+    before = gumbo_client.get_fingerprint("sample", row_hashes=True)
+    assert before.primary_key == "id"
+    assert before.row_count == 3
+    assert list(before.row_hashes["id"]) == ["id", "id2", "id3"]
+    # the digest computed in the database matches the one computed from the row hashes
+    assert gumbo_client.get_fingerprint("sample").digest == before.digest
+    assert gumbo_client.get_fingerprint("sample").row_hashes is None
+
+    gumbo_client.update_only("sample", pd.DataFrame({"id": ["id2"], "intcol": [5]}))
+    gumbo_client.insert_only("sample", pd.DataFrame({"id": ["id4"], "intcol": [4]}))
+    connection = psycopg2.connect(os.environ["POSTGRES_TEST_DB"])
+    connection.autocommit = True
+    cursor = connection.cursor()
+    cursor.execute("DELETE FROM sample WHERE id = 'id3'")
+    cursor.close()
+    connection.close()
+
+    after = gumbo_client.get_fingerprint("sample", row_hashes=True)
+    assert after.digest != before.digest
+    assert changed_keys(before, after) == (["id2", "id4"], ["id3"])
+    assert changed_keys(after, after) == ([], [])
+
+    # only the given columns are hashed
+    strcol_before = gumbo_client.get_fingerprint("sample", columns=["strcol"])
+    gumbo_client.update_only("sample", pd.DataFrame({"id": ["id"], "intcol": [7]}))
+    assert (
+        gumbo_client.get_fingerprint("sample", columns=["strcol"]).digest
+        == strcol_before.digest
+    )
+
+
+def test_table_mirror(gumbo_client, audited_sample_tables, tmpdir):
+    path = str(tmpdir.join("sample.pkl"))
+    mirror = TableMirror(gumbo_client, "sample", path=path)
+    initial_df = mirror.refresh()
+    assert list(initial_df["id"]) == ["id"]
+
+    gumbo_client.insert_only(
+        "sample", pd.DataFrame({"id": ["id2", "id3"], "intcol": [2, 3]})
+    )
+    cursor = audited_sample_tables.cursor()
+    cursor.execute("DELETE FROM sample WHERE id = 'id'")
+    cursor.execute("UPDATE sample SET strcol = 'changed' WHERE id = 'id3'")
+    cursor.close()
+
+    # a new mirror picks up where the saved one left off
+    mirror = TableMirror(gumbo_client, "sample", path=path)
+    df = mirror.refresh()
+    expected = gumbo_client.get("sample")
+    assert list(df["id"]) == ["id2", "id3"]
+    assert list(df["strcol"]) == list(expected["strcol"])
+    # columns which are entirely null in the changed rows keep their types
+    assert list(df.dtypes) == list(initial_df.dtypes)
+
+    cursor = audited_sample_tables.cursor()
+    cursor.execute("TRUNCATE sample")
+    cursor.close()
+    assert len(mirror.refresh()) == 0
+
+
+def test_table_mirror_keeps_float_values(gumbo_client, audited_sample_tables):
+    cursor = audited_sample_tables.cursor()
+    cursor.execute("UPDATE sample SET floatcol = 1.0")
+    cursor.execute("INSERT INTO sample (ID, FLOATCOL) VALUES ('id2', 2.0)")
+    cursor.close()
+    mirror = TableMirror(gumbo_client, "sample")
+    assert list(mirror.refresh()["floatcol"]) == [1.0, 2.0]
+
+    cursor = audited_sample_tables.cursor()
+    cursor.execute("UPDATE sample SET floatcol = 2.5 WHERE id = 'id2'")
+    cursor.close()
+    assert list(mirror.refresh()["floatcol"]) == [1.0, 2.5]
+
+
+def test_get_with_cache(http_client, audited_sample_tables, tmpdir):
+    client = Client(
+        username="testuser", authed_session=http_client, cache_dir=str(tmpdir)
+    )
+    df = client.get("sample")
+
+    loads = []
+    load_cached_response = client._load_cached_response
+
+    def _load_cached_response(cached):
+        loads.append(cached)
+        return load_cached_response(cached)
+
+    client._load_cached_response = _load_cached_response
+
+    # unchanged, so the service replies 304 and the saved copy is used
+    cached_df = client.get("sample")
+    assert len(loads) == 1
+    assert cached_df.equals(df)
+
+    client.update_only("sample", pd.DataFrame({"id": ["id"], "intcol": [7]}))
+    updated_df = client.get("sample")
+    assert len(loads) == 1
+    assert list(updated_df["intcol"]) == [7]
+
+
+def test_table_version_waits_for_earlier_writers(audited_sample_tables):
+    dao = GumboDAO(audited_sample_tables)
+    version = dao.get_table_version("sample")
+    assert dao.get_table_version("sample") == version
+
+    # the first writer takes an event_id and commits after a second writer has taken and committed a later one
+    first_writer = psycopg2.connect(os.environ["POSTGRES_TEST_DB"])
+    cursor = first_writer.cursor()
+    cursor.execute("INSERT INTO sample (ID, INTCOL) VALUES ('first', 1)")
+    cursor = audited_sample_tables.cursor()
+    cursor.execute("INSERT INTO sample (ID, INTCOL) VALUES ('second', 2)")
+    cursor.close()
+    while_writing_version = dao.get_table_version("sample")
+    assert while_writing_version != version
+
+    first_writer.commit()
+    first_writer.close()
+    committed_version = dao.get_table_version("sample")
+    assert committed_version not in (version, while_writing_version)
+    assert dao.get_table_version("sample") == committed_version
+
+
+def test_table_version_ignores_writes_to_other_tables(audited_sample_tables):
+    dao = GumboDAO(audited_sample_tables)
+    version = dao.get_table_version("sample")
+
+    cursor = audited_sample_tables.cursor()
+    cursor.execute("DROP TABLE IF EXISTS other_sample")
+    cursor.execute("CREATE TABLE other_sample (id varchar(10) PRIMARY KEY)")
+    cursor.close()
+    other_writer = psycopg2.connect(os.environ["POSTGRES_TEST_DB"])
+    cursor = other_writer.cursor()
+    cursor.execute("INSERT INTO other_sample (id) VALUES ('x')")
+    # a later, committed write, so the snapshot shows the first one as still in progress
+    cursor = audited_sample_tables.cursor()
+    cursor.execute("INSERT INTO other_sample (id) VALUES ('y')")
+    cursor.close()
+    assert dao.get_table_version("sample") == version
+
+    other_writer.rollback()
+    other_writer.close()
+    cursor = audited_sample_tables.cursor()
+    cursor.execute("DROP TABLE other_sample")
+    cursor.close()
+
+
 def test_get_missing_table(gumbo_client):
     with pytest.raises(UnknownTable):
         gumbo_client.get("missing_table")
@@ -118,6 +482,272 @@ def test_insert_only(gumbo_client, sample_tables):
     assert list(fetched_df["intcol"]) == [1, 2]
 
 
+def test_sync(gumbo_client, sample_tables):
+    gumbo_client.insert_only(
+        "sample", pd.DataFrame({"id": ["id2", "id3"], "intcol": [2, 3]})
+    )
+
+    df = pd.DataFrame({"id": ["id", "id2", "id4"], "intcol": [1, 5, 4]})
+    gumbo_client.sync("sample", df, reason="because")
+    fetched_df = gumbo_client.get("sample")
+    assert list(fetched_df["id"]) == ["id", "id2", "id3", "id4"]
+    assert list(fetched_df["intcol"]) == [1, 5, 3, 4]
+    # columns which weren't sent are left alone
+    assert list(fetched_df["strcol"].fillna("")) == ["str", "", "", ""]
+
+    connection = psycopg2.connect(os.environ["POSTGRES_TEST_DB"])
+    connection.autocommit = True
+    # the unchanged row "id" isn't counted as updated
+    assert _fetch_one(
+        connection,
+        "SELECT rows_inserted, rows_updated, rows_deleted FROM bulk_update_log WHERE reason = 'because'",
+    ) == (1, 1, 0)
+
+    gumbo_client.sync("sample", df, delete_missing_rows=True, reason="deleting")
+    fetched_df = gumbo_client.get("sample")
+    assert list(fetched_df["id"]) == ["id", "id2", "id4"]
+    assert _fetch_one(
+        connection,
+        "SELECT rows_inserted, rows_updated, rows_deleted FROM bulk_update_log WHERE reason = 'deleting'",
+    ) == (0, 0, 1)
+    connection.close()
+
+
+UUID_SAMPLE_KEYS = [
+    "00000000-0000-0000-0000-000000000001",
+    "00000000-0000-0000-0000-000000000002",
+]
+
+
+@fixture
+def uuid_sample_table(sample_tables):
+    connection = psycopg2.connect(os.environ["POSTGRES_TEST_DB"])
+    connection.autocommit = True
+    cursor = connection.cursor()
+    cursor.execute("DROP TABLE IF EXISTS uuid_sample")
+    cursor.execute("CREATE TABLE uuid_sample (ID UUID PRIMARY KEY, INTCOL INTEGER)")
+    cursor.execute(
+        "INSERT INTO uuid_sample (ID, INTCOL) VALUES (%s, 1), (%s, 2)",
+        UUID_SAMPLE_KEYS,
+    )
+    cursor.close()
+
+    yield connection
+
+    cursor = connection.cursor()
+    cursor.execute("DROP TABLE uuid_sample")
+    cursor.close()
+    connection.close()
+
+
+def test_delete_by_uuid_key(uuid_sample_table):
+    kept, deleted = UUID_SAMPLE_KEYS
+    # the keys are strings, which have to be compared with the uuid column
+    GumboDAO(uuid_sample_table).delete("testuser", "uuid_sample", "id", [deleted])
+    assert _fetch_one(
+        uuid_sample_table, "SELECT array_agg(CAST(ID AS text)) FROM uuid_sample"
+    ) == ([kept],)
+
+
+def test_sync_by_uuid_key(gumbo_client, uuid_sample_table):
+    kept, deleted = UUID_SAMPLE_KEYS
+    # the written and deleted rows are read back by key to verify the sync
+    gumbo_client.sync(
+        "uuid_sample",
+        pd.DataFrame({"id": [kept], "intcol": [3]}),
+        delete_missing_rows=True,
+    )
+    assert _fetch_one(
+        uuid_sample_table, "SELECT CAST(ID AS text), INTCOL FROM uuid_sample"
+    ) == (kept, 3)
+
+
+def test_sync_is_atomic(gumbo_client, sample_tables):
+    # the duplicate key makes the upsert fail after the missing row was deleted, so the delete is rolled back too
+    df = pd.DataFrame({"id": ["id2", "id2"], "intcol": [2, 3]})
+    with pytest.raises(Exception):
+        gumbo_client.sync("sample", df, delete_missing_rows=True)
+    assert list(gumbo_client.get("sample")["id"]) == ["id"]
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_insert_only_compressed(http_client, sample_tables, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    requests = []
+
+    class RecordingSession:
+        def request(self, method, url, **kwargs):
+            requests.append(kwargs.get("headers") or {})
+            return http_client.request(method, url, **kwargs)
+
+    client = Client(
+        username="testuser",
+        authed_session=RecordingSession(),
+        compression=compression,
+    )
+    df = pd.DataFrame(
+        {
+            "id": [f"id{i}" for i in range(200)],
+            "strcol": ["inserted"] * 200,
+            "intcol": range(200),
+        }
+    )
+    client.insert_only("sample", df, reason="because")
+    assert requests[-1] == {"Content-Encoding": compression}
+
+    fetched_df = client.get("sample")
+    assert len(fetched_df) == 201
+    assert list(fetched_df["strcol"]).count("inserted") == 200
+
+
+def test_compression_disabled_when_rejected(http_client, sample_tables):
+    class OldService:
+        def request(self, method, url, **kwargs):
+            if "Content-Encoding" in (kwargs.get("headers") or {}):
+                return httpx.Response(415, text="Unsupported Content-Encoding")
+            return http_client.request(method, url, **kwargs)
+
+    client = Client(username="testuser", authed_session=OldService())
+    df = pd.DataFrame({"id": [f"id{i}" for i in range(200)], "strcol": ["x"] * 200})
+    client.insert_only("sample", df)
+    assert client.compression is None
+    assert len(client.get("sample")) == 201
+
+
+@fixture
+def upload_tables(sample_tables, monkeypatch):
+    monkeypatch.setattr(gumbo_rest_client.rest_client, "UPLOAD_RETRY_DELAY", 0)
+    connection = psycopg2.connect(os.environ["POSTGRES_TEST_DB"])
+    connection.autocommit = True
+    cursor = connection.cursor()
+    cursor.execute("DROP TABLE IF EXISTS gumbo_upload_chunk")
+    cursor.execute("DROP TABLE IF EXISTS gumbo_upload")
+    cursor.execute(UPLOAD_TABLES_SCHEMA)
+    cursor.close()
+    yield connection
+    connection.close()
+
+
+def _fetch_one(connection, query):
+    cursor = connection.cursor()
+    cursor.execute(query)
+    result = cursor.fetchone()
+    cursor.close()
+    return result
+
+
+def test_chunked_insert_and_update(http_client, upload_tables):
+    requests_sent = []
+
+    class RecordingSession:
+        def request(self, method, url, **kwargs):
+            requests_sent.append((method, url))
+            return http_client.request(method, url, **kwargs)
+
+    client = Client(
+        username="testuser", authed_session=RecordingSession(), upload_chunk_rows=50
+    )
+    df = pd.DataFrame({"id": [f"id{i:03}" for i in range(120)], "intcol": range(120)})
+    client.insert_only("sample", df, reason="big insert")
+    assert [method for method, _ in requests_sent] == [
+        "POST",
+        "PUT",
+        "PUT",
+        "PUT",
+        "POST",
+    ]
+    assert requests_sent[1][1].endswith("/chunk/0")
+    assert requests_sent[-1][1].endswith("/commit")
+
+    fetched_df = client.get("sample")
+    assert len(fetched_df) == 121
+    assert list(fetched_df["intcol"][1:]) == list(range(120))
+    # logged as a single write
+    assert _fetch_one(
+        upload_tables, "SELECT rows_inserted, reason FROM bulk_update_log"
+    ) == (120, "big insert")
+    # the staged chunks are dropped once they've been applied
+    assert _fetch_one(upload_tables, "SELECT count(*) FROM gumbo_upload_chunk") == (0,)
+
+    client.update_only("sample", df.assign(intcol=df["intcol"] * 10))
+    assert list(client.get("sample")["intcol"][1:]) == [i * 10 for i in range(120)]
+
+
+def test_chunked_insert_is_atomic(gumbo_client, upload_tables):
+    gumbo_client.upload_chunk_rows = 2
+    # the last chunk holds a key which already exists
+    df = pd.DataFrame({"id": ["a", "b", "c", "d", "id"], "intcol": range(5)})
+    with pytest.raises(UploadFailed):
+        gumbo_client.insert_only("sample", df)
+    assert list(gumbo_client.get("sample")["id"]) == ["id"]
+
+
+def test_chunked_insert_retries_and_resumes(http_client, upload_tables):
+    failures = {"chunk/1": 1, "chunk/2": 100}
+
+    class FlakySession:
+        def request(self, method, url, **kwargs):
+            for suffix, count in failures.items():
+                if url.endswith(suffix) and count > 0:
+                    failures[suffix] -= 1
+                    raise requests.ConnectionError("connection reset")
+            return http_client.request(method, url, **kwargs)
+
+    client = Client(
+        username="testuser", authed_session=FlakySession(), upload_chunk_rows=2
+    )
+    df = pd.DataFrame({"id": ["a", "b", "c", "d", "e"], "intcol": range(5)})
+    with pytest.raises(UploadFailed) as exc_info:
+        client.insert_only("sample", df)
+    # chunk 1 went through on its second attempt, but chunk 2 never did so nothing was written
+    assert list(client.get("sample")["id"]) == ["id"]
+
+    sent = []
+
+    class RecordingSession:
+        def request(self, method, url, **kwargs):
+            sent.append(url)
+            return http_client.request(method, url, **kwargs)
+
+    client.authed_session = RecordingSession()
+    client.resume_upload(exc_info.value.upload_id, df)
+    chunk_urls = [url for url in sent if "/chunk/" in url]
+    assert len(chunk_urls) == 1
+    assert chunk_urls[0].endswith(f"/upload/{exc_info.value.upload_id}/chunk/2")
+    assert list(client.get("sample")["id"]) == ["a", "b", "c", "d", "e", "id"]
+
+    # resuming a committed upload does nothing
+    client.resume_upload(exc_info.value.upload_id, df)
+    assert len(client.get("sample")) == 6
+
+
+def test_large_write_without_upload_tables(http_client, sample_tables):
+    connection = psycopg2.connect(os.environ["POSTGRES_TEST_DB"])
+    connection.autocommit = True
+    cursor = connection.cursor()
+    cursor.execute("DROP TABLE IF EXISTS gumbo_upload_chunk")
+    cursor.execute("DROP TABLE IF EXISTS gumbo_upload")
+    cursor.close()
+    connection.close()
+
+    requests_sent = []
+
+    class RecordingSession:
+        def request(self, method, url, **kwargs):
+            requests_sent.append(method)
+            return http_client.request(method, url, **kwargs)
+
+    client = Client(
+        username="testuser", authed_session=RecordingSession(), upload_chunk_rows=2
+    )
+    df = pd.DataFrame({"id": ["a", "b", "c"], "intcol": range(3)})
+    client.insert_only("sample", df)
+    # the upload can't be started (and isn't retried), so the rows are sent in one request
+    assert requests_sent == ["POST", "PATCH"]
+    assert list(client.get("sample")["id"]) == ["a", "b", "c", "id"]
+
+
 # def test_against_local_postgres(tmpdir):
 #     config_path = tmpdir.join("config.json")
 #     config_path.write(
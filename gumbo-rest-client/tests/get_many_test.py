@@ -0,0 +1,44 @@
+import threading
+
+import httpx
+import pandas as pd
+import pytest
+
+from dataframe_json_packing import pack
+from gumbo_rest_client import Client
+from gumbo_rest_client.exceptions import GetManyFailed, UnknownTable
+
+
+class FakeSession:
+    "serves a one row table for any name except 'missing', once `concurrency` requests are in flight at once"
+
+    def __init__(self, concurrency):
+        self.barrier = threading.Barrier(concurrency, timeout=5)
+
+    def request(self, method, url, **kwargs):
+        self.barrier.wait()
+        table_name = url.rsplit("/", 1)[-1]
+        if table_name == "missing":
+            return httpx.Response(404)
+        return httpx.Response(200, json=pack(pd.DataFrame({"name": [table_name]})))
+
+
+def test_get_many_fetches_concurrently():
+    client = Client(
+        username="test", authed_session=FakeSession(concurrency=3), use_arrow=False
+    )
+    # with fewer workers than tables the barrier would time out
+    tables = client.get_many(["a", "b", "c"], max_workers=3)
+    assert list(tables) == ["a", "b", "c"]
+    assert [list(df["name"]) for df in tables.values()] == [["a"], ["b"], ["c"]]
+
+
+def test_get_many_reports_each_failure():
+    client = Client(
+        username="test", authed_session=FakeSession(concurrency=1), use_arrow=False
+    )
+    with pytest.raises(GetManyFailed) as exc_info:
+        client.get_many(["a", "missing", "b"])
+    assert list(exc_info.value.errors) == ["missing"]
+    assert isinstance(exc_info.value.errors["missing"], UnknownTable)
+    assert list(exc_info.value.tables) == ["a", "b"]
@@ -0,0 +1,24 @@
+import pandas as pd
+
+from gumbo_rest_client.mirror import _apply_changes
+
+
+def test_apply_changes_does_not_truncate_values():
+    # a float column whose values were all whole numbers when it was fetched is Int64
+    df = pd.DataFrame(
+        {"id": ["a", "b"], "x": pd.array([1, 2], dtype="Int64"), "s": ["p", "q"]}
+    )
+    upserted = pd.DataFrame(
+        {
+            "id": ["b"],
+            "x": pd.array([2.5], dtype="Float64"),
+            "s": pd.Series([None], dtype="object"),
+        }
+    )
+    deleted = pd.DataFrame({"id": pd.Series([], dtype="object")})
+
+    result = _apply_changes(df, "id", upserted, deleted)
+    assert list(result["x"]) == [1.0, 2.5]
+    # a column with no values in the changed rows takes the existing column's type
+    assert result["s"].dtype == "object"
+    assert pd.isna(result["s"][1])
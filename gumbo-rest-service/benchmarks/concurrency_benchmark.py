@@ -0,0 +1,148 @@
+"""
+Measure throughput and latency of the service under a mix of concurrent requests: clients downloading a large
+table, clients reading a small table and clients writing to the small table, all against one worker (as each
+gunicorn worker runs). Slow requests blocking the event loop shows up as high latency for the small reads.
+
+Needs a postgres database to create the benchmark tables in. Run with:
+
+    GUMBO_CONNECTION_STRING=postgresql://... python benchmarks/concurrency_benchmark.py [seconds] [big table rows]
+"""
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import psycopg2
+import requests
+
+# (name, number of clients) for each kind of request
+CLIENTS = [("big read", 2), ("small read", 4), ("write", 2)]
+
+
+def create_tables(dsn, big_rows):
+    connection = psycopg2.connect(dsn)
+    connection.autocommit = True
+    cursor = connection.cursor()
+    for table_name in ["bench_big", "bench_small"]:
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+        cursor.execute(
+            f"CREATE TABLE {table_name} (id varchar(20) PRIMARY KEY, intcol integer, floatcol float, strcol text, datecol date)"
+        )
+    for table_name, rows in [("bench_big", big_rows), ("bench_small", 100)]:
+        cursor.execute(
+            f"""INSERT INTO {table_name}
+            SELECT 'id' || lpad(i::text, 9, '0'), i, i / 7.0, md5(i::text), DATE '2000-01-01' + (i %% 5000)
+            FROM generate_series(1, %s) AS i""",
+            [rows],
+        )
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS bulk_update_log (username varchar(100), "timestamp" TIMESTAMP, tablename varchar(100), rows_updated integer, rows_deleted integer, rows_inserted integer, reason varchar(1000))'
+    )
+    cursor.close()
+    connection.close()
+
+
+def start_server():
+    "run the service in its own process, so it doesn't compete with the clients for the GIL"
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    # every read should go to the database, so don't cache responses
+    env = dict(os.environ, GUMBO_RESPONSE_CACHE_MAX_BYTES="0", PYTHONWARNINGS="ignore")
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "gumbo_rest_service.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    while True:
+        try:
+            requests.get(f"{base_url}/pool-stats")
+            return server, base_url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+
+
+def make_request(session, base_url, kind):
+    if kind == "big read":
+        response = session.get(f"{base_url}/table/bench_big")
+    elif kind == "small read":
+        response = session.get(f"{base_url}/table/bench_small")
+    else:
+        i = random.randint(1, 100)
+        data = {
+            "columns": [
+                {"name": "id", "type": "string", "values": [f"id{i:09}"]},
+                {"name": "intcol", "type": "int", "values": [random.randint(0, 1000)]},
+            ]
+        }
+        response = session.patch(
+            f"{base_url}/table/bench_small",
+            json={"mode": "update_only", "username": "benchmark", "data": data},
+        )
+    response.raise_for_status()
+
+
+def run_client(base_url, kind, deadline, latencies):
+    session = requests.Session()
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        make_request(session, base_url, kind)
+        latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    big_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+
+    create_tables(os.environ["GUMBO_CONNECTION_STRING"], big_rows)
+    server, base_url = start_server()
+
+    latencies = {kind: [] for kind, _ in CLIENTS}
+    deadline = time.perf_counter() + seconds
+    threads = [
+        threading.Thread(
+            target=run_client, args=(base_url, kind, deadline, latencies[kind])
+        )
+        for kind, count in CLIENTS
+        for _ in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    server.terminate()
+    server.wait()
+
+    print(f"{seconds:.0f}s, big table of {big_rows} rows")
+    print(
+        f"{'request':<12} {'clients':>7} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}"
+    )
+    for kind, count in CLIENTS:
+        values = latencies[kind]
+        print(
+            f"{kind:<12} {count:>7} {len(values):>8} {len(values) / seconds:>8.1f} "
+            f"{percentile(values, 0.5) * 1000:>8.1f} {percentile(values, 0.95) * 1000:>8.1f} {max(values) * 1000:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
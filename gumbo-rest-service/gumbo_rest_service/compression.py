@@ -0,0 +1,189 @@
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import PlainTextResponse
+
+from dataframe_json_packing import compression
+
+# bodies at least this big are (de)compressed in a worker thread rather than on the event loop
+THREADPOOL_MIN_SIZE = 64 * 1024
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with gzip or zstd (whichever the client prefers out of those it lists in Accept-Encoding)
+    and decompresses request bodies sent with a Content-Encoding of either.
+
+    Responses smaller than `minimum_size` bytes are sent as is, since compressing them saves next to nothing.
+    `levels` maps each encoding to the compression level to use. Every response lists the encodings a request
+    body may use in its Accept-Encoding header, and a body in any other encoding is rejected with a 415. A body which
+    decompresses to more than `max_request_size` bytes is rejected with a 413.
+    """
+
+    def __init__(
+        self, app, *, minimum_size=1024, levels=None, max_request_size=1024**3
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.max_request_size = max_request_size
+        self.levels = dict(compression.DEFAULT_LEVELS)
+        if levels is not None:
+            self.levels.update(levels)
+        self.supported_encodings = compression.supported_encodings()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        content_encoding = headers.get("content-encoding", "identity").strip().lower()
+        if content_encoding != "identity":
+            if content_encoding not in self.supported_encodings:
+                response = PlainTextResponse(
+                    f"Unsupported Content-Encoding: {content_encoding}",
+                    status_code=415,
+                    headers={"Accept-Encoding": ", ".join(self.supported_encodings)},
+                )
+                await response(scope, receive, send)
+                return
+            try:
+                scope, receive = await _decompress_request(
+                    scope, receive, content_encoding, self.max_request_size
+                )
+            except compression.DecompressedSizeExceeded:
+                response = PlainTextResponse(
+                    f"Request body decompresses to more than {self.max_request_size} bytes",
+                    status_code=413,
+                )
+                await response(scope, receive, send)
+                return
+            except Exception:
+                response = PlainTextResponse(
+                    f"Request body could not be decompressed as {content_encoding}",
+                    status_code=400,
+                )
+                await response(scope, receive, send)
+                return
+
+        responder = _CompressingResponder(
+            self, compression.choose_encoding(headers.get("accept-encoding")), send
+        )
+        await self.app(scope, receive, responder.send)
+
+
+async def _decompress_request(scope, receive, encoding, max_size):
+    """
+    read the whole request body, decompressing each part as it arrives, and return a scope and receive which present
+    the decompressed body. Raises DecompressedSizeExceeded as soon as it grows past max_size bytes.
+    """
+    decompressor = compression.decompressobj(encoding, max_size)
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            # the client went away
+            return scope, _replay([message], receive)
+        data = message.get("body", b"")
+        if len(data) >= THREADPOOL_MIN_SIZE:
+            chunks.append(await run_in_threadpool(decompressor.decompress, data))
+        else:
+            chunks.append(decompressor.decompress(data))
+        if not message.get("more_body", False):
+            break
+    chunks.append(decompressor.flush())
+
+    body = b"".join(chunks)
+
+    scope = dict(scope)
+    scope["headers"] = [
+        (name, value)
+        for name, value in scope["headers"]
+        if name not in (b"content-encoding", b"content-length")
+    ] + [(b"content-length", str(len(body)).encode("latin-1"))]
+    return scope, _replay(
+        [{"type": "http.request", "body": body, "more_body": False}], receive
+    )
+
+
+def _replay(messages, receive):
+    messages = list(messages)
+
+    async def replaying_receive():
+        if messages:
+            return messages.pop(0)
+        return await receive()
+
+    return replaying_receive
+
+
+class _CompressingResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self.start_message = None
+        self.compressor = None
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(raw=message["headers"])
+            headers["Accept-Encoding"] = ", ".join(self.middleware.supported_encodings)
+            # hold the start of the response until the first part of the body shows whether it's worth compressing
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is not None:
+            start_message = self.start_message
+            self.start_message = None
+            headers = MutableHeaders(raw=start_message["headers"])
+            if (
+                self.encoding is None
+                or "content-encoding" in headers
+                or (not more_body and len(body) < self.middleware.minimum_size)
+            ):
+                await self._send(start_message)
+                await self._send(message)
+                return
+
+            self.compressor = compression.compressobj(
+                self.encoding, self.middleware.levels[self.encoding]
+            )
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            body = await self._compress(body, more_body)
+            if more_body:
+                # the length isn't known until the whole stream has been compressed
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(body))
+            await self._send(start_message)
+            await self._send(
+                {"type": "http.response.body", "body": body, "more_body": more_body}
+            )
+            return
+
+        if self.compressor is None:
+            await self._send(message)
+            return
+
+        body = await self._compress(body, more_body)
+        await self._send(
+            {"type": "http.response.body", "body": body, "more_body": more_body}
+        )
+
+    async def _compress(self, body, more_body):
+        if len(body) >= THREADPOOL_MIN_SIZE:
+            return await run_in_threadpool(self._compress_sync, body, more_body)
+        return self._compress_sync(body, more_body)
+
+    def _compress_sync(self, body, more_body):
+        body = self.compressor.compress(body)
+        if not more_body:
+            body += self.compressor.flush()
+        return body
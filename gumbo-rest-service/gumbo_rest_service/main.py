@@ -1,35 +1,183 @@
 import os
 from typing import Annotated
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Path, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv, find_dotenv
-import psycopg2
-from gumbo_dao import GumboDAO
-from dataframe_json_packing import pack, unpack
+import psycopg2.errors
+from psycopg2.pool import PoolError
+from gumbo_dao import ConnectionPool, GumboDAO, TableMetadata, TableMetadataCache
+from dataframe_json_packing import (
+    pack,
+    unpack,
+    pack_arrow,
+    arrow_is_available,
+    ARROW_MEDIA_TYPE,
+    iter_pack_json,
+    iter_pack_chunks,
+    PACKED_CHUNKS_MEDIA_TYPE,
+)
+from dataframe_json_packing.streaming import dumps
+from .response_cache import ResponseCache, InvalidationListener
+from .compression import CompressionMiddleware
 from pydantic import BaseModel
 from enum import Enum
-from typing import Optional, Any
+from typing import Optional, Any, List
 import traceback
+import hashlib
+import json
+import itertools
+import threading
+import anyio
 
 import re
+from urllib.parse import quote
+from contextlib import asynccontextmanager
+
+
+_connection_pool: Optional[ConnectionPool] = None
+_connection_pool_lock = threading.Lock()
+
+
+def _get_connection_pool():
+    # create the pool on first use, so that importing this module doesn't require a database
+    global _connection_pool
+    with _connection_pool_lock:
+        if _connection_pool is None:
+            load_dotenv(find_dotenv())
+            _connection_pool = ConnectionPool(
+                os.environ["GUMBO_CONNECTION_STRING"],
+                minconn=int(os.environ.get("GUMBO_POOL_MIN_SIZE", "1")),
+                maxconn=int(os.environ.get("GUMBO_POOL_MAX_SIZE", "10")),
+                checkout_timeout=float(
+                    os.environ.get("GUMBO_POOL_CHECKOUT_TIMEOUT", "30")
+                ),
+                health_check_interval=float(
+                    os.environ.get("GUMBO_POOL_HEALTH_CHECK_INTERVAL", "60")
+                ),
+            )
+        return _connection_pool
 
 
 def _get_db_connection():
-    load_dotenv(find_dotenv())
-    connection_string = os.environ["GUMBO_CONNECTION_STRING"]
-    connection = psycopg2.connect(connection_string)
-    connection.autocommit = True
-    return connection
+    try:
+        return _get_connection_pool().getconn()
+    except PoolError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+def _release_db_connection(connection):
+    # connections which didn't come from the pool (ie: mocks in tests) have nowhere to go back to
+    if _connection_pool is not None:
+        _connection_pool.putconn(connection)
 
 
-def get_db_connection():
+def get_db_connection(request: Request):
     # in tests _get_db_connection will be mocked, so delegate to that
-    return _get_db_connection()
+    connection = _get_db_connection()
+    try:
+        yield connection
+    finally:
+        # a response streamed from the database releases the connection itself once it has been sent
+        if not getattr(request.state, "connection_handed_off", False):
+            _release_db_connection(connection)
+
+
+class _ConnectionStream:
+    """
+    The body of a response streamed from a query on the request's connection. `close` finishes the query and
+    releases the connection (once). It's run when the body runs out or fails, and as the response's background
+    task, which also runs if the client goes away before the body is sent.
+    """
+
+    def __init__(self, connection, chunks, generators):
+        self.connection = connection
+        self.chunks = chunks
+        # closed to abandon the query if the body isn't read to the end
+        self.generators = generators
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        try:
+            for generator in self.generators:
+                generator.close()
+        finally:
+            _release_db_connection(self.connection)
+
+
+def _stream_with_connection(
+    request: Request, connection, body, source, **response_args
+):
+    """
+    Respond with `body`, which is produced from `source`, a query run on the request's connection. The first
+    chunk is produced before responding, so a query which fails raises here (for the handler to turn into an
+    error status) instead of truncating the response. The connection is then taken over by the response, since
+    it's normally released as soon as the handler returns, which is before a streamed body is produced.
+    """
+    first_chunk = next(body, b"")
+    stream = _ConnectionStream(
+        connection, itertools.chain([first_chunk], body), [body, source]
+    )
+    request.state.connection_handed_off = True
+    return StreamingResponse(
+        stream, background=BackgroundTask(stream.close), **response_args
+    )
+
+
+def _cache_when_complete(
+    chunks, table_name, cache_key, version, media_type, generation
+):
+    "pass the chunks of a response through, and cache the whole response once they've all been sent"
+    body = [] if response_cache.can_cache(table_name, 0, generation) else None
+    size = 0
+    for chunk in chunks:
+        yield chunk
+        if body is not None:
+            size += len(chunk)
+            if response_cache.can_cache(table_name, size, generation):
+                body.append(chunk)
+            else:
+                # too big to cache, or the table was written to meanwhile, so don't hold on to it
+                body = None
+    if body is not None:
+        response_cache.put(
+            table_name, cache_key, version, b"".join(body), media_type, generation
+        )
+
+
+# table schemas rarely change, so share their metadata across connections instead of querying the catalog on
+# every request
+metadata_cache = TableMetadataCache(
+    ttl=float(os.environ.get("GUMBO_METADATA_CACHE_TTL", "300"))
+)
 
 
 def _get_gumbo_dao(connection):
     # in tests _get_gumbo_dao will be mocked, so delegate to that
-    dao = GumboDAO(sanity_check=True, connection=connection)
+    dao = GumboDAO(
+        sanity_check=True,
+        connection=connection,
+        metadata_cache=metadata_cache,
+        audit_table=os.environ.get("GUMBO_AUDIT_TABLE", "audit.logged_actions"),
+        verification=os.environ.get("GUMBO_VERIFICATION", "touched"),
+    )
     return dao
 
 
@@ -37,7 +185,53 @@ async def get_gumbo_dao(connection: Annotated[object, Depends(get_db_connection)
     return _get_gumbo_dao(connection)
 
 
-app = FastAPI()
+# serialized responses to GET /table, for tables which are read far more often than they're written
+response_cache = ResponseCache(
+    max_bytes=int(
+        os.environ.get("GUMBO_RESPONSE_CACHE_MAX_BYTES", str(256 * 1024**2))
+    ),
+    max_entry_bytes=int(
+        os.environ.get("GUMBO_RESPONSE_CACHE_MAX_ENTRY_BYTES", str(32 * 1024**2))
+    ),
+    ttl=float(os.environ.get("GUMBO_RESPONSE_CACHE_TTL", "60")),
+)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    load_dotenv(find_dotenv())
+    # the handlers run in this pool of threads, since the database access and (de)serialization they do would block
+    # the event loop. Beyond the size of the connection pool, extra threads only wait for a connection
+    anyio.to_thread.current_default_thread_limiter().total_tokens = int(
+        os.environ.get("GUMBO_THREADPOOL_SIZE", "40")
+    )
+
+    # optionally listen for notifications from triggers on the tables, so that writes made by anything other than
+    # this process are also reflected in the response cache straight away
+    listener = None
+    channel = os.environ.get("GUMBO_CACHE_NOTIFY_CHANNEL")
+    if channel:
+        listener = InvalidationListener(
+            os.environ["GUMBO_CONNECTION_STRING"], channel, response_cache
+        )
+        listener.start()
+    yield
+    if listener is not None:
+        listener.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get("GUMBO_COMPRESSION_MIN_SIZE", "1024")),
+    levels={
+        "gzip": int(os.environ.get("GUMBO_GZIP_LEVEL", "1")),
+        "zstd": int(os.environ.get("GUMBO_ZSTD_LEVEL", "1")),
+    },
+    max_request_size=int(
+        os.environ.get("GUMBO_MAX_DECOMPRESSED_REQUEST_SIZE", str(1024**3))
+    ),
+)
 
 
 def _validate_name(name):
@@ -45,16 +239,310 @@ def _validate_name(name):
         raise HTTPException(status_code=400)
 
 
+def _wants_arrow(request: Request):
+    # clients which can read Arrow list it in their Accept header. Everyone else gets the packed JSON format
+    return (
+        ARROW_MEDIA_TYPE in request.headers.get("accept", "") and arrow_is_available()
+    )
+
+
+def _wants_chunks(request: Request):
+    # clients which list the chunked format get the table streamed straight from the database
+    return PACKED_CHUNKS_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def _packed_json_response(content, headers=None):
+    # encode with the fast encoder instead of JSONResponse's json.dumps (or FastAPI's jsonable_encoder)
+    return Response(
+        content=dumps(content), media_type="application/json", headers=headers
+    )
+
+
+def _parse_filters(filters: Optional[str]):
+    # filters are passed as a json list of [column, operator, value] triples, ie: [["intcol", ">=", 5]]
+    if filters is None:
+        return None
+    try:
+        parsed = json.loads(filters)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="filters must be valid JSON")
+    if not isinstance(parsed, list) or not all(
+        isinstance(f, list) and len(f) == 3 for f in parsed
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail="filters must be a list of [column, operator, value] triples",
+        )
+    return parsed
+
+
+def _table_etag(version, *parts):
+    # the same version of the table produces a different body for each projection, filter and format
+    key = json.dumps([version, *parts])
+    return '"' + hashlib.sha1(key.encode("utf8")).hexdigest() + '"'
+
+
+def _etag_matches(request: Request, etag):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    return if_none_match.strip() == "*" or etag in [
+        tag.strip() for tag in if_none_match.split(",")
+    ]
+
+
 @app.get("/table/{table_name}")
-async def get_table(
-    table_name: str, gumbo_dao: Annotated[GumboDAO, Depends(get_gumbo_dao)]
+def get_table(
+    table_name: str,
+    request: Request,
+    connection: Annotated[object, Depends(get_db_connection)],
+    gumbo_dao: Annotated[GumboDAO, Depends(get_gumbo_dao)],
+    columns: Annotated[Optional[List[str]], Query()] = None,
+    filters: Optional[str] = None,
 ):
+    """
+    Returns the table in one of three formats, depending on the Accept header: an Arrow IPC stream, a stream of
+    packed chunks of rows (read from the database as they're sent) or, by default, a single packed dataframe.
+
+    Only the chunked format is streamed from the database. The Arrow and default formats read the whole table
+    into memory first: a packed dataframe is laid out a column at a time, with each column's type inferred from
+    all of its values, so it can't be written until every row has been read.
+    """
     _validate_name(table_name)
-    df = gumbo_dao.get(table_name)
+    parsed_filters = _parse_filters(filters)
+    if _wants_arrow(request):
+        response_format = "arrow"
+    elif _wants_chunks(request):
+        response_format = "chunks"
+    else:
+        response_format = "json"
+
+    # look up the version before reading the table, so a change made while reading gets a new etag
+    headers = {}
+    version = gumbo_dao.get_table_version(table_name)
+    if version is not None:
+        etag = _table_etag(version, columns, parsed_filters, response_format)
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        headers["ETag"] = etag
+
+    cache_key = json.dumps([columns, parsed_filters, response_format])
+    cached = response_cache.get(table_name, cache_key, version)
+    if cached is not None:
+        return Response(
+            content=cached.content, media_type=cached.media_type, headers=headers
+        )
+    generation = response_cache.generation(table_name)
+
+    if response_format == "chunks":
+        # streamed straight from a cursor, so never held in memory in full
+        try:
+            chunks = gumbo_dao.iter_chunks(
+                table_name, columns=columns, filters=parsed_filters
+            )
+            if chunks is None:
+                raise HTTPException(status_code=404)
+            body = _cache_when_complete(
+                iter_pack_chunks(chunks),
+                table_name,
+                cache_key,
+                version,
+                PACKED_CHUNKS_MEDIA_TYPE,
+                generation,
+            )
+            return _stream_with_connection(
+                request,
+                connection,
+                body,
+                chunks,
+                media_type=PACKED_CHUNKS_MEDIA_TYPE,
+                headers=headers,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        df = gumbo_dao.get(table_name, columns=columns, filters=parsed_filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if df is None:
         raise HTTPException(status_code=404)
-    result = pack(df)
-    return result
+
+    if response_format == "arrow":
+        response = Response(
+            content=pack_arrow(df), media_type=ARROW_MEDIA_TYPE, headers=headers
+        )
+        response_cache.put(
+            table_name,
+            cache_key,
+            version,
+            response.body,
+            response.media_type,
+            generation,
+        )
+        return response
+
+    # encoded a column at a time, rather than building the whole packed dict and then the whole JSON string
+    return StreamingResponse(
+        _cache_when_complete(
+            iter_pack_json(df),
+            table_name,
+            cache_key,
+            version,
+            "application/json",
+            generation,
+        ),
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+# the (url quoted) primary key to pass as `after` to fetch the next page. Absent on the last page
+NEXT_AFTER_HEADER = "X-Gumbo-Next-After"
+
+MAX_PAGE_ROWS = 100000
+
+# the packed type (as a JSON object keyed by column name) each column of a page has, whatever values it holds, so
+# the client can give every page the same dtypes. Columns of types which aren't listed here, and arrays (which are
+# packed as json), are left out
+COLUMN_TYPES_HEADER = "X-Gumbo-Column-Types"
+
+# the packed type for each column type, matched against the start of the type reported by the catalog
+PACKED_TYPE_PREFIXES = (
+    ("smallint", "int"),
+    ("integer", "int"),
+    ("bigint", "int"),
+    ("real", "float"),
+    ("double precision", "float"),
+    ("numeric", "float"),
+    ("boolean", "boolean"),
+    ("text", "string"),
+    ("character", "string"),
+    ("uuid", "string"),
+    ("date", "date"),
+    ("timestamp", "datetime64"),
+    ("json", "json"),
+)
+
+
+def _packed_column_types(metadata: TableMetadata):
+    packed_types = {}
+    for column_name, column_type in metadata.column_types.items():
+        if column_type.endswith("[]"):
+            # ie: "text[]", which would otherwise match the prefix of its element type
+            continue
+        for prefix, packed_type in PACKED_TYPE_PREFIXES:
+            if column_type.lower().startswith(prefix):
+                packed_types[column_name] = packed_type
+                break
+    return packed_types
+
+
+@app.get("/table/{table_name}/page")
+def get_table_page(
+    table_name: str,
+    request: Request,
+    gumbo_dao: Annotated[GumboDAO, Depends(get_gumbo_dao)],
+    after: Optional[str] = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_ROWS)] = 10000,
+):
+    _validate_name(table_name)
+    metadata = gumbo_dao.get_table_metadata(table_name)
+    if metadata is None:
+        raise HTTPException(status_code=404)
+    if len(metadata.pk_columns) != 1:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{table_name} can't be paged because it does not have a single primary key column",
+        )
+
+    df = gumbo_dao.get_page(table_name, after=after, limit=limit)
+    headers = {COLUMN_TYPES_HEADER: json.dumps(_packed_column_types(metadata))}
+    if len(df) == limit:
+        headers[NEXT_AFTER_HEADER] = quote(
+            str(df[metadata.pk_column].iloc[-1]), safe=""
+        )
+
+    if _wants_arrow(request):
+        return Response(
+            content=pack_arrow(df), media_type=ARROW_MEDIA_TYPE, headers=headers
+        )
+    return _packed_json_response(pack(df), headers=headers)
+
+
+@app.get("/table/{table_name}/changes")
+def get_table_changes(
+    table_name: str,
+    gumbo_dao: Annotated[GumboDAO, Depends(get_gumbo_dao)],
+    since: Optional[int] = None,
+):
+    """
+    Returns the rows inserted or updated and the keys of the rows deleted since the watermark `since`, along with
+    the watermark to pass next time. Without `since` (or if the table was truncated) the whole table is returned
+    with `full_refresh` set.
+    """
+    _validate_name(table_name)
+    metadata = gumbo_dao.get_table_metadata(table_name)
+    if metadata is None:
+        raise HTTPException(status_code=404)
+    if len(metadata.pk_columns) != 1:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Changes to {table_name} can't be tracked because it does not have a single primary key column",
+        )
+
+    changes = gumbo_dao.get_changes(table_name, since=since)
+    return _packed_json_response(
+        {
+            "watermark": changes.watermark,
+            "primary_key": metadata.pk_column,
+            "full_refresh": changes.full_refresh,
+            "upserted": pack(changes.upserted),
+            "deleted": pack(changes.deleted),
+            # the types of the columns, which the packed rows may not show (ie: if a column's values are all null)
+            "column_types": _packed_column_types(metadata),
+        }
+    )
+
+
+@app.get("/table/{table_name}/fingerprint")
+def get_table_fingerprint(
+    table_name: str,
+    gumbo_dao: Annotated[GumboDAO, Depends(get_gumbo_dao)],
+    columns: Annotated[Optional[List[str]], Query()] = None,
+    row_hashes: bool = False,
+):
+    """
+    Returns a digest of the table's contents and its row count, computed in the database. With `row_hashes` the
+    hash of every row is included too, keyed by primary key, so a client holding an earlier fingerprint can work
+    out which rows changed without downloading the table.
+    """
+    _validate_name(table_name)
+    metadata = gumbo_dao.get_table_metadata(table_name)
+    if metadata is None:
+        raise HTTPException(status_code=404)
+    if len(metadata.pk_columns) != 1:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{table_name} can't be fingerprinted because it does not have a single primary key column",
+        )
+
+    try:
+        fingerprint = gumbo_dao.get_fingerprint(
+            table_name, columns=columns, row_hashes=row_hashes
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _packed_json_response(
+        {
+            "primary_key": metadata.pk_column,
+            "digest": fingerprint.digest,
+            "row_count": fingerprint.row_count,
+            "row_hashes": None
+            if fingerprint.row_hashes is None
+            else pack(fingerprint.row_hashes),
+        }
+    )
 
 
 @app.get("/debug-info")
@@ -66,9 +554,23 @@ def get_debug_info():
     return files
 
 
+@app.get("/pool-stats")
+def get_pool_stats():
+    if _connection_pool is None:
+        return {"pool": None}
+    return {"pool": _connection_pool.stats()}
+
+
+@app.get("/response-cache-stats")
+def get_response_cache_stats():
+    return {"response_cache": response_cache.stats()}
+
+
 class UpdateMode(str, Enum):
     insert_only = "insert_only"
     update_only = "update_only"
+    # insert new rows, update changed rows and (with delete_missing_rows) delete the rows which weren't sent
+    sync = "sync"
 
 
 class Update(BaseModel):
@@ -76,10 +578,12 @@ class Update(BaseModel):
     username: str
     data: Any
     reason: Optional[str] = None
+    # only used by the sync mode
+    delete_missing_rows: bool = False
 
 
 @app.patch("/table/{table_name}")
-async def update_table(
+def update_table(
     table_name: str,
     update: Update,
     gumbo_dao: Annotated[GumboDAO, Depends(get_gumbo_dao)],
@@ -94,7 +598,162 @@ async def update_table(
             gumbo_dao.update_only(
                 update.username, table_name, updated_rows_df, reason=update.reason
             )
+        elif update.mode == UpdateMode.sync:
+            # diffed and applied by postgres in one transaction, so the table isn't read into memory
+            gumbo_dao.update(
+                update.username,
+                table_name,
+                updated_rows_df,
+                delete_missing_rows=update.delete_missing_rows,
+                reason=update.reason,
+                server_side=True,
+            )
         else:
             raise Exception(f"Invalid mode {update.mode}")
     except Exception as e:
         raise HTTPException(status_code=400, detail=traceback.format_exc())
+    finally:
+        # even a failed update may have written some rows
+        response_cache.invalidate(table_name)
+
+
+class UploadStart(BaseModel):
+    mode: UpdateMode
+    username: str
+    reason: Optional[str] = None
+
+
+class UploadCommit(BaseModel):
+    chunk_count: int
+
+
+def _upload_response(upload):
+    return {
+        "upload_id": upload.upload_id,
+        "table_name": upload.table_name,
+        "mode": upload.mode,
+        "status": upload.status,
+        "chunk_ids": upload.chunk_ids,
+        "rows_inserted": upload.rows_inserted,
+        "rows_updated": upload.rows_updated,
+    }
+
+
+def _decode_chunk(data):
+    return unpack(json.loads(data))
+
+
+@app.post("/table/{table_name}/upload")
+def start_upload(
+    table_name: str,
+    upload: UploadStart,
+    gumbo_dao: Annotated[GumboDAO, Depends(get_gumbo_dao)],
+):
+    """
+    Start a write which is too large to send in one request. Send the rows in chunks with
+    PUT /upload/{upload_id}/chunk/{chunk_id} and then apply them all in one transaction with
+    POST /upload/{upload_id}/commit.
+    """
+    _validate_name(table_name)
+    if gumbo_dao.get_table_metadata(table_name) is None:
+        raise HTTPException(status_code=404)
+    try:
+        upload_id = gumbo_dao.create_upload(
+            upload.username, table_name, upload.mode.value, reason=upload.reason
+        )
+    except ValueError as e:
+        # sync needs all of the rows at once, so can't be applied a chunk at a time
+        raise HTTPException(status_code=400, detail=str(e))
+    except psycopg2.errors.UndefinedTable:
+        # clients send the write in a single request instead
+        raise HTTPException(
+            status_code=501,
+            detail="Uploads aren't set up in this database (see gumbo_dao.UPLOAD_TABLES_SCHEMA)",
+        )
+    return {"upload_id": upload_id}
+
+
+@app.get("/upload/{upload_id}")
+def get_upload(
+    upload_id: str,
+    gumbo_dao: Annotated[GumboDAO, Depends(get_gumbo_dao)],
+):
+    "Returns the status of the upload, including which chunks have been received (to resume an upload)"
+    upload = gumbo_dao.get_upload(upload_id)
+    if upload is None:
+        raise HTTPException(status_code=404)
+    return _upload_response(upload)
+
+
+@app.put("/upload/{upload_id}/chunk/{chunk_id}")
+async def put_upload_chunk(
+    upload_id: str,
+    chunk_id: Annotated[int, Path(ge=0)],
+    request: Request,
+    gumbo_dao: Annotated[GumboDAO, Depends(get_gumbo_dao)],
+):
+    "The body is the rows of the chunk in the packed JSON format. Sending a chunk again replaces it"
+    # reading the body has to be done on the event loop, so hand the rest over to a worker thread
+    data = (await request.body()).decode("utf8")
+    await run_in_threadpool(_put_upload_chunk, gumbo_dao, upload_id, chunk_id, data)
+    return {"upload_id": upload_id, "chunk_id": chunk_id}
+
+
+def _put_upload_chunk(gumbo_dao: GumboDAO, upload_id, chunk_id, data):
+    try:
+        if not isinstance(json.loads(data), dict):
+            raise ValueError()
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="The chunk must be a packed dataframe"
+        )
+
+    try:
+        gumbo_dao.put_upload_chunk(upload_id, chunk_id, data)
+    except ValueError as e:
+        if gumbo_dao.get_upload(upload_id) is None:
+            raise HTTPException(status_code=404)
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/upload/{upload_id}/commit")
+def commit_upload(
+    upload_id: str,
+    commit: UploadCommit,
+    gumbo_dao: Annotated[GumboDAO, Depends(get_gumbo_dao)],
+):
+    """
+    Apply chunks 0 to chunk_count - 1 to the table in one transaction. Responds with a 409 listing the missing
+    chunk ids if any haven't been received. Committing again after a commit succeeded does nothing.
+    """
+    upload = gumbo_dao.get_upload(upload_id)
+    if upload is None:
+        raise HTTPException(status_code=404)
+    if upload.status == "open":
+        missing_chunk_ids = sorted(
+            set(range(commit.chunk_count)).difference(upload.chunk_ids)
+        )
+        if missing_chunk_ids:
+            raise HTTPException(
+                status_code=409, detail={"missing_chunk_ids": missing_chunk_ids}
+            )
+
+    try:
+        upload = gumbo_dao.commit_upload(upload_id, commit.chunk_count, _decode_chunk)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=traceback.format_exc())
+    finally:
+        response_cache.invalidate(upload.table_name)
+    return _upload_response(upload)
+
+
+@app.delete("/upload/{upload_id}")
+def abort_upload(
+    upload_id: str,
+    gumbo_dao: Annotated[GumboDAO, Depends(get_gumbo_dao)],
+):
+    if not gumbo_dao.abort_upload(upload_id):
+        raise HTTPException(status_code=404)
+    return {"upload_id": upload_id}
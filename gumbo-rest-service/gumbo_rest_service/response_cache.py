@@ -0,0 +1,205 @@
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import psycopg2
+from psycopg2 import sql
+
+
+class CachedResponse(NamedTuple):
+    content: bytes
+    media_type: str
+    # the version of the table (see GumboDAO.get_table_version) the response was made from, if known
+    version: Optional[str]
+    created_at: float
+
+
+class ResponseCache:
+    """
+    An in-memory cache of serialized table responses, so that repeated requests for the same (unchanged) table
+    don't re-run the select and re-serialize the result.
+
+    Entries are keyed by table name plus anything else which changes the body (projection, filters, format). An
+    entry is only used if it was made from the same version of the table as the current one, or (for tables
+    with no version) if it is younger than `ttl` seconds. `invalidate` drops the entries for a table, which is
+    done after every write this service makes. Once the cached bodies add up to more than `max_bytes`, the
+    least recently used are dropped. Bodies bigger than `max_entry_bytes` are never cached.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_bytes=256 * 1024**2,
+        max_entry_bytes=32 * 1024**2,
+        ttl=60.0,
+        clock=time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # bumped by invalidate, so that a response computed from data read before an invalidation isn't cached
+        self._generation = 0
+        self._table_generations = {}
+        self._counts = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "invalidations": 0,
+            "evictions": 0,
+        }
+
+    def get(self, table_name, key, version) -> Optional[CachedResponse]:
+        full_key = (table_name.lower(), key)
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None and not self._is_current(entry, version):
+                self._counts["stale"] += 1
+                self._remove(full_key)
+                entry = None
+
+            if entry is None:
+                self._counts["misses"] += 1
+                return None
+
+            self._counts["hits"] += 1
+            self._entries.move_to_end(full_key)
+            return entry
+
+    def _is_current(self, entry, version):
+        if version is not None or entry.version is not None:
+            return entry.version == version
+        return self.clock() - entry.created_at < self.ttl
+
+    def generation(self, table_name):
+        "Returns a token to pass to `put`, which must be taken before the data for the response is read"
+        with self._lock:
+            return self._current_generation(table_name)
+
+    def _current_generation(self, table_name):
+        return self._generation, self._table_generations.get(table_name.lower(), 0)
+
+    def can_cache(self, table_name, size, generation) -> bool:
+        """
+        Whether `put` would still accept a response of `size` bytes made with `generation`, so a response which
+        is sent in pieces is only held on to while it could be cached
+        """
+        if size > self.max_entry_bytes:
+            return False
+        with self._lock:
+            return generation == self._current_generation(table_name)
+
+    def put(self, table_name, key, version, content: bytes, media_type, generation):
+        if len(content) > self.max_entry_bytes:
+            return
+        full_key = (table_name.lower(), key)
+        with self._lock:
+            if generation != self._current_generation(table_name):
+                # invalidated while the response was being made
+                return
+            if full_key in self._entries:
+                self._remove(full_key)
+            self._entries[full_key] = CachedResponse(
+                content=content,
+                media_type=media_type,
+                version=version,
+                created_at=self.clock(),
+            )
+            self._bytes += len(content)
+            while self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._counts["evictions"] += 1
+
+    def _remove(self, full_key):
+        entry = self._entries.pop(full_key)
+        self._bytes -= len(entry.content)
+
+    def invalidate(self, table_name=None):
+        "Drop the entries for the given table, or every entry if table_name is None"
+        with self._lock:
+            if table_name is None:
+                keys = list(self._entries)
+                self._generation += 1
+            else:
+                table_name = table_name.lower()
+                keys = [key for key in self._entries if key[0] == table_name]
+                self._table_generations[table_name] = (
+                    self._table_generations.get(table_name, 0) + 1
+                )
+            for key in keys:
+                self._remove(key)
+            self._counts["invalidations"] += 1
+
+    def stats(self):
+        "Returns a dict of hit/miss counters and the current size of the cache"
+        with self._lock:
+            result = dict(self._counts)
+            result.update(
+                {
+                    "entries": len(self._entries),
+                    "bytes": self._bytes,
+                    "max_bytes": self.max_bytes,
+                    "max_entry_bytes": self.max_entry_bytes,
+                }
+            )
+        return result
+
+
+class InvalidationListener:
+    """
+    Listens for Postgres notifications on `channel` in a background thread and invalidates the cached responses
+    for the table named in each notification's payload (or everything, if the payload is empty). This lets a
+    trigger on the tables tell every instance of the service about writes made by anyone.
+    """
+
+    def __init__(self, dsn, channel, cache: ResponseCache, *, poll_interval=5.0):
+        self.dsn = dsn
+        self.channel = channel
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="response-cache-invalidation", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except Exception:
+                # notifications may have been missed while the connection was down, so start from scratch
+                self.cache.invalidate()
+                self._stopped.wait(self.poll_interval)
+
+    def _listen(self):
+        connection = psycopg2.connect(self.dsn)
+        try:
+            connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+            cursor.close()
+            while not self._stopped.is_set():
+                readable, _, _ = select.select([connection], [], [], self.poll_interval)
+                if not readable:
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    self.cache.invalidate(notify.payload or None)
+        finally:
+            connection.close()
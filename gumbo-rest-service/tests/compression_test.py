@@ -0,0 +1,105 @@
+import gzip
+import json
+
+import pandas as pd
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from dataframe_json_packing import compression
+from gumbo_rest_service.compression import CompressionMiddleware
+
+BIG_BODY = json.dumps({"values": ["ACH-000001"] * 1000}, separators=(",", ":")).encode(
+    "utf8"
+)
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(
+        CompressionMiddleware, minimum_size=100, max_request_size=len(BIG_BODY)
+    )
+
+    @app.get("/big")
+    def big():
+        return json.loads(BIG_BODY)
+
+    @app.get("/small")
+    def small():
+        return {"a": 1}
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([BIG_BODY[:5000], BIG_BODY[5000:]]))
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        return {"length": len(await request.body()), "data": await request.json()}
+
+    return TestClient(app)
+
+
+def test_gzip_response(client):
+    response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < len(BIG_BODY) / 10
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.json() == json.loads(BIG_BODY)
+
+
+def test_zstd_response(client):
+    pytest.importorskip("zstandard")
+    response = client.get("/big", headers={"Accept-Encoding": "gzip, zstd"})
+    assert response.headers["content-encoding"] == "zstd"
+    # the test client can't decode zstd itself
+    assert compression.decompress(response.content, "zstd") == BIG_BODY
+
+
+def test_streamed_response_is_compressed(client):
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.content == BIG_BODY
+
+
+def test_small_or_unrequested_responses_are_not_compressed(client):
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    response = client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.content == BIG_BODY
+    assert "gzip" in response.headers["accept-encoding"]
+
+
+def test_compressed_request_body(client):
+    response = client.post(
+        "/echo", content=gzip.compress(BIG_BODY), headers={"Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "length": len(BIG_BODY),
+        "data": json.loads(BIG_BODY),
+    }
+
+    response = client.post(
+        "/echo", content=b"not gzip", headers={"Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 400
+
+    response = client.post(
+        "/echo", content=BIG_BODY, headers={"Content-Encoding": "br"}
+    )
+    assert response.status_code == 415
+    assert "gzip" in response.headers["accept-encoding"]
+
+
+@pytest.mark.parametrize("encoding", compression.supported_encodings())
+def test_oversized_request_body(client, encoding):
+    response = client.post(
+        "/echo",
+        content=compression.compress(BIG_BODY + b" ", encoding),
+        headers={"Content-Encoding": encoding},
+    )
+    assert response.status_code == 413
@@ -0,0 +1,92 @@
+from gumbo_rest_service.response_cache import ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _put(cache, table_name, key, version, content):
+    cache.put(
+        table_name,
+        key,
+        version,
+        content,
+        "application/json",
+        cache.generation(table_name),
+    )
+
+
+def test_versioned_entries_are_only_used_for_the_same_version():
+    cache = ResponseCache()
+    _put(cache, "sample", "k", "v1", b"body")
+    assert cache.get("sample", "k", "v1").content == b"body"
+    assert cache.get("SAMPLE", "k", "v1").content == b"body"
+    assert cache.get("sample", "k", "v2") is None
+    # the stale entry was dropped
+    assert cache.get("sample", "k", "v1") is None
+    assert cache.stats()["stale"] == 1
+
+
+def test_unversioned_entries_expire():
+    clock = FakeClock()
+    cache = ResponseCache(ttl=10, clock=clock)
+    _put(cache, "sample", "k", None, b"body")
+    clock.now = 9
+    assert cache.get("sample", "k", None) is not None
+    clock.now = 11
+    assert cache.get("sample", "k", None) is None
+
+
+def test_invalidate():
+    cache = ResponseCache()
+    _put(cache, "sample", "k1", None, b"1")
+    _put(cache, "sample", "k2", None, b"2")
+    _put(cache, "other", "k1", None, b"3")
+
+    cache.invalidate("Sample")
+    assert cache.get("sample", "k1", None) is None
+    assert cache.get("sample", "k2", None) is None
+    assert cache.get("other", "k1", None) is not None
+
+    cache.invalidate()
+    assert cache.get("other", "k1", None) is None
+
+
+def test_response_made_before_an_invalidation_is_not_cached():
+    cache = ResponseCache()
+    generation = cache.generation("sample")
+    cache.invalidate("sample")
+    cache.put("sample", "k", None, b"old", "application/json", generation)
+    assert cache.get("sample", "k", None) is None
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResponseCache(max_bytes=10)
+    _put(cache, "a", "k", None, b"xxxx")
+    _put(cache, "b", "k", None, b"xxxx")
+    cache.get("a", "k", None)
+    _put(cache, "c", "k", None, b"xxxx")
+
+    assert cache.get("a", "k", None) is not None
+    assert cache.get("b", "k", None) is None
+    assert cache.get("c", "k", None) is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 8
+
+
+def test_can_cache():
+    cache = ResponseCache(max_bytes=10, max_entry_bytes=6)
+    generation = cache.generation("sample")
+    assert cache.can_cache("sample", 6, generation)
+    assert not cache.can_cache("sample", 7, generation)
+    _put(cache, "sample", "k", None, b"x" * 7)
+    assert cache.get("sample", "k", None) is None
+
+    cache.invalidate("other")
+    assert cache.can_cache("sample", 1, generation)
+    cache.invalidate("sample")
+    assert not cache.can_cache("sample", 1, generation)
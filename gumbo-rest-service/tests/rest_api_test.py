@@ -4,6 +4,7 @@ from pytest import fixture
 from unittest.mock import create_autospec, MagicMock
 import pandas as pd
 import json
+import pytest
 
 
 @fixture
@@ -13,7 +14,16 @@ def mock_dao(monkeypatch):
         gumbo_rest_service.main, "_get_db_connection", lambda: mock_connection
     )
 
+    # start each test with an empty response cache
+    monkeypatch.setattr(
+        gumbo_rest_service.main,
+        "response_cache",
+        gumbo_rest_service.main.ResponseCache(),
+    )
+
     mock_dao = create_autospec(gumbo_rest_service.main.GumboDAO)
+    # by default behave as though the tables aren't audited, so responses have no etag
+    mock_dao.get_table_version.return_value = None
     monkeypatch.setattr(
         gumbo_rest_service.main, "_get_gumbo_dao", lambda connection: mock_dao
     )
@@ -27,7 +37,7 @@ def client(mock_dao):
 
 
 def test_get_table(mock_dao, client):
-    def _mock_get(tablename):
+    def _mock_get(tablename, columns=None, filters=None):
         if tablename == "sample":
             return pd.DataFrame({"PK": ["X", "Y"], "COL2": [1, 2]})
 
@@ -45,6 +55,514 @@ def test_get_table(mock_dao, client):
     }
 
 
+def test_get_table_etag(mock_dao, client):
+    versions = {"sample": "1.10/abc"}
+    mock_dao.get_table_version = lambda tablename: versions.get(tablename)
+    mock_dao.get = lambda tablename, columns=None, filters=None: pd.DataFrame(
+        {"PK": ["X"]}
+    )
+
+    response = client.get("/table/sample")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get("/table/sample", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    # a different projection of the same table has a different etag
+    response = client.get(
+        "/table/sample", params={"columns": ["PK"]}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    versions["sample"] = "2.11/abc"
+    response = client.get("/table/sample", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_get_table_with_columns_and_filters(mock_dao, client):
+    calls = []
+
+    def _mock_get(tablename, columns=None, filters=None):
+        calls.append((columns, filters))
+        if columns is not None and "missing" in columns:
+            raise ValueError("sample has no column 'missing'")
+        return pd.DataFrame({"PK": ["X"]})
+
+    mock_dao.get = _mock_get
+
+    response = client.get(
+        "/table/sample",
+        params={
+            "columns": ["PK", "COL2"],
+            "filters": json.dumps([["COL2", ">=", 1], ["PK", "in", ["X", "Y"]]]),
+        },
+    )
+    assert response.status_code == 200
+    assert calls[-1] == (["PK", "COL2"], [["COL2", ">=", 1], ["PK", "in", ["X", "Y"]]])
+
+    response = client.get("/table/sample", params={"columns": ["missing"]})
+    assert response.status_code == 400
+
+    response = client.get("/table/sample", params={"filters": '[["PK", "="]]'})
+    assert response.status_code == 400
+
+
+def test_get_table_as_arrow(mock_dao, client):
+    pytest.importorskip("pyarrow")
+    from dataframe_json_packing import unpack_arrow, ARROW_MEDIA_TYPE
+
+    df = pd.DataFrame({"PK": ["X", "Y"], "COL2": [1, 2]})
+    mock_dao.get = lambda tablename, columns=None, filters=None: df
+
+    response = client.get("/table/sample", headers={"Accept": ARROW_MEDIA_TYPE})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == ARROW_MEDIA_TYPE
+    assert unpack_arrow(response.content).equals(df.convert_dtypes())
+
+
+def test_get_table_as_chunks(mock_dao, client, monkeypatch):
+    from dataframe_json_packing import unpack_chunks, PACKED_CHUNKS_MEDIA_TYPE
+
+    released = []
+    monkeypatch.setattr(
+        gumbo_rest_service.main, "_release_db_connection", released.append
+    )
+    df = pd.DataFrame({"PK": ["X", "Y", "Z"], "COL2": [1, 2, 3]})
+
+    def _mock_iter_chunks(tablename, columns=None, filters=None):
+        if tablename != "sample":
+            return None
+
+        def chunks():
+            # the connection is still checked out while the rows are being read
+            assert released == []
+            yield df.iloc[:2]
+            yield df.iloc[2:]
+
+        return chunks()
+
+    mock_dao.iter_chunks = _mock_iter_chunks
+
+    response = client.get("/table/sample", headers={"Accept": PACKED_CHUNKS_MEDIA_TYPE})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == PACKED_CHUNKS_MEDIA_TYPE
+    assert len(response.content.splitlines()) == 2
+    assert unpack_chunks(response.content.splitlines()).equals(df.convert_dtypes())
+    assert len(released) == 1
+
+    # the complete response was cached, so the next request doesn't read the table
+    response = client.get("/table/sample", headers={"Accept": PACKED_CHUNKS_MEDIA_TYPE})
+    assert unpack_chunks(response.content.splitlines()).equals(df.convert_dtypes())
+    assert len(released) == 2
+
+    response = client.get(
+        "/table/missing", headers={"Accept": PACKED_CHUNKS_MEDIA_TYPE}
+    )
+    assert response.status_code == 404
+    assert len(released) == 3
+
+
+def test_get_table_as_chunks_query_fails(mock_dao, client, monkeypatch):
+    from dataframe_json_packing import PACKED_CHUNKS_MEDIA_TYPE
+
+    released = []
+    monkeypatch.setattr(
+        gumbo_rest_service.main, "_release_db_connection", released.append
+    )
+
+    def _mock_iter_chunks(tablename, columns=None, filters=None):
+        def chunks():
+            # the query only runs once the first chunk is asked for
+            raise ValueError("Invalid filter value")
+            yield
+
+        return chunks()
+
+    mock_dao.iter_chunks = _mock_iter_chunks
+
+    response = client.get("/table/sample", headers={"Accept": PACKED_CHUNKS_MEDIA_TYPE})
+    assert response.status_code == 400
+    assert len(released) == 1
+
+
+def test_get_table_as_chunks_client_disconnects(mock_dao, monkeypatch):
+    import anyio
+    from dataframe_json_packing import PACKED_CHUNKS_MEDIA_TYPE
+
+    released = []
+    monkeypatch.setattr(
+        gumbo_rest_service.main, "_release_db_connection", released.append
+    )
+    closed = []
+
+    def _mock_iter_chunks(tablename, columns=None, filters=None):
+        def chunks():
+            try:
+                yield pd.DataFrame({"PK": ["X"]})
+                yield pd.DataFrame({"PK": ["Y"]})
+            finally:
+                closed.append(True)
+
+        return chunks()
+
+    mock_dao.iter_chunks = _mock_iter_chunks
+
+    async def request_and_disconnect():
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/table/sample",
+            "raw_path": b"/table/sample",
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"accept", PACKED_CHUNKS_MEDIA_TYPE.encode())],
+            "client": ("test", 1),
+            "server": ("test", 80),
+        }
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            # the client goes away before any of the body is sent
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            pass
+
+        await gumbo_rest_service.main.app(scope, receive, send)
+
+    anyio.run(request_and_disconnect)
+    assert len(released) == 1
+    assert closed == [True]
+
+
+def test_get_table_page(mock_dao, client):
+    from gumbo_dao import TableMetadata
+
+    mock_dao.get_table_metadata = lambda tablename: TableMetadata(
+        table_name="sample",
+        is_view=False,
+        column_types={"PK": "text", "COL2": "integer"},
+        pk_columns=("PK",),
+    )
+    rows = pd.DataFrame({"PK": ["X", "Y/Z", "ZZ"], "COL2": [1, 2, 3]})
+
+    def _mock_get_page(tablename, after=None, limit=10000):
+        page = rows if after is None else rows[rows["PK"] > after]
+        return page.head(limit).reset_index(drop=True)
+
+    mock_dao.get_page = _mock_get_page
+
+    response = client.get("/table/sample/page", params={"limit": 2})
+    assert response.status_code == 200
+    assert response.json()["columns"][0]["values"] == ["X", "Y/Z"]
+    assert response.headers["X-Gumbo-Next-After"] == "Y%2FZ"
+    assert json.loads(response.headers["X-Gumbo-Column-Types"]) == {
+        "PK": "string",
+        "COL2": "int",
+    }
+
+    response = client.get("/table/sample/page", params={"limit": 2, "after": "Y/Z"})
+    assert response.status_code == 200
+    assert response.json()["columns"][0]["values"] == ["ZZ"]
+    assert "X-Gumbo-Next-After" not in response.headers
+
+    response = client.get("/table/sample/page", params={"limit": 0})
+    assert response.status_code == 422
+
+
+def test_packed_column_types_leave_out_arrays():
+    from gumbo_dao import TableMetadata
+
+    metadata = TableMetadata(
+        table_name="sample",
+        is_view=False,
+        column_types={
+            "PK": "character varying(10)",
+            "TAGS": "text[]",
+            "COUNTS": "integer[]",
+            "WHEN": "timestamp without time zone",
+        },
+        pk_columns=("PK",),
+    )
+    assert gumbo_rest_service.main._packed_column_types(metadata) == {
+        "PK": "string",
+        "WHEN": "datetime64",
+    }
+
+
+def test_get_table_changes(mock_dao, client):
+    from gumbo_dao import TableMetadata, TableChanges
+
+    mock_dao.get_table_metadata = lambda tablename: TableMetadata(
+        table_name="sample",
+        is_view=False,
+        column_types={"PK": "text", "COL2": "integer"},
+        pk_columns=("PK",),
+    )
+    mock_dao.get_changes = lambda tablename, since=None: TableChanges(
+        watermark=1234,
+        full_refresh=False,
+        upserted=pd.DataFrame({"PK": ["X"], "COL2": [5]}),
+        deleted=pd.DataFrame({"PK": ["Y"]}),
+    )
+
+    response = client.get("/table/sample/changes", params={"since": 1000})
+    assert response.status_code == 200
+    assert response.json() == {
+        "watermark": 1234,
+        "primary_key": "PK",
+        "full_refresh": False,
+        "upserted": {
+            "columns": [
+                {"name": "PK", "type": "string", "values": ["X"]},
+                {"name": "COL2", "type": "int", "values": [5]},
+            ]
+        },
+        "deleted": {"columns": [{"name": "PK", "type": "string", "values": ["Y"]}]},
+        "column_types": {"PK": "string", "COL2": "int"},
+    }
+
+
+def test_get_table_fingerprint(mock_dao, client):
+    from gumbo_dao import TableMetadata, TableFingerprint
+
+    mock_dao.get_table_metadata = lambda tablename: TableMetadata(
+        table_name="sample",
+        is_view=False,
+        column_types={"PK": "text", "COL2": "integer"},
+        pk_columns=("PK",),
+    )
+    mock_dao.get_fingerprint.return_value = TableFingerprint(
+        digest="abc", row_count=1, row_hashes=None
+    )
+
+    response = client.get("/table/sample/fingerprint")
+    assert response.status_code == 200
+    assert response.json() == {
+        "primary_key": "PK",
+        "digest": "abc",
+        "row_count": 1,
+        "row_hashes": None,
+    }
+    mock_dao.get_fingerprint.assert_called_with(
+        "sample", columns=None, row_hashes=False
+    )
+
+    mock_dao.get_fingerprint.return_value = TableFingerprint(
+        digest="abc",
+        row_count=1,
+        row_hashes=pd.DataFrame({"PK": ["X"], "row_hash": ["def"]}),
+    )
+    response = client.get(
+        "/table/sample/fingerprint", params={"row_hashes": "true", "columns": "COL2"}
+    )
+    assert response.json()["row_hashes"] == {
+        "columns": [
+            {"name": "PK", "type": "string", "values": ["X"]},
+            {"name": "row_hash", "type": "string", "values": ["def"]},
+        ]
+    }
+    mock_dao.get_fingerprint.assert_called_with(
+        "sample", columns=["COL2"], row_hashes=True
+    )
+
+
+def test_get_table_response_cache(mock_dao, client):
+    gets = []
+
+    def _mock_get(tablename, columns=None, filters=None):
+        gets.append(tablename)
+        return pd.DataFrame({"PK": ["X"], "COL2": [len(gets)]})
+
+    mock_dao.get = _mock_get
+
+    first = client.get("/table/sample")
+    second = client.get("/table/sample")
+    assert len(gets) == 1
+    assert second.json() == first.json()
+    assert second.headers["content-type"] == first.headers["content-type"]
+
+    # writing to the table drops the cached response
+    response = client.patch(
+        "/table/sample",
+        json={"mode": "update_only", "username": "test", "data": first.json()},
+    )
+    assert response.status_code == 200
+    third = client.get("/table/sample")
+    assert len(gets) == 2
+    assert third.json()["columns"][1]["values"] == [2]
+
+    stats = client.get("/response-cache-stats").json()["response_cache"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["entries"] == 1
+
+
+def test_get_table_too_big_to_cache(mock_dao, client, monkeypatch):
+    monkeypatch.setattr(
+        gumbo_rest_service.main,
+        "response_cache",
+        gumbo_rest_service.main.ResponseCache(max_entry_bytes=10),
+    )
+    gets = []
+
+    def _mock_get(tablename, columns=None, filters=None):
+        gets.append(tablename)
+        return pd.DataFrame({"PK": ["X"], "COL2": [1]})
+
+    mock_dao.get = _mock_get
+
+    assert client.get("/table/sample").status_code == 200
+    assert client.get("/table/sample").status_code == 200
+    assert len(gets) == 2
+    assert gumbo_rest_service.main.response_cache.stats()["entries"] == 0
+
+
+def test_update_table_sync(mock_dao, client):
+    data = {"columns": [{"name": "PK", "type": "string", "values": ["X"]}]}
+    response = client.patch(
+        "/table/sample",
+        json={
+            "mode": "sync",
+            "username": "test",
+            "data": data,
+            "delete_missing_rows": True,
+        },
+    )
+    assert response.status_code == 200
+    (username, table_name, df), kwargs = mock_dao.update.call_args
+    assert (username, table_name, list(df["PK"])) == ("test", "sample", ["X"])
+    assert kwargs == {"delete_missing_rows": True, "reason": None, "server_side": True}
+
+
+def test_upload(mock_dao, client):
+    from gumbo_dao import TableMetadata, UploadStatus
+
+    mock_dao.get_table_metadata = lambda tablename: TableMetadata(
+        table_name="sample",
+        is_view=False,
+        column_types={"PK": "text", "COL2": "integer"},
+        pk_columns=("PK",),
+    )
+    upload = UploadStatus(
+        upload_id="u1",
+        table_name="sample",
+        mode="insert_only",
+        username="test",
+        reason=None,
+        status="open",
+        chunk_ids=[],
+        rows_inserted=None,
+        rows_updated=None,
+    )
+    chunks = {}
+    mock_dao.create_upload.return_value = "u1"
+    mock_dao.get_upload = lambda upload_id: upload._replace(chunk_ids=sorted(chunks))
+    mock_dao.put_upload_chunk = lambda upload_id, chunk_id, data: chunks.update(
+        {chunk_id: data}
+    )
+
+    def _mock_commit_upload(upload_id, chunk_count, decode_chunk):
+        rows = sum(len(decode_chunk(chunks[i])) for i in range(chunk_count))
+        return upload._replace(status="committed", rows_inserted=rows)
+
+    mock_dao.commit_upload = _mock_commit_upload
+
+    response = client.post(
+        "/table/sample/upload", json={"mode": "insert_only", "username": "test"}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"upload_id": "u1"}
+    mock_dao.create_upload.assert_called_once_with(
+        "test", "sample", "insert_only", reason=None
+    )
+
+    chunk = {"columns": [{"name": "PK", "type": "string", "values": ["X", "Y"]}]}
+    assert client.put("/upload/u1/chunk/1", json=chunk).status_code == 200
+    assert client.put("/upload/u1/chunk/-1", json=chunk).status_code == 422
+    assert client.put("/upload/u1/chunk/0", content=b"[1, 2").status_code == 400
+
+    response = client.post("/upload/u1/commit", json={"chunk_count": 2})
+    assert response.status_code == 409
+    assert response.json()["detail"] == {"missing_chunk_ids": [0]}
+
+    # resending a chunk is fine
+    assert client.put("/upload/u1/chunk/0", json=chunk).status_code == 200
+    assert client.put("/upload/u1/chunk/0", json=chunk).status_code == 200
+    assert client.get("/upload/u1").json()["chunk_ids"] == [0, 1]
+
+    response = client.post("/upload/u1/commit", json={"chunk_count": 2})
+    assert response.status_code == 200
+    assert response.json()["status"] == "committed"
+    assert response.json()["rows_inserted"] == 4
+
+
+def test_upload_without_upload_tables(mock_dao, client):
+    import psycopg2.errors
+    from gumbo_dao import TableMetadata
+
+    mock_dao.get_table_metadata = lambda tablename: TableMetadata(
+        table_name="sample",
+        is_view=False,
+        column_types={"PK": "text"},
+        pk_columns=("PK",),
+    )
+    mock_dao.create_upload.side_effect = psycopg2.errors.UndefinedTable()
+
+    response = client.post(
+        "/table/sample/upload", json={"mode": "insert_only", "username": "test"}
+    )
+    assert response.status_code == 501
+
+
+def test_slow_requests_do_not_block_each_other(mock_dao):
+    import anyio
+    import httpx
+    import time
+
+    def _mock_get(tablename, columns=None, filters=None):
+        # stands in for a slow query, which holds up its worker thread but not the event loop
+        time.sleep(0.5)
+        return pd.DataFrame({"PK": [tablename]})
+
+    mock_dao.get = _mock_get
+
+    async def fetch_concurrently():
+        transport = httpx.ASGITransport(app=gumbo_rest_service.main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            responses = []
+
+            async def fetch(table_name):
+                responses.append(await client.get(f"/table/{table_name}"))
+
+            async with anyio.create_task_group() as tg:
+                for table_name in ["a", "b", "c", "d"]:
+                    tg.start_soon(fetch, table_name)
+            return responses
+
+    start = time.perf_counter()
+    responses = anyio.run(fetch_concurrently)
+    assert [response.status_code for response in responses] == [200] * 4
+    assert time.perf_counter() - start < 1.5
+
+
+def test_pool_stats_before_pool_is_created(client):
+    response = client.get("/pool-stats")
+    assert response.status_code == 200
+    assert response.json() == {"pool": None}
+
+
 # def test_status_summaries(mock_dao, client):
 #     def _mock_get_model_condition_status_summaries(peddep_only=False):
 #         raise Exception("Not implemented...")
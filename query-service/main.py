@@ -1,17 +1,21 @@
 from os import environ
 from typing import Union, Optional
+from contextlib import contextmanager
+import csv
 import io
+import itertools
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException
 
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
-import psycopg2
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 import os
+import threading
+import time
 import logging
 from enum import Enum
-import pandas as pd
-from typing import Any
 from dotenv import load_dotenv
 
 load_dotenv()  # take environment variables
@@ -21,10 +25,118 @@ log = logging.getLogger(__name__)
 app = FastAPI()
 
 
-def get_gumbo_connection():
-    connection_str = os.environ.get("GUMBO_DB_URL")
-    connection = psycopg2.connect(connection_str)
-    return connection
+class WaitingConnectionPool(ThreadedConnectionPool):
+    """
+    A ThreadedConnectionPool whose getconn waits up to checkout_timeout seconds for a connection to be returned
+    when all maxconn connections are in use, instead of raising PoolError straight away
+    """
+
+    def __init__(self, minconn, maxconn, *args, checkout_timeout=30.0, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.checkout_timeout = checkout_timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolError(
+                f"Timed out after {self.checkout_timeout} seconds waiting for a database connection"
+            )
+        try:
+            return super().getconn(key)
+        except:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
+_connection_pool = None
+_connection_pool_lock = threading.Lock()
+
+
+def get_connection_pool():
+    # one pool per worker process, created on first use
+    global _connection_pool
+    with _connection_pool_lock:
+        if _connection_pool is None:
+            _connection_pool = WaitingConnectionPool(
+                int(os.environ.get("GUMBO_DB_POOL_MIN_SIZE", "1")),
+                int(os.environ.get("GUMBO_DB_POOL_MAX_SIZE", "5")),
+                os.environ.get("GUMBO_DB_URL"),
+                checkout_timeout=float(
+                    os.environ.get("GUMBO_DB_POOL_CHECKOUT_TIMEOUT", "30")
+                ),
+            )
+        return _connection_pool
+
+
+@contextmanager
+def gumbo_connection():
+    pool = get_connection_pool()
+    try:
+        # waits for a connection to be returned if they're all in use
+        connection = pool.getconn()
+    except PoolError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    try:
+        yield connection
+    finally:
+        # rolls back the transaction the query ran in before the connection is reused
+        pool.putconn(connection)
+
+
+# how long (in seconds) the key and sql of an external query are cached before being re-read from the database
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", "60"))
+
+# query name -> (time fetched, key, sql)
+_query_cache = {}
+_query_cache_lock = threading.Lock()
+
+
+def lookup_query(name):
+    "returns (key, sql) for the named external query, or None if there is no such query"
+    with _query_cache_lock:
+        entry = _query_cache.get(name)
+    if entry is not None and time.monotonic() - entry[0] < QUERY_CACHE_TTL:
+        return entry[1], entry[2]
+
+    query = _fetch_query(name)
+    if query is not None:
+        with _query_cache_lock:
+            _query_cache[name] = (time.monotonic(),) + query
+    return query
+
+
+def _fetch_query(name):
+    "reads (key, sql) for the named external query from the database, bypassing the cache"
+    with gumbo_connection() as connection:
+        cur = connection.cursor()
+        try:
+            cur.execute(
+                "select key, query from gumbo_external_query geq where id = %s",
+                [name],
+            )
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+    if len(rows) == 0:
+        return None
+    assert len(rows) == 1
+    expected_key, sql = rows[0]
+    return expected_key, sql
+
+
+def invalidate_query_cache(name=None):
+    "forget the cached key and sql of the named query, or of all queries if name is None"
+    with _query_cache_lock:
+        if name is None:
+            _query_cache.clear()
+        else:
+            _query_cache.pop(name, None)
 
 
 @app.get("/")
@@ -32,30 +144,103 @@ def read_root():
     return {"name": "query-service"}
 
 
+@app.post("/query-cache/invalidate")
+def invalidate_cache(name: str, key: str = None):
+    # checked against the key in the database rather than the cached one, since the key may be what was edited
+    query = _fetch_query(name)
+    if query is None:
+        raise HTTPException(status_code=404, detail="Unknown query")
+    expected_key, _ = query
+
+    if key != expected_key:
+        raise HTTPException(status_code=403, detail="Invalid key")
+
+    invalidate_query_cache(name)
+    return {"invalidated": name}
+
+
+# the number of rows fetched from the server-side cursor and written as CSV at a time
+STREAM_BATCH_ROWS = int(os.environ.get("QUERY_STREAM_BATCH_ROWS", "5000"))
+
+
+def stream_query_as_csv(sql):
+    """
+    Generates the result of the query as CSV, a batch of rows at a time. The rows are read through a server-side
+    cursor so neither the full result nor the full CSV is ever held in memory. The connection is checked out when
+    the first chunk is requested and returned when the generator finishes or is closed (see _QueryStream).
+    """
+    with gumbo_connection() as connection:
+        cur = connection.cursor(name="query_service_stream")
+        try:
+            cur.itersize = STREAM_BATCH_ROWS
+            cur.execute(sql)
+            rows = cur.fetchmany(STREAM_BATCH_ROWS)
+
+            stream = io.StringIO()
+            writer = csv.writer(stream)
+            writer.writerow([column.name for column in cur.description])
+            while True:
+                writer.writerows(rows)
+                yield stream.getvalue()
+                stream.seek(0)
+                stream.truncate()
+
+                if len(rows) < STREAM_BATCH_ROWS:
+                    break
+                rows = cur.fetchmany(STREAM_BATCH_ROWS)
+        finally:
+            cur.close()
+
+
+class _QueryStream:
+    """
+    The body of a CSV download. `close` abandons the query and returns its connection to the pool (once). It's run
+    when the body runs out or fails, and as the response's background task, which also runs if the client goes away
+    before the body is sent, rather than leaving the connection checked out until the generator is garbage collected.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self.chunks.close()
+
+
 @app.get("/query/{name}")
-def run_query(
-    name: str, key: str = None, connection: Any = Depends(get_gumbo_connection)
-):
-    cur = connection.cursor()
-    try:
-        cur.execute(
-            "select key, query from gumbo_external_query geq where id = %s", [name]
-        )
-        rows = cur.fetchall()
-        if len(rows) == 0:
-            raise HTTPException(status_code=404, detail="Unknown query")
-        assert len(rows) == 1
-        expected_key, sql = rows[0]
-    finally:
-        cur.close()
+def run_query(name: str, key: str = None):
+    query = lookup_query(name)
+    if query is None:
+        raise HTTPException(status_code=404, detail="Unknown query")
+    expected_key, sql = query
 
     if key != expected_key:
         raise HTTPException(status_code=403, detail="Invalid key")
 
-    table = pd.read_sql(sql, connection)
+    # run the query and produce the first chunk before responding, so that a failing query results in an error
+    # status instead of a truncated response
+    stream = _QueryStream(stream_query_as_csv(sql))
+    first_chunk = next(stream)
 
-    stream = io.StringIO()
-    table.to_csv(stream, index=False)
-    response = StreamingResponse(iter([stream.getvalue()]), media_type="text/csv")
+    response = StreamingResponse(
+        itertools.chain([first_chunk], stream),
+        media_type="text/csv",
+        background=BackgroundTask(stream.close),
+    )
     response.headers["Content-Disposition"] = f"attachment; filename={name}.csv"
     return response